@@ -76,8 +76,12 @@ class CustomDatasetDataLoader:
         self.dataset = dataset_class(opt)
         print("dataset [%s] was created" % type(self.dataset).__name__)
 
+        # Sharded test: every process takes every num_shards-th image, starting at shard_id
+        if getattr(opt, "num_shards", 1) > 1:
+            self.sampler = list(range(opt.shard_id, min(len(self.dataset), opt.max_dataset_size), opt.num_shards))
+            shuffle = False
         # Use DistributedSampler for DDP training
-        if "LOCAL_RANK" in os.environ:
+        elif "LOCAL_RANK" in os.environ:
             print(f'create DDP sampler on rank {int(os.environ["LOCAL_RANK"])}')
             self.sampler = DistributedSampler(self.dataset, shuffle=not opt.serial_batches)
             shuffle = False  # DistributedSampler handles shuffling
@@ -85,13 +89,40 @@ class CustomDatasetDataLoader:
             self.sampler = None
             shuffle = not opt.serial_batches
 
-        self.dataloader = torch.utils.data.DataLoader(self.dataset, batch_size=opt.batch_size, shuffle=shuffle, sampler=self.sampler, num_workers=int(opt.num_threads))
+        self.shuffle = shuffle
+        self.prefetch_factor = None  # the DataLoader default
+        self.dataloader = self.make_dataloader()
+
+    def make_dataloader(self):
+        """Return a DataLoader of the dataset with the current sampler and workers"""
+        prefetch = {"prefetch_factor": self.prefetch_factor} if self.prefetch_factor and self.opt.num_threads > 0 else {}
+        return torch.utils.data.DataLoader(self.dataset, batch_size=self.opt.batch_size, shuffle=self.shuffle, sampler=self.sampler, num_workers=int(self.opt.num_threads), **prefetch)
 
     def load_data(self):
         return self
 
+    def indices(self):
+        """Return the dataset indices loaded by this loader, in order; only for unshuffled loaders"""
+        if isinstance(self.sampler, list):
+            return list(self.sampler)
+        return list(range(len(self)))
+
+    def select(self, indices):
+        """Only load the given dataset indices, in order; test.py uses it to skip cached results"""
+        self.sampler = list(indices)
+        self.shuffle = False
+        self.dataloader = self.make_dataloader()
+
+    def set_workers(self, num_workers, prefetch_factor=None):
+        """Use <num_workers> loading processes, each loading <prefetch_factor> batches ahead, from the next epoch on"""
+        self.opt.num_threads = num_workers
+        self.prefetch_factor = prefetch_factor
+        self.dataloader = self.make_dataloader()
+
     def __len__(self):
         """Return the number of data in the dataset"""
+        if isinstance(self.sampler, list):
+            return len(self.sampler)
         return min(len(self.dataset), self.opt.max_dataset_size)
 
     def __iter__(self):
@@ -103,5 +134,5 @@ class CustomDatasetDataLoader:
 
     def set_epoch(self, epoch):
         """Set epoch for DistributedSampler to ensure proper shuffling"""
-        if self.sampler is not None:
+        if isinstance(self.sampler, DistributedSampler):
             self.sampler.set_epoch(epoch)
@@ -55,6 +55,10 @@ class AlignedDataset(BaseDataset):
 
         return {"A": A, "B": B, "A_paths": AB_path, "B_paths": AB_path}
 
+    def get_input_paths(self, index):
+        """Return the files data point <index> is loaded from."""
+        return [self.AB_paths[index]]
+
     def __len__(self):
         """Return the total number of images in the dataset."""
         return len(self.AB_paths)
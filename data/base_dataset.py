@@ -60,6 +60,14 @@ class BaseDataset(data.Dataset, ABC):
         """
         pass
 
+    def get_input_paths(self, index):
+        """Return the files data point <index> is loaded from; the first one names the results.
+
+        test.py uses it to skip data points whose results are cached (see util/inference_cache.py).
+        Return None if the data point is not a deterministic function of its files.
+        """
+        return None
+
 
 def get_params(opt, size):
     w, h = size
@@ -64,6 +64,10 @@ class ColorizationDataset(BaseDataset):
         B = lab_t[[1, 2], ...] / 110.0
         return {"A": A, "B": B, "A_paths": path, "B_paths": path}
 
+    def get_input_paths(self, index):
+        """Return the files data point <index> is loaded from."""
+        return [self.AB_paths[index]]
+
     def __len__(self):
         """Return the total number of images in the dataset."""
         return len(self.AB_paths)
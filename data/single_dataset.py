@@ -35,6 +35,10 @@ class SingleDataset(BaseDataset):
         A = self.transform(A_img)
         return {"A": A, "A_paths": A_path}
 
+    def get_input_paths(self, index):
+        """Return the files data point <index> is loaded from."""
+        return [self.A_paths[index]]
+
     def __len__(self):
         """Return the total number of images in the dataset."""
         return len(self.A_paths)
@@ -0,0 +1,91 @@
+"""This module implements a dataset of images generated in memory, to measure the speed of a model without the data loader.
+
+It can be used with all the models in place of their dataset ('--dataset_mode synthetic'). '--dataroot' is not read.
+The images are generated once ('--synthetic_pool_size' data points, at '--crop_size') and then returned from memory,
+so loading a batch only costs the collation: there is no disk access, decoding or preprocessing.
+    -- For most models, A and B are images in [-1, 1] with the channels of the model (--input_nc, --output_nc),
+       like the unaligned and aligned datasets.
+    -- For '--model colorization', A is the L channel and B the ab channels of a color image, normalized like the
+       colorization dataset; use it with '--input_nc 1 --output_nc 2'.
+'--synthetic_pattern smooth' interpolates random colors from a coarse grid, which are closer to natural images than
+'--synthetic_pattern noise' (uniform noise).
+
+Example:
+    python train.py --dataroot unused --name synthetic_cyclegan --model cycle_gan --dataset_mode synthetic --profile
+"""
+
+import torch
+import torch.nn.functional as F
+from data.base_dataset import BaseDataset
+
+
+class SyntheticDataset(BaseDataset):
+    """This dataset class returns images generated in memory, without any file."""
+
+    @staticmethod
+    def modify_commandline_options(parser, is_train):
+        """Add new dataset-specific options, and rewrite default values for existing options.
+
+        Parameters:
+            parser          -- original option parser
+            is_train (bool) -- whether training phase or test phase. You can use this flag to add training-specific or test-specific options.
+
+        Returns:
+            the modified parser.
+        """
+        parser.add_argument("--synthetic_size", type=int, default=1000, help="# of data points in an epoch")
+        parser.add_argument("--synthetic_pool_size", type=int, default=16, help="# of distinct data points, generated once and kept in memory")
+        parser.add_argument("--synthetic_pattern", type=str, default="smooth", help="how the images are generated [smooth | noise]")
+        return parser
+
+    def __init__(self, opt):
+        """Initialize this dataset class.
+
+        Parameters:
+            opt (Option class) -- stores all the experiment flags; needs to be a subclass of BaseOptions
+        """
+        BaseDataset.__init__(self, opt)
+        self.lab = opt.model == "colorization"
+        if self.lab:
+            assert opt.input_nc == 1 and opt.output_nc == 2 and opt.direction == "AtoB", "synthetic colorization data needs --input_nc 1 --output_nc 2 --direction AtoB"
+        if opt.synthetic_pattern not in ("smooth", "noise"):
+            raise NotImplementedError(f"synthetic pattern [{opt.synthetic_pattern}] is not recognized")
+        generator = torch.Generator().manual_seed(0)
+        self.pool = [self.generate(generator) for i in range(opt.synthetic_pool_size)]
+
+    def image(self, channels, generator):
+        """Return a random image in [-1, 1] of <channels> x crop_size x crop_size."""
+        size = self.opt.crop_size
+        if self.opt.synthetic_pattern == "noise":
+            return torch.rand(channels, size, size, generator=generator) * 2 - 1
+        coarse = torch.rand(1, channels, 8, 8, generator=generator) * 2 - 1
+        return F.interpolate(coarse, size=(size, size), mode="bicubic", align_corners=False)[0].clamp(-1, 1)
+
+    def generate(self, generator):
+        """Return the A and B images of a data point."""
+        if self.lab:  # the lightness and the opponent colors of an RGB image, in the ranges of L / 50 - 1 and ab / 110
+            r, g, b = (self.image(3, generator) + 1) / 2
+            L = 0.299 * r + 0.587 * g + 0.114 * b
+            return L[None] * 2 - 1, torch.stack([r - g, (r + g) / 2 - b]) * 0.5
+        nc_A, nc_B = (self.opt.input_nc, self.opt.output_nc) if self.opt.direction == "AtoB" else (self.opt.output_nc, self.opt.input_nc)
+        return self.image(nc_A, generator), self.image(nc_B, generator)
+
+    def __getitem__(self, index):
+        """Return a data point and its metadata information.
+
+        Parameters:
+            index - - a random integer for data indexing
+
+        Returns a dictionary that contains A, B, A_paths and B_paths
+            A (tensor)    - - an image in the input domain (the L channel for colorization)
+            B (tensor)    - - an image in the target domain (the ab channels for colorization)
+            A_paths (str) - - a name for the data point; there is no file
+            B_paths (str) - - the same name
+        """
+        A, B = self.pool[index % len(self.pool)]
+        name = f"synthetic_{index:06d}"
+        return {"A": A, "B": B, "A_paths": name, "B_paths": name}
+
+    def __len__(self):
+        """Return the number of data points in an epoch."""
+        return self.opt.synthetic_size
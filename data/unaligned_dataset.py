@@ -62,6 +62,13 @@ class UnalignedDataset(BaseDataset):
 
         return {"A": A, "B": B, "A_paths": A_path, "B_paths": B_path}
 
+    def get_input_paths(self, index):
+        """Return the files data point <index> is loaded from; None if domain B images are picked randomly."""
+        if not self.opt.serial_batches:
+            return None
+        paths = [self.A_paths[index % self.A_size], self.B_paths[index % self.B_size]]
+        return paths[::-1] if self.opt.direction == "BtoA" else paths
+
     def __len__(self):
         """Return the total number of images in the dataset.
 
@@ -0,0 +1,106 @@
+"""This module implements 'train.py --auto_workers': the tuning of the data loading workers from the measured data-wait time.
+
+The tuner measures, for '--auto_workers_window' iterations of every configuration, the time train.py waits for the
+data loader and the time of the rest of the iteration (compute). The first iterations of every epoch are skipped,
+since they include the start of the workers. Then:
+    -- if the data wait is more than 5% of the compute (loader-bound), the number of workers is doubled, up to
+       '--auto_workers_max'; at the maximum, the prefetch depth of every worker is doubled instead, up to 8 batches;
+    -- on the CPU, if the data wait is below 1% of the compute (compute-bound), the number of workers is halved, and the
+       cores they free are given to the intra-op threads of torch.
+On the CPU, the intra-op threads are always the cores that the workers do not use. A configuration is applied at the
+start of the next epoch. The tuning stops with the fastest configuration (time per iteration) when the next one was
+already measured, is slower, or when there is nothing left to change. Every decision is logged to loss_log.txt.
+"""
+
+import os
+import torch
+
+
+SKIP_ITERS = 5  # iterations at the start of every epoch, while the workers start
+LOADER_BOUND = 0.05  # data wait / compute above which more workers are tried
+COMPUTE_BOUND = 0.01  # data wait / compute below which fewer workers are tried on the CPU
+MAX_PREFETCH = 8
+
+
+def num_cores():
+    """Return the number of CPU cores this process may run on."""
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+
+class WorkerTuner:
+    """This class adapts the number of workers and the prefetch depth of a data loader to the measured data-wait time."""
+
+    def __init__(self, opt, dataset, log=print):
+        """Initialize the WorkerTuner class
+
+        Parameters:
+            opt         -- training options; uses auto_workers, auto_workers_window, auto_workers_max and num_threads
+            dataset     -- the CustomDatasetDataLoader of create_dataset
+            log         -- the function that logs the decisions, e.g. Visualizer.log_message
+        """
+        self.enabled = opt.auto_workers
+        self.dataset = dataset
+        self.log = log
+        self.window = opt.auto_workers_window
+        self.cores = num_cores()
+        self.max_workers = opt.auto_workers_max or self.cores
+        self.on_cpu = torch.device(opt.device).type == "cpu"
+        self.config = (opt.num_threads, 2)  # (workers, prefetch depth)
+        self.results = {}  # configuration -> time per iteration (s)
+        self.data_time = self.compute_time = 0.0
+        self.num_iters = self.epoch_iters = 0
+        if self.enabled:
+            self.apply(self.config)
+
+    def observe(self, t_data, t_comp):
+        """Add the data-wait and compute time (s) of an iteration."""
+        if not self.enabled:
+            return
+        self.epoch_iters += 1
+        if self.epoch_iters > SKIP_ITERS:
+            self.data_time += t_data
+            self.compute_time += t_comp
+            self.num_iters += 1
+
+    def end_epoch(self):
+        """Choose the configuration of the next epoch once the current one was measured for a whole window."""
+        self.epoch_iters = 0
+        if not self.enabled or self.num_iters < self.window:
+            return
+        workers, prefetch = self.config
+        ratio = self.data_time / max(self.compute_time, 1e-9)
+        iter_time = (self.data_time + self.compute_time) / self.num_iters
+        self.results[self.config] = iter_time
+        self.data_time = self.compute_time = 0.0
+        self.num_iters = 0
+        message = f"loader tuning: {self.describe(self.config)}: {iter_time:.3f} s per iteration, data wait {ratio:.1%} of compute"
+        best = min(self.results, key=self.results.get)
+        candidate = None
+        if ratio > LOADER_BOUND:
+            if workers < self.max_workers:
+                candidate = (min(max(2 * workers, 1), self.max_workers), prefetch)
+            elif workers > 0 and prefetch < MAX_PREFETCH:
+                candidate = (workers, 2 * prefetch)
+        elif ratio < COMPUTE_BOUND and self.on_cpu and workers > 0:
+            candidate = (workers // 2, prefetch)
+        if candidate is None or candidate in self.results or best != self.config:
+            self.enabled = False
+            self.apply(best)
+            self.log(f"{message}; done, using {self.describe(best)}")
+        else:
+            self.apply(candidate)
+            self.log(f"{message}; trying {self.describe(candidate)} from the next epoch")
+
+    def apply(self, config):
+        self.config = config
+        workers, prefetch = config
+        self.dataset.set_workers(workers, prefetch)
+        if self.on_cpu:  # the workers and the intra-op threads share the cores
+            torch.set_num_threads(max(self.cores - workers, 1))
+
+    def describe(self, config):
+        workers, prefetch = config
+        message = f"{workers} workers, prefetch {prefetch}"
+        if self.on_cpu:
+            message += f", {max(self.cores - workers, 1)} intra-op threads"
+        return message
@@ -0,0 +1,151 @@
+"""This module estimates the compute and memory costs of a network for a given input size, layer by layer.
+
+<analyze_network> runs one forward pass (without gradients) with forward hooks on every leaf module, so it covers any
+network of define_G / define_D, including the nested ResnetBlock, ReversibleResnetBlock and UnetSkipConnectionBlock
+trees. For every layer call, it records:
+    -- MACs (multiply-accumulates): output elements x (input channels / groups) x kernel size for convolutions,
+       input elements x (output channels / groups) x kernel size for transposed convolutions, one per element for
+       the affine part of norm layers, 0 for the other layers (padding, activations, dropout);
+    -- activation bytes: the size of its output;
+    -- memory traffic: the bytes read and written (input, output and weights), assuming nothing stays in the caches.
+The operations that are not modules (the residual additions and the skip concatenations) are not counted.
+With a peak compute rate and memory bandwidth, <format_analysis> also gives the roofline estimate of every layer:
+the larger of its compute time and its memory time, and which one bounds it.
+
+Example:
+    python scripts/analyze_networks.py --netG resnet_9blocks,unet_256 --crop_sizes 256,512
+"""
+
+from collections import OrderedDict
+import torch
+import torch.nn as nn
+from . import networks
+
+
+BLOCKS = (networks.ResnetBlock, networks.ReversibleResnetBlock, networks.UnetSkipConnectionBlock)
+NORM_LAYERS = (nn.BatchNorm2d, nn.InstanceNorm2d)
+MB = 1024**2
+
+
+def _layer_macs(module, input, output):
+    if isinstance(module, nn.Conv2d):
+        return output.numel() * (module.in_channels // module.groups) * module.kernel_size[0] * module.kernel_size[1]
+    if isinstance(module, nn.ConvTranspose2d):
+        return input.numel() * (module.out_channels // module.groups) * module.kernel_size[0] * module.kernel_size[1]
+    if isinstance(module, nn.Linear):
+        return output.numel() * module.in_features
+    if isinstance(module, NORM_LAYERS) and module.affine:
+        return output.numel()
+    return 0
+
+
+def _nbytes(tensor):
+    return tensor.numel() * tensor.element_size()
+
+
+def analyze_network(net, input_shape):
+    """Return the costs of every layer call of a forward pass on an input of <input_shape>, in execution order.
+
+    Parameters:
+        net (nn.Module)     -- a network, e.g. from define_G / define_D
+        input_shape (tuple) -- (batch, channels, height, width)
+
+    Every row is a dict with the layer name and type, its enclosing block, the output shape, and its params,
+    macs, activation_bytes and traffic_bytes.
+    """
+    net = net.module if hasattr(net, "module") else net
+    blocks = {}  # leaf module -> name of its innermost enclosing block
+    for name, module in net.named_modules():
+        if isinstance(module, BLOCKS):
+            for child in module.modules():
+                blocks[child] = name
+    rows, handles = [], []
+
+    def hook(module, inputs, output, name):
+        input = inputs[0]
+        weight_bytes = sum(_nbytes(p) for p in module.parameters(recurse=False))
+        rows.append(
+            {
+                "name": name,
+                "type": type(module).__name__,
+                "block": blocks.get(module, ""),
+                "shape": tuple(output.shape),
+                "params": sum(p.numel() for p in module.parameters(recurse=False)),
+                "macs": _layer_macs(module, input, output),
+                "activation_bytes": _nbytes(output),
+                "traffic_bytes": _nbytes(input) + _nbytes(output) + weight_bytes,
+            }
+        )
+
+    for name, module in net.named_modules():
+        if not list(module.children()):
+            handles.append(module.register_forward_hook(lambda m, i, o, name=name: hook(m, i, o, name)))
+    training = net.training
+    parameter = next(net.parameters())
+    net.eval()  # batchnorm must not update its running statistics
+    try:
+        with torch.no_grad():
+            net(torch.zeros(input_shape, device=parameter.device, dtype=parameter.dtype))
+    finally:
+        net.train(training)
+        for handle in handles:
+            handle.remove()
+    return rows
+
+
+def input_channels(net):
+    """Return the number of channels of the input of a network (those of its first convolution)."""
+    return next(m for m in net.modules() if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d))).in_channels
+
+
+def summarize_analysis(rows):
+    """Return the totals of the rows of <analyze_network>."""
+    return {key: sum(row[key] for row in rows) for key in ("params", "macs", "activation_bytes", "traffic_bytes")}
+
+
+def summary_line(name, rows, input_shape):
+    """Return a one-line summary of the costs of a network."""
+    totals = summarize_analysis(rows)
+    return f"[Network {name}] {'x'.join(str(s) for s in input_shape)} input: {totals['macs'] / 1e9:.2f} GMACs, activations {totals['activation_bytes'] / MB:.1f} MB, memory traffic {totals['traffic_bytes'] / MB:.1f} MB"
+
+
+def _roofline(row, gflops, bandwidth):
+    compute = 2 * row["macs"] / (gflops * 1e9)
+    memory = row["traffic_bytes"] / (bandwidth * 1e9)
+    return max(compute, memory) * 1000, "compute" if compute >= memory else "memory"
+
+
+def format_analysis(rows, gflops=0, bandwidth=0):
+    """Return the per-layer table, the totals per layer type and per block, and the totals of a network.
+
+    Parameters:
+        rows (list)       -- the rows of <analyze_network>
+        gflops (float)    -- the peak compute rate of the device (GFLOP/s) for the roofline estimate; 0 to skip it
+        bandwidth (float) -- the memory bandwidth of the device (GB/s) for the roofline estimate; 0 to skip it
+    """
+    roofline = gflops > 0 and bandwidth > 0
+    width = max([len(row["name"]) for row in rows] + [5])
+    header = f"{'layer':<{width}} {'type':<18} {'output':<20} {'params':>10} {'MMACs':>10} {'act. MB':>9} {'traffic MB':>11}"
+    lines = [header + (f" {'roofline ms':>12} bound" if roofline else "")]
+    for row in rows:
+        line = f"{row['name']:<{width}} {row['type']:<18} {'x'.join(str(s) for s in row['shape']):<20} {row['params']:>10} {row['macs'] / 1e6:10.1f} {row['activation_bytes'] / MB:9.2f} {row['traffic_bytes'] / MB:11.2f}"
+        if roofline:
+            ms, bound = _roofline(row, gflops, bandwidth)
+            line += f" {ms:12.3f} {bound}"
+        lines.append(line)
+    totals = summarize_analysis(rows)
+    for title, key in (("layer type", "type"), ("block", "block")):
+        groups = OrderedDict()
+        for row in rows:
+            groups.setdefault(row[key] or "(outside the blocks)", []).append(row)
+        if key == "block" and len(groups) == 1:
+            continue
+        lines.append(f"---------- per {title} ----------")
+        for group, group_rows in sorted(groups.items(), key=lambda item: -summarize_analysis(item[1])["macs"]):
+            group_totals = summarize_analysis(group_rows)
+            lines.append(f"{group:<{width + 19}} {len(group_rows):>4} calls {group_totals['macs'] / 1e6:12.1f} MMACs ({group_totals['macs'] / max(totals['macs'], 1):6.1%}) {group_totals['traffic_bytes'] / MB:11.2f} MB traffic")
+    line = f"total: {totals['params'] / 1e6:.3f} M params, {totals['macs'] / 1e9:.3f} GMACs, activations {totals['activation_bytes'] / MB:.1f} MB, memory traffic {totals['traffic_bytes'] / MB:.1f} MB"
+    if roofline:
+        line += f", roofline {sum(_roofline(row, gflops, bandwidth)[0] for row in rows):.2f} ms"
+    lines.append(line)
+    return "\n".join(lines)
@@ -5,6 +5,8 @@ from pathlib import Path
 from collections import OrderedDict
 from abc import ABC, abstractmethod
 from . import networks
+from .analysis import analyze_network, format_analysis, input_channels, summary_line
+from .pruning import apply_architecture, load_architecture, save_architecture
 
 
 class BaseModel(ABC):
@@ -35,6 +37,7 @@ class BaseModel(ABC):
         self.isTrain = opt.isTrain
         self.save_dir = Path(opt.checkpoints_dir) / opt.name  # save all the checkpoints to save_dir
         self.device = opt.device
+        self.memory_format = torch.channels_last if opt.memory_format == "channels_last" else torch.contiguous_format  # of the networks and their inputs
         # with [scale_width], input images might have different sizes, which hurts the performance of cudnn.benchmark.
         if opt.preprocess != "scale_width":
             torch.backends.cudnn.benchmark = True
@@ -94,23 +97,12 @@ class BaseModel(ABC):
                     load_suffix = f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch
                     load_filename = f"{load_suffix}_net_{name}.pth"
                     load_path = self.save_dir / load_filename
-
-                    if isinstance(net, torch.nn.parallel.DistributedDataParallel):
-                        net = net.module
-                    print(f"loading the model from {load_path}")
-
-                    state_dict = torch.load(load_path, map_location=str(self.device), weights_only=True)
-
-                    if hasattr(state_dict, "_metadata"):
-                        del state_dict._metadata
-
-                    # patch InstanceNorm checkpoints
-                    for key in list(state_dict.keys()):
-                        self.__patch_instance_norm_state_dict(state_dict, net, key.split("."))
-                    net.load_state_dict(state_dict)
+                    self.load_network(net, load_path)
 
                 # Move network to device
                 net.to(self.device)
+                if self.memory_format == torch.channels_last:
+                    net = networks.to_channels_last(net)
 
                 # Wrap networks with DDP after loading
                 if dist.is_initialized():
@@ -125,6 +117,8 @@ class BaseModel(ABC):
                 setattr(self, "net" + name, net)
 
         self.print_networks(opt.verbose)
+        if opt.analyze_networks:
+            self.analyze_networks(opt.crop_size)
 
         if self.isTrain:
             self.schedulers = [networks.get_scheduler(optimizer, opt) for optimizer in self.optimizers]
@@ -205,6 +199,15 @@ class BaseModel(ABC):
 
                     # 3. Save the final, clean state_dict
                     torch.save(model_to_save.state_dict(), save_path)
+                    if getattr(model_to_save, "pruned", False):  # the channels of a pruned network; see models/pruning.py
+                        save_architecture(model_to_save, save_path.with_suffix(".json"))
+
+    def load_architecture(self, net, load_path):
+        """Resize a network to the architecture saved next to its checkpoint, if it was pruned (see models/pruning.py)"""
+        arch_path = load_path.with_suffix(".json")
+        if arch_path.exists():
+            print(f"rebuilding the pruned architecture from {arch_path}")
+            apply_architecture(net, load_architecture(arch_path))
 
     def __patch_instance_norm_state_dict(self, state_dict, module, keys, i=0):
         """Fix InstanceNorm checkpoints incompatibility (prior to 0.4)"""
@@ -225,25 +228,45 @@ class BaseModel(ABC):
             if isinstance(name, str):
                 load_filename = f"{epoch}_net_{name}.pth"
                 load_path = self.save_dir / load_filename
-                net = getattr(self, "net" + name)
+                self.load_network(getattr(self, "net" + name), load_path)
 
-                if isinstance(net, torch.nn.parallel.DistributedDataParallel):
-                    net = net.module
-                print(f"loading the model from {load_path}")
+        # Add a barrier to sync all processes before continuing
+        if dist.is_initialized():
+            dist.barrier()
 
-                state_dict = torch.load(load_path, map_location=str(self.device), weights_only=True)
+    def load_network(self, net, load_path):
+        """Load the weights of a network from a checkpoint, with its pruned architecture and the legacy InstanceNorm keys patched
 
-                if hasattr(state_dict, "_metadata"):
-                    del state_dict._metadata
+        Parameters:
+            net (nn.Module)  -- the network, possibly wrapped by DistributedDataParallel
+            load_path (Path) -- the checkpoint, e.g. [save_dir]/latest_net_G.pth
+        """
+        if isinstance(net, torch.nn.parallel.DistributedDataParallel):
+            net = net.module
+        self.load_architecture(net, load_path)
+        print(f"loading the model from {load_path}")
 
-                # patch InstanceNorm checkpoints
-                for key in list(state_dict.keys()):
-                    self.__patch_instance_norm_state_dict(state_dict, net, key.split("."))
-                net.load_state_dict(state_dict)
+        state_dict = torch.load(load_path, map_location=str(self.device), weights_only=True)
 
-        # Add a barrier to sync all processes before continuing
-        if dist.is_initialized():
-            dist.barrier()
+        if hasattr(state_dict, "_metadata"):
+            del state_dict._metadata
+
+        # patch InstanceNorm checkpoints
+        for key in list(state_dict.keys()):
+            self.__patch_instance_norm_state_dict(state_dict, net, key.split("."))
+        net.load_state_dict(state_dict)
+
+    def replace_network(self, name, net):
+        """Replace the network net<name> with another version of it, e.g. an optimized, quantized or ONNX generator
+
+        Parameters:
+            name (str)      -- the name in model_names, e.g. G or G_A
+            net (nn.Module) -- the new network; it takes and returns the same tensors as the old one
+        """
+        old = getattr(self, "net" + name)
+        setattr(self, "net" + name, net)
+        if getattr(self, "netG", None) is old:  # TestModel also keeps its generator as netG
+            self.netG = net
 
     def print_networks(self, verbose):
         """Print the total number of parameters in the network and (if verbose) network architecture
@@ -263,6 +286,24 @@ class BaseModel(ABC):
                 print(f"[Network {name}] Total number of parameters : {num_params / 1e6:.3f} M")
         print("-----------------------------------------------")
 
+    def analyze_networks(self, size):
+        """Print the MACs, activation memory and memory traffic of every network for a <size> x <size> input; save the per-layer tables
+
+        Parameters:
+            size (int) -- the height and width of the input images
+
+        The table of network <name> is saved to [save_dir]/net_<name>_analysis.txt (see models/analysis.py).
+        """
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        for name in self.model_names:
+            if isinstance(name, str):
+                net = getattr(self, "net" + name)
+                input_shape = (1, input_channels(net), size, size)
+                rows = analyze_network(net, input_shape)
+                print(summary_line(name, rows, input_shape))
+                with open(self.save_dir / f"net_{name}_analysis.txt", "w") as f:
+                    f.write(format_analysis(rows) + "\n")
+
     def set_requires_grad(self, nets, requires_grad=False):
         """Set requies_grad=Fasle for all the networks to avoid unnecessary computations
         Parameters:
@@ -0,0 +1,172 @@
+import torch
+import torch.nn as nn
+from util.image_pool import ImagePool
+from .base_model import BaseModel
+from . import networks
+
+
+class FeatureAdaptor(nn.ModuleList):
+    """The 1x1 convs that map the features of the student blocks to the channels of the teacher blocks"""
+
+    def forward(self, student_features):
+        """Map the i-th student feature with the i-th conv; return the list of mapped features"""
+        return [adapt(feature) for adapt, feature in zip(self, student_features)]
+
+
+class DistillModel(BaseModel):
+    """This class implements generator distillation: a small student generator learns to reproduce a trained teacher generator.
+
+    The teacher is loaded from '--checkpoints_dir/--teacher_name' and frozen. The student is trained with
+        -- an output loss:  lambda_distill * ||G_student(A) - G_teacher(A)||_1
+        -- a feature loss:  lambda_feature * mean_i ||F_i(student block i) - teacher block j(i)||_2^2
+           between residual blocks at the same relative depth, where F_i is a learned 1x1 conv that maps the student
+           channels to the teacher channels (only for ResNet generators; '--distill_layers 0' disables it)
+        -- a GAN loss against a '--netD' discriminator; the real images are the B images of '--dataset_mode unaligned',
+           or the teacher outputs with '--dataset_mode single'.
+    By default, the student is a '--netG mobile_resnet_9blocks' generator.
+
+    The student is saved as '<epoch>_net_G.pth', so it loads with '--model test' and the student's '--netG/--ngf/--norm'.
+    """
+
+    @staticmethod
+    def modify_commandline_options(parser, is_train=True):
+        """Add new dataset-specific options, and rewrite default values for existing options.
+
+        Parameters:
+            parser          -- original option parser
+            is_train (bool) -- whether training phase or test phase. You can use this flag to add training-specific or test-specific options.
+
+        Returns:
+            the modified parser.
+        """
+        parser.set_defaults(netG="mobile_resnet_9blocks", no_dropout=True, dataset_mode="single")
+        if is_train:
+            parser.add_argument("--teacher_name", type=str, required=True, help="experiment of the teacher in checkpoints_dir")
+            parser.add_argument("--teacher_epoch", type=str, default="latest", help="which epoch of the teacher to load")
+            parser.add_argument("--teacher_suffix", type=str, default="", help="the teacher is [teacher_epoch]_net_G[teacher_suffix].pth, e.g. _A for the G_A of a CycleGAN")
+            parser.add_argument("--teacher_netG", type=str, default="resnet_9blocks", help="generator architecture of the teacher")
+            parser.add_argument("--teacher_ngf", type=int, default=64, help="# of gen filters in the last conv layer of the teacher")
+            parser.add_argument("--teacher_norm", type=str, default="instance", help="normalization of the teacher [instance | batch | none]")
+            parser.add_argument("--teacher_dropout", action="store_true", help="the teacher was trained with dropout layers")
+            parser.add_argument("--lambda_distill", type=float, default=10.0, help="weight for the L1 loss between the student and teacher outputs")
+            parser.add_argument("--lambda_feature", type=float, default=1.0, help="weight for the intermediate feature matching loss")
+            parser.add_argument("--distill_layers", type=int, default=3, help="# of residual blocks whose features are matched")
+        return parser
+
+    def __init__(self, opt):
+        """Initialize the distillation class.
+
+        Parameters:
+            opt (Option class)-- stores all the experiment flags; needs to be a subclass of BaseOptions
+        """
+        BaseModel.__init__(self, opt)
+        # specify the training losses you want to print out. The training/test scripts will call <BaseModel.get_current_losses>
+        self.loss_names = ["G_GAN", "G_distill", "G_feature", "D_real", "D_fake"]
+        # specify the images you want to save/display. The training/test scripts will call <BaseModel.get_current_visuals>
+        self.visual_names = ["real_A", "teacher_B", "fake_B"]
+        # specify the models you want to save to the disk. The training/test scripts will call <BaseModel.save_networks> and <BaseModel.load_networks>
+        self.netG = networks.define_G(opt.input_nc, opt.output_nc, opt.ngf, opt.netG, opt.norm, not opt.no_dropout, opt.init_type, opt.init_gain)
+        if not self.isTrain:  # during test time, only load the student
+            self.model_names = ["G"]
+            return
+
+        # the frozen teacher; it is not part of model_names, so it is never saved
+        self.netTeacher = networks.define_G(opt.input_nc, opt.output_nc, opt.teacher_ngf, opt.teacher_netG, opt.teacher_norm, opt.teacher_dropout)
+        teacher_path = self.save_dir.parent / opt.teacher_name / f"{opt.teacher_epoch}_net_G{opt.teacher_suffix}.pth"
+        self.load_network(self.netTeacher, teacher_path)
+        self.netTeacher.to(self.device).eval()
+        if self.memory_format == torch.channels_last:
+            networks.to_channels_last(self.netTeacher)
+        self.set_requires_grad(self.netTeacher, False)
+
+        # pair the residual blocks of the student and the teacher at the same relative depth
+        student_blocks = [m for m in self.netG.modules() if isinstance(m, networks.ResnetBlock)]
+        teacher_blocks = [m for m in self.netTeacher.modules() if isinstance(m, networks.ResnetBlock)]
+        num_layers = min(opt.distill_layers, len(student_blocks), len(teacher_blocks)) if opt.lambda_feature > 0 else 0
+        if opt.lambda_feature > 0 and num_layers == 0:
+            print("feature matching needs ResNet generators; only the output and GAN losses are used")
+        pairs = []
+        for i in range(num_layers):
+            depth = (i + 1) / num_layers
+            pairs.append((student_blocks[round(depth * len(student_blocks)) - 1], teacher_blocks[round(depth * len(teacher_blocks)) - 1]))
+        self.student_features, self.teacher_features = [], []
+        for student_block, teacher_block in pairs:
+            student_block.register_forward_hook(lambda module, input, output: self.student_features.append(output))
+            teacher_block.register_forward_hook(lambda module, input, output: self.teacher_features.append(output))
+        # 1x1 convs mapping the student features to the teacher channels
+        self.netF = FeatureAdaptor([nn.Conv2d(self._channels(s), self._channels(t), kernel_size=1) for s, t in pairs])
+
+        self.netD = networks.define_D(opt.output_nc, opt.ndf, opt.netD, opt.n_layers_D, opt.norm, opt.init_type, opt.init_gain)
+        self.model_names = ["G", "F", "D"] if pairs else ["G", "D"]  # DDP cannot wrap a network without parameters
+        self.fake_pool = ImagePool(opt.pool_size)  # create image buffer to store previously generated images
+        # define loss functions
+        self.criterionGAN = networks.GANLoss(opt.gan_mode).to(self.device)
+        self.criterionDistill = torch.nn.L1Loss()
+        self.criterionFeature = torch.nn.MSELoss()
+        # initialize optimizers; schedulers will be automatically created by function <BaseModel.setup>.
+        self.optimizer_G = torch.optim.Adam(list(self.netG.parameters()) + list(self.netF.parameters()), lr=opt.lr, betas=(opt.beta1, 0.999))
+        self.optimizer_D = torch.optim.Adam(self.netD.parameters(), lr=opt.lr, betas=(opt.beta1, 0.999))
+        self.optimizers.append(self.optimizer_G)
+        self.optimizers.append(self.optimizer_D)
+
+    @staticmethod
+    def _channels(block):
+        """Return the number of channels of a residual block."""
+        return next(m for m in block.modules() if isinstance(m, nn.Conv2d)).in_channels
+
+    def set_input(self, input):
+        """Unpack input data from the dataloader and perform necessary pre-processing steps.
+
+        Parameters:
+            input (dict): include the data itself and its metadata information.
+
+        The option 'direction' can be used to swap domain A and domain B of an unaligned dataset.
+        """
+        AtoB = self.opt.direction == "AtoB" or "B" not in input
+        self.real_A = input["A" if AtoB else "B"].to(self.device, memory_format=self.memory_format)
+        self.real_B = input["B" if AtoB else "A"].to(self.device, memory_format=self.memory_format) if "B" in input else None
+        self.image_paths = input["A_paths" if AtoB else "B_paths"]
+
+    def forward(self):
+        """Run forward pass; called by both functions <optimize_parameters> and <test>."""
+        if self.isTrain:
+            self.student_features.clear()
+            self.teacher_features.clear()
+            with torch.no_grad():
+                self.teacher_B = self.netTeacher(self.real_A.clone())  # G_teacher(A)
+        self.fake_B = self.netG(self.real_A)  # G_student(A)
+
+    def backward_D(self):
+        """Calculate GAN loss for the discriminator"""
+        real = self.real_B if self.real_B is not None else self.teacher_B
+        fake = self.fake_pool.query(self.fake_B)
+        self.loss_D_real = self.criterionGAN(self.netD(real), True)
+        self.loss_D_fake = self.criterionGAN(self.netD(fake.detach()), False)
+        self.loss_D = (self.loss_D_real + self.loss_D_fake) * 0.5
+        self.loss_D.backward()
+
+    def backward_G(self):
+        """Calculate the GAN, output and feature losses for the student"""
+        self.loss_G_GAN = self.criterionGAN(self.netD(self.fake_B), True)
+        self.loss_G_distill = self.criterionDistill(self.fake_B, self.teacher_B) * self.opt.lambda_distill
+        self.loss_G_feature = 0
+        if self.teacher_features:
+            mapped = self.netF(self.student_features)  # through the forward of netF, so that DDP synchronizes its gradients
+            for student, teacher in zip(mapped, self.teacher_features):
+                self.loss_G_feature = self.loss_G_feature + self.criterionFeature(student, teacher) * self.opt.lambda_feature / len(mapped)
+        self.loss_G = self.loss_G_GAN + self.loss_G_distill + self.loss_G_feature
+        self.loss_G.backward()
+
+    def optimize_parameters(self):
+        """Calculate losses, gradients, and update network weights; called in every training iteration"""
+        self.forward()  # compute the teacher and student outputs
+        # update G (and the feature adaptors)
+        self.set_requires_grad(self.netD, False)  # D requires no gradients when optimizing G
+        self.optimizer_G.zero_grad()
+        self.backward_G()
+        self.optimizer_G.step()
+        # update D
+        self.set_requires_grad(self.netD, True)
+        self.optimizer_D.zero_grad()
+        self.backward_D()
+        self.optimizer_D.step()
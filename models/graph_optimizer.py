@@ -0,0 +1,112 @@
+"""This module implements an eval-time rewrite of generators that removes ops which are only needed for training.
+
+The generators of <networks.define_G> are plain nn.Sequential chains, so the rewrite works on their modules:
+    -- BatchNorm2d in eval mode is an affine op with fixed statistics; it is folded into the weights and bias of
+       the preceding Conv2d / ConvTranspose2d;
+    -- ReflectionPad2d / ReplicationPad2d followed by an unpadded Conv2d is merged into the conv through its
+       'padding_mode', so the padding is done inside the conv call;
+    -- Dropout in eval mode is the identity and is removed.
+InstanceNorm2d computes its statistics on every image and cannot be folded. Eager PyTorch has no fused
+conv + activation kernel on the CPU; use '--compile' on top of the rewrite to let torch.compile fuse the
+activations (and the instance norms) into the conv epilogues.
+
+Layers still in training mode (e.g. batchnorm and dropout in test.py without '--eval') are left untouched, so the
+rewrite never changes the results. <optimize_generator> checks it numerically on an example input.
+
+Example:
+    >>> from models.graph_optimizer import optimize_generator
+    >>> net = optimize_generator(model.netG, example_input=torch.rand(1, 3, 256, 256) * 2 - 1)
+"""
+
+import copy
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+PADDING_MODES = {nn.ReflectionPad2d: "reflect", nn.ReplicationPad2d: "replicate"}
+
+
+def _merge_padding(pad, conv):
+    """Return <conv> with the padding of <pad> moved into it, or None if they cannot be merged."""
+    mode = PADDING_MODES.get(type(pad))
+    if mode is None or not isinstance(conv, nn.Conv2d) or conv.padding != (0, 0) or conv.padding_mode != "zeros":
+        return None
+    left, right, top, bottom = pad.padding
+    if left != right or top != bottom:  # Conv2d pads both sides equally
+        return None
+    conv = copy.deepcopy(conv)
+    conv.padding, conv.padding_mode = (top, left), mode
+    conv._reversed_padding_repeated_twice = (left, left, top, top)
+    return conv
+
+
+def _rewrite_sequential(seq, stats):
+    """Return the list of modules of an nn.Sequential after folding, merging and dropping."""
+    modules = []
+    for module in seq:
+        if isinstance(module, nn.Dropout) and not module.training:
+            stats["dropout"] += 1
+            continue
+        prev = modules[-1] if modules else None
+        if isinstance(module, nn.BatchNorm2d) and not module.training and module.track_running_stats and isinstance(prev, (nn.Conv2d, nn.ConvTranspose2d)):
+            modules[-1] = fuse_conv_bn_eval(prev, module, transpose=isinstance(prev, nn.ConvTranspose2d))
+            stats["batchnorm"] += 1
+            continue
+        if isinstance(module, nn.Conv2d) and prev is not None:
+            merged = _merge_padding(prev, module)
+            if merged is not None:
+                modules[-1] = merged
+                stats["padding"] += 1
+                continue
+        modules.append(module)
+    return modules
+
+
+def _rewrite(module, stats):
+    """Rewrite every nn.Sequential of <module> in place, innermost first."""
+    for name, child in module.named_children():
+        _rewrite(child, stats)
+        if isinstance(child, nn.Sequential):
+            setattr(module, name, nn.Sequential(*_rewrite_sequential(child, stats)))
+
+
+def verify_equivalence(reference, optimized, example_input, atol=1e-4):
+    """Return the maximum absolute difference between two networks on <example_input>; raise a RuntimeError if it is larger than <atol>."""
+    with torch.no_grad():
+        # generators may modify their input in place (e.g. the first LeakyReLU of UnetGenerator)
+        diff = (reference(example_input.clone()) - optimized(example_input.clone())).abs().max().item()
+    if diff > atol:
+        raise RuntimeError(f"the optimized generator differs from the original one by {diff:.2e} (tolerance {atol:.0e})")
+    return diff
+
+
+def optimize_generator(net, example_input=None, atol=1e-4, verbose=True):
+    """Return an optimized copy of a generator built by <networks.define_G>.
+
+    Parameters:
+        net (nn.Module)        -- the generator; it is not modified
+        example_input (tensor) -- if given, check that both generators agree on it
+        atol (float)           -- the largest difference accepted by the check
+        verbose (bool)         -- print what was rewritten
+    """
+    optimized = copy.deepcopy(net.module if hasattr(net, "module") else net)
+    stats = {"batchnorm": 0, "padding": 0, "dropout": 0}
+    _rewrite(optimized, stats)
+    if example_input is not None:
+        diff = verify_equivalence(net, optimized, example_input, atol)
+    if verbose:
+        print(f"graph optimizer: folded {stats['batchnorm']} batchnorm layers, merged {stats['padding']} padding layers into convs, removed {stats['dropout']} dropout layers" + (f"; max difference {diff:.2e}" if example_input is not None else ""))
+    return optimized
+
+
+def optimize_model(model, opt):
+    """Replace the generators of a test model with their optimized versions; used by test.py with '--optimize_graph'."""
+    for name in model.model_names:
+        if not name.startswith("G"):
+            continue
+        net = getattr(model, "net" + name)
+        first_conv = next(m for m in net.modules() if isinstance(m, nn.Conv2d))
+        example_input = torch.rand(1, first_conv.in_channels, 256, 256, device=model.device) * 2 - 1  # a valid size for every netG
+        optimized = optimize_generator(net, example_input)
+        model.replace_network(name, optimized)
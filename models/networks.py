@@ -2,7 +2,9 @@ import torch
 import torch.nn as nn
 from torch.nn import init
 import functools
+from contextlib import contextmanager, nullcontext
 from torch.optim import lr_scheduler
+from util.util import memory_format_of
 
 
 ###############################################################################
@@ -15,6 +17,20 @@ class Identity(nn.Module):
         return x
 
 
+class ChannelsLastInstanceNorm2d(nn.InstanceNorm2d):
+    """InstanceNorm2d (without running statistics) that keeps the memory format of its input
+
+    nn.InstanceNorm2d returns contiguous NCHW tensors, which forces the following conv to convert a channels_last input back.
+    """
+
+    def forward(self, x):
+        var, mean = torch.var_mean(x, dim=(2, 3), keepdim=True, unbiased=False)
+        out = (x - mean) * torch.rsqrt(var + self.eps)
+        if self.affine:
+            out = out * self.weight.view(1, -1, 1, 1) + self.bias.view(1, -1, 1, 1)
+        return out
+
+
 def get_norm_layer(norm_type="instance"):
     """Return a normalization layer
 
@@ -129,6 +145,35 @@ def init_net(net, init_type="normal", init_gain=0.02):
     return net
 
 
+def to_channels_last(net):
+    """Convert a network to the channels_last memory format, in place
+
+    The weights are converted in place (the optimizers stay valid), and the instance norm layers are replaced by
+    ChannelsLastInstanceNorm2d so that the activations stay in channels_last between the convs.
+    """
+    net.to(memory_format=torch.channels_last)
+    _replace_instance_norms(net, nn.InstanceNorm2d, ChannelsLastInstanceNorm2d)
+    return net
+
+
+def to_contiguous_format(net):
+    """Undo <to_channels_last>, in place"""
+    net.to(memory_format=torch.contiguous_format)
+    _replace_instance_norms(net, ChannelsLastInstanceNorm2d, nn.InstanceNorm2d)
+    return net
+
+
+def _replace_instance_norms(net, old_class, new_class):
+    """Replace the instance norm layers (without running statistics) of class <old_class> by <new_class>, sharing their parameters"""
+    for module in list(net.modules()):
+        for name, child in module.named_children():
+            if type(child) is old_class and not child.track_running_stats:
+                norm = new_class(child.num_features, eps=child.eps, affine=child.affine)
+                if child.affine:
+                    norm.weight, norm.bias = child.weight, child.bias
+                setattr(module, name, norm.train(child.training))
+
+
 def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, init_type="normal", init_gain=0.02):
     """Create a generator
 
@@ -136,7 +181,7 @@ def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, in
         input_nc (int) -- the number of channels in input images
         output_nc (int) -- the number of channels in output images
         ngf (int) -- the number of filters in the last conv layer
-        netG (str) -- the architecture's name: resnet_9blocks | resnet_6blocks | unet_128 | unet_256
+        netG (str) -- the architecture's name: resnet_9blocks | resnet_6blocks | mobile_resnet_9blocks | mobile_resnet_6blocks | rev_resnet_9blocks | rev_resnet_6blocks | unet_128 | unet_256
         norm (str) -- the name of normalization layers used in the network: batch | instance | none
         use_dropout (bool) -- if use dropout layers.
         init_type (str)    -- the name of our initialization method.
@@ -151,6 +196,14 @@ def define_G(input_nc, output_nc, ngf, netG, norm="batch", use_dropout=False, in
         net = ResnetGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=9)
     elif netG == "resnet_6blocks":
         net = ResnetGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=6)
+    elif netG == "mobile_resnet_9blocks":
+        net = ResnetGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=9, block=MobileResnetBlock)
+    elif netG == "mobile_resnet_6blocks":
+        net = ResnetGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=6, block=MobileResnetBlock)
+    elif netG == "rev_resnet_9blocks":
+        net = ResnetGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=9, block=ReversibleResnetBlock)
+    elif netG == "rev_resnet_6blocks":
+        net = ResnetGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=6, block=ReversibleResnetBlock)
     elif netG == "unet_128":
         net = UnetGenerator(input_nc, output_nc, 7, ngf, norm_layer=norm_layer, use_dropout=use_dropout)
     elif netG == "unet_256":
@@ -316,7 +369,7 @@ class ResnetGenerator(nn.Module):
     We adapt Torch code and idea from Justin Johnson's neural style transfer project(https://github.com/jcjohnson/fast-neural-style)
     """
 
-    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, padding_type="reflect"):
+    def __init__(self, input_nc, output_nc, ngf=64, norm_layer=nn.BatchNorm2d, use_dropout=False, n_blocks=6, padding_type="reflect", block=None):
         """Construct a Resnet-based generator
 
         Parameters:
@@ -327,6 +380,7 @@ class ResnetGenerator(nn.Module):
             use_dropout (bool)  -- if use dropout layers
             n_blocks (int)      -- the number of ResNet blocks
             padding_type (str)  -- the name of padding layer in conv layers: reflect | replicate | zero
+            block (class)       -- the residual block class: ResnetBlock (default) | MobileResnetBlock | ReversibleResnetBlock
         """
         assert n_blocks >= 0
         super(ResnetGenerator, self).__init__()
@@ -343,9 +397,12 @@ class ResnetGenerator(nn.Module):
             model += [nn.Conv2d(ngf * mult, ngf * mult * 2, kernel_size=3, stride=2, padding=1, bias=use_bias), norm_layer(ngf * mult * 2), nn.ReLU(True)]
 
         mult = 2**n_downsampling
+        block = block or ResnetBlock
+        blocks = []
         for i in range(n_blocks):  # add ResNet blocks
 
-            model += [ResnetBlock(ngf * mult, padding_type=padding_type, norm_layer=norm_layer, use_dropout=use_dropout, use_bias=use_bias)]
+            blocks += [block(ngf * mult, padding_type=padding_type, norm_layer=norm_layer, use_dropout=use_dropout, use_bias=use_bias)]
+        model += [ReversibleSequence(blocks)] if block is ReversibleResnetBlock else blocks
 
         for i in range(n_downsampling):  # add upsampling layers
             mult = 2 ** (n_downsampling - i)
@@ -421,6 +478,196 @@ class ResnetBlock(nn.Module):
         return out
 
 
+class MobileResnetBlock(ResnetBlock):
+    """Define a Resnet block with depthwise-separable convolutions
+
+    Each 3x3 conv of ResnetBlock is replaced by a 3x3 depthwise conv (one filter per channel) followed by a 1x1 pointwise conv,
+    which divides the parameters and FLOPs of the residual trunk by ~8 at the default width.
+    MobileNets paper: https://arxiv.org/pdf/1704.04861.pdf
+    """
+
+    def build_conv_block(self, dim, padding_type, norm_layer, use_dropout, use_bias):
+        """Construct a depthwise-separable convolutional block.
+
+        Parameters:
+            dim (int)           -- the number of channels in the conv layer.
+            padding_type (str)  -- the name of padding layer: reflect | replicate | zero
+            norm_layer          -- normalization layer
+            use_dropout (bool)  -- if use dropout layers.
+            use_bias (bool)     -- if the conv layer uses bias or not
+
+        Returns a conv block (with depthwise and pointwise conv layers, normalization layers, and a non-linearity layer (ReLU))
+        """
+        conv_block = []
+        for i in range(2):
+            p = 0
+            if padding_type == "reflect":
+                conv_block += [nn.ReflectionPad2d(1)]
+            elif padding_type == "replicate":
+                conv_block += [nn.ReplicationPad2d(1)]
+            elif padding_type == "zero":
+                p = 1
+            else:
+                raise NotImplementedError("padding [%s] is not implemented" % padding_type)
+            conv_block += [nn.Conv2d(dim, dim, kernel_size=3, padding=p, groups=dim, bias=use_bias), norm_layer(dim)]  # depthwise
+            conv_block += [nn.Conv2d(dim, dim, kernel_size=1, bias=use_bias), norm_layer(dim)]  # pointwise
+            if i == 0:
+                conv_block += [nn.ReLU(True)]
+                if use_dropout:
+                    conv_block += [nn.Dropout(0.5)]
+
+        return nn.Sequential(*conv_block)
+
+
+class _RNGState:
+    """The random state before a call, used to replay its dropout masks when it is recomputed"""
+
+    def __init__(self, device):
+        self.device = device
+        self.cpu_state = torch.get_rng_state()
+        self.cuda_state = torch.cuda.get_rng_state(device) if device.type == "cuda" else None
+
+    @contextmanager
+    def replay(self):
+        with torch.random.fork_rng(devices=[self.device] if self.cuda_state is not None else []):
+            torch.set_rng_state(self.cpu_state)
+            if self.cuda_state is not None:
+                torch.cuda.set_rng_state(self.cuda_state, self.device)
+            yield
+
+
+@contextmanager
+def _recomputing(module, rng_state):
+    """Recompute <module> (and backpropagate through it) like in the forward pass: same dropout masks, batchnorm running statistics updated only once"""
+    norms = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.training and m.track_running_stats]
+    saved = [(m.running_mean.clone(), m.running_var.clone(), m.num_batches_tracked.clone()) for m in norms]
+    with rng_state.replay() if rng_state is not None else nullcontext():
+        yield
+    with torch.no_grad():
+        for m, (mean, var, num) in zip(norms, saved):
+            m.running_mean.copy_(mean)
+            m.running_var.copy_(var)
+            m.num_batches_tracked.copy_(num)
+
+
+class ReversibleResnetBlock(nn.Module):
+    """Define a reversible Resnet block
+
+    The channels are split into two halves (x1, x2) coupled by two residual functions F and G:
+        y1 = x1 + F(x2),  y2 = x2 + G(y1)
+    so the input can be reconstructed from the output: x2 = y2 - G(y1), x1 = y1 - F(x2).
+    F and G are the conv blocks of ResnetBlock with half the channels.
+    RevNet paper: https://arxiv.org/pdf/1707.04585.pdf
+    """
+
+    def __init__(self, dim, padding_type, norm_layer, use_dropout, use_bias):
+        super(ReversibleResnetBlock, self).__init__()
+        assert dim % 2 == 0, "a reversible block needs an even number of channels"
+        # build_conv_block does not depend on the block, so F and G reuse the conv block of ResnetBlock
+        self.f = ResnetBlock.build_conv_block(self, dim // 2, padding_type, norm_layer, use_dropout, use_bias)
+        self.g = ResnetBlock.build_conv_block(self, dim // 2, padding_type, norm_layer, use_dropout, use_bias)
+        self.use_dropout = use_dropout
+
+    def forward(self, x, rng_states=None):
+        """Forward function; the random states needed by <backward_pass> are appended to the list <rng_states> if given"""
+        record = rng_states is not None and self.use_dropout and self.training
+        x1, x2 = torch.chunk(x, 2, dim=1)
+        x2 = x2.contiguous(memory_format=memory_format_of(x))  # a channel slice is not in channels_last order
+        rng_f = _RNGState(x.device) if record else None
+        y1 = x1 + self.f(x2)
+        rng_g = _RNGState(x.device) if record else None
+        y2 = x2 + self.g(y1)
+        if rng_states is not None:
+            rng_states.append((rng_f, rng_g))
+        return torch.cat([y1, y2], dim=1)
+
+    def backward_pass(self, y, dy, rng_states=(None, None)):
+        """Reconstruct the input of the block from its output <y>.
+
+        Returns the input, its gradient and the gradients of the parameters of F and G, as a dict parameter -> gradient.
+        """
+        rng_f, rng_g = rng_states
+        y1, y2 = torch.chunk(y, 2, dim=1)
+        dy1, dy2 = torch.chunk(dy, 2, dim=1)
+        grads = {}
+        with torch.enable_grad():
+            y1 = y1.detach().contiguous(memory_format=memory_format_of(y)).requires_grad_()
+            with _recomputing(self.g, rng_g):
+                gy1 = self.g(y1)
+                dy1_g = _input_and_param_grads(gy1, dy2, y1, self.g, grads)
+        with torch.no_grad():
+            x2 = y2 - gy1
+            dx1 = dy1 + dy1_g
+            del gy1
+        with torch.enable_grad():
+            x2 = x2.detach().requires_grad_()
+            with _recomputing(self.f, rng_f):
+                fx2 = self.f(x2)
+                dx2_f = _input_and_param_grads(fx2, dx1, x2, self.f, grads)
+        with torch.no_grad():
+            x1 = y1 - fx2
+            dx2 = dy2 + dx2_f
+            return torch.cat([x1, x2.detach()], dim=1), torch.cat([dx1, dx2], dim=1), grads
+
+
+def _input_and_param_grads(output, grad_output, input, module, grads):
+    """Return the gradient of <input>; add the gradients of the parameters of <module> to the dict <grads>.
+
+    The gradients are returned with torch.autograd.grad instead of being accumulated into .grad, so that the engine that
+    runs the backward of the whole network (and the gradient hooks of DDP) accumulates every parameter exactly once.
+    """
+    params = [p for p in module.parameters() if p.requires_grad]
+    input_grad, *param_grads = torch.autograd.grad(output, [input] + params, grad_output, allow_unused=True)
+    for param, grad in zip(params, param_grads):
+        if grad is not None:
+            grads[param] = grad if param not in grads else grads[param] + grad
+    return input_grad
+
+
+class _ReversibleFunction(torch.autograd.Function):
+    """Run reversible blocks without keeping their activations; they are reconstructed in the backward pass"""
+
+    @staticmethod
+    def forward(ctx, x, blocks, *params):
+        ctx.rng_states = []  # kept per call, as a generator may run several times before the backward pass
+        for block in blocks:
+            x = block(x, ctx.rng_states)
+        ctx.blocks = blocks
+        ctx.params = params
+        ctx.save_for_backward(x)  # only the output of the last block
+        return x
+
+    @staticmethod
+    def backward(ctx, dy):
+        (y,) = ctx.saved_tensors
+        grads = {}
+        for block, rng_states in zip(reversed(ctx.blocks), reversed(ctx.rng_states)):
+            y, dy, block_grads = block.backward_pass(y, dy, rng_states)
+            for param, grad in block_grads.items():
+                grads[param] = grad if param not in grads else grads[param] + grad
+        # the parameter gradients are returned in the slots of <params>, so that autograd accumulates them
+        return (dy, None) + tuple(grads.get(param) for param in ctx.params)
+
+
+class ReversibleSequence(nn.Module):
+    """A sequence of reversible blocks whose activation memory does not grow with the number of blocks
+
+    In training mode, only the output of the sequence is kept for the backward pass; the inputs of the blocks are
+    reconstructed from their outputs, which costs one more forward pass of the blocks.
+    """
+
+    def __init__(self, blocks):
+        super(ReversibleSequence, self).__init__()
+        self.blocks = nn.ModuleList(blocks)
+
+    def forward(self, x):
+        if self.training and torch.is_grad_enabled():
+            return _ReversibleFunction.apply(x, self.blocks, *self.parameters())
+        for block in self.blocks:
+            x = block(x)
+        return x
+
+
 class UnetGenerator(nn.Module):
     """Create a Unet-based generator"""
 
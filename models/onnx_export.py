@@ -0,0 +1,134 @@
+"""This module implements the ONNX export of generators and an ONNX Runtime backend for test.py.
+
+Any generator built by <networks.define_G> (all netG architectures, all norms) is exported in eval mode with
+dynamic batch, height and width axes, next to its checkpoint as '<epoch>_net_<name>.onnx'. The exported file only
+needs onnxruntime (and numpy) to run; the preprocessing is the one of the test set: RGB in [-1, 1], NCHW float32.
+
+With '--backend onnxruntime', test.py exports the generators if needed (or reuses the files exported from the
+current checkpoints) and runs them with ONNX Runtime on the CPU with all its graph optimizations enabled.
+Every run first checks that ONNX Runtime and PyTorch agree on a random input.
+
+Example:
+    python scripts/export_onnx.py --name horse2zebra_pretrained --model test --no_dropout
+    python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --backend onnxruntime
+"""
+
+import copy
+import warnings
+import numpy as np
+import torch
+
+
+def export_generator(net, export_path, input_nc, opset_version=17):
+    """Export a generator to ONNX with dynamic batch, height and width.
+
+    Parameters:
+        net (nn.Module)     -- the generator; it is not modified
+        export_path (str)   -- the ONNX file to write
+        input_nc (int)      -- the number of channels of its input
+        opset_version (int) -- the ONNX opset
+    """
+    net = copy.deepcopy(net.module if hasattr(net, "module") else net).cpu().eval()
+    example_input = torch.rand(1, input_nc, 256, 256) * 2 - 1  # a valid size for every netG
+    axes = {0: "batch", 2: "height", 3: "width"}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # constant folding and instance norm notices of the exporter
+        torch.onnx.export(net, (example_input,), str(export_path), input_names=["input"], output_names=["output"], dynamic_axes={"input": axes, "output": axes}, opset_version=opset_version, dynamo=False)
+
+
+class ONNXGenerator:
+    """Run an exported generator with ONNX Runtime; called like the torch generator it replaces."""
+
+    def __init__(self, onnx_path, num_threads=0):
+        """Create an ONNX Runtime session
+
+        Parameters:
+            onnx_path (str)   -- the exported generator
+            num_threads (int) -- # of intra-op threads; 0 lets ONNX Runtime use all the cores
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("--backend onnxruntime needs the onnxruntime package: pip install onnxruntime")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input):
+        """Translate a batch of images given as a torch tensor or a numpy array; the output has the same type."""
+        if isinstance(input, np.ndarray):
+            return self.session.run(None, {"input": input.astype(np.float32, copy=False)})[0]
+        output = self.session.run(None, {"input": input.detach().cpu().float().numpy()})[0]
+        return torch.from_numpy(output)
+
+    def eval(self):
+        return self
+
+
+def check_parity(net, onnx_net, input_nc, atol=1e-3):
+    """Return the maximum absolute difference between a torch generator and its ONNX Runtime version on a random input."""
+    net = copy.deepcopy(net.module if hasattr(net, "module") else net).cpu().eval()
+    example_input = torch.rand(2, input_nc, 256, 256) * 2 - 1
+    with torch.no_grad():
+        diff = (net(example_input.clone()) - onnx_net(example_input.clone())).abs().max().item()
+    if diff > atol:
+        raise RuntimeError(f"ONNX Runtime and PyTorch outputs differ by {diff:.2e} (tolerance {atol:.0e}) for {onnx_net.onnx_path}")
+    return diff
+
+
+def _training_layers(net):
+    """Return the names of the batchnorm and dropout layers of a generator that are in training mode."""
+    net = net.module if hasattr(net, "module") else net
+    return [name for name, m in net.named_modules() if m.training and isinstance(m, (torch.nn.modules.batchnorm._BatchNorm, torch.nn.Dropout))]
+
+
+def _generators(model):
+    """Yield (name, generator, input channels) for every generator of a model."""
+    for name in model.model_names:
+        if name.startswith("G"):
+            net = getattr(model, "net" + name)
+            first_conv = next(m for m in net.modules() if isinstance(m, torch.nn.Conv2d))
+            yield name, net, first_conv.in_channels
+
+
+def export_model(model, opt):
+    """Export every generator of a model next to its checkpoint and return the ONNX paths."""
+    load_suffix = f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch
+    paths = {}
+    for name, net, input_nc in _generators(model):
+        paths[name] = model.save_dir / f"{load_suffix}_net_{name}.onnx"
+        export_generator(net, paths[name], input_nc)
+        print(f"exported net{name} to {paths[name]}")
+    return paths
+
+
+def onnx_model(model, opt):
+    """Replace the generators of a test model with ONNX Runtime sessions; used by test.py with '--backend onnxruntime'.
+
+    The ONNX files are (re-)exported when they are missing or older than the checkpoints. They are exported in eval
+    mode, so generators with batchnorm or dropout layers need '--eval' to match the PyTorch backend.
+    """
+    for name, net, _ in _generators(model):
+        layers = _training_layers(net)
+        if layers:
+            raise ValueError(f"net{name} has batchnorm or dropout layers in training mode ({', '.join(layers[:3])}{', ...' if len(layers) > 3 else ''}), which the ONNX export runs in eval mode; add --eval to use --backend onnxruntime")
+    if opt.quantize or opt.optimize_graph or opt.compile or opt.infer_dtype != "fp32":
+        print("ONNX Runtime applies its own graph optimizations in fp32; --quantize, --optimize_graph, --compile and --infer_dtype are ignored")
+    if model.device.type != "cpu":
+        print("the onnxruntime backend runs on the CPU; moving the model to the CPU")
+        model.device = torch.device("cpu")
+    load_suffix = f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch
+    for name, net, input_nc in _generators(model):
+        onnx_path = model.save_dir / f"{load_suffix}_net_{name}.onnx"
+        checkpoint = model.save_dir / f"{load_suffix}_net_{name}.pth"
+        if not onnx_path.exists() or onnx_path.stat().st_mtime < checkpoint.stat().st_mtime:
+            export_generator(net, onnx_path, input_nc)
+            print(f"exported net{name} to {onnx_path}")
+        onnx_net = ONNXGenerator(onnx_path, opt.ort_threads)
+        diff = check_parity(net, onnx_net, input_nc)
+        print(f"running net{name} with ONNX Runtime from {onnx_path}; max difference to PyTorch {diff:.2e}")
+        model.replace_network(name, onnx_net)
@@ -0,0 +1,124 @@
+"""This module implements reduced-precision (bf16 / fp16) inference of generators.
+
+The weights and activations of the generator are converted to the requested dtype, except for the normalization
+layers: InstanceNorm2d / BatchNorm2d compute their statistics (a sum over the whole feature map) in fp32 and convert
+their output back. The generator still takes and returns fp32 tensors, so the rest of test.py (and <tensor2im>) is
+unchanged.
+
+To help pick the fastest precision that is visually identical to fp32, the first '--precision_check' batches are
+also translated by the fp32 generator and the differences are summarized (L1, PSNR and the largest difference in
+8-bit levels of the saved images).
+
+Example:
+    python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --infer_dtype bf16
+"""
+
+import copy
+import torch
+import torch.nn as nn
+from models.quantization import compare_outputs
+
+
+DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+class FP32Norm(nn.Module):
+    """Run a normalization layer in fp32 inside a reduced-precision network."""
+
+    def __init__(self, norm):
+        super().__init__()
+        self.norm = norm.float()
+
+    def forward(self, x):
+        return self.norm(x.float()).to(x.dtype)
+
+
+class ReducedPrecisionGenerator(nn.Module):
+    """A generator whose layers run in a reduced precision; its input and output are fp32."""
+
+    def __init__(self, net, dtype):
+        """Convert a copy of a generator
+
+        Parameters:
+            net (nn.Module)     -- the fp32 generator; it is not modified
+            dtype (torch.dtype) -- torch.bfloat16 or torch.float16
+        """
+        super().__init__()
+        self.dtype = dtype
+        self.net = copy.deepcopy(net.module if hasattr(net, "module") else net).to(dtype)
+        self._keep_norms_fp32(self.net)
+
+    def _keep_norms_fp32(self, module):
+        for name, child in module.named_children():
+            if isinstance(child, (nn.InstanceNorm2d, nn.BatchNorm2d)):
+                setattr(module, name, FP32Norm(child))
+            else:
+                self._keep_norms_fp32(child)
+
+    def forward(self, input):
+        return self.net(input.to(self.dtype)).float()
+
+
+class PrecisionMonitor(nn.Module):
+    """Run a reduced-precision generator and compare it with the fp32 one on the first batches."""
+
+    def __init__(self, net, reference, num_checks, name="G"):
+        """Initialize the monitor
+
+        Parameters:
+            net (nn.Module)       -- the reduced-precision generator
+            reference (nn.Module) -- the fp32 generator
+            num_checks (int)      -- # of batches compared with fp32; the fp32 generator is released after them
+            name (str)            -- the generator name in the report
+        """
+        super().__init__()
+        self.net = net
+        self.reference = reference
+        self.num_checks = num_checks
+        self.name = name
+        self.scores = []
+
+    def forward(self, input):
+        output = self.net(input)
+        if self.reference is not None:
+            reference = self.reference(input.clone())
+            score = compare_outputs(reference, output)
+            score["max_levels"] = (reference - output).abs().max().item() / 2 * 255  # largest change of a saved 8-bit pixel
+            self.scores.append(score)
+            if len(self.scores) >= self.num_checks:
+                self.report()
+        return output
+
+    def report(self):
+        """Print the difference summary and release the fp32 generator."""
+        n = len(self.scores)
+        l1 = sum(s["l1"] for s in self.scores) / n
+        psnr = min(s["psnr"] for s in self.scores)
+        levels = max(s["max_levels"] for s in self.scores)
+        print(f"net{self.name} {self.net.dtype} vs fp32 on {n} batches: L1 {l1:.5f}, worst PSNR {psnr:.2f} dB, largest difference {levels:.1f} 8-bit levels")
+        self.reference = None
+
+
+def set_infer_dtype(model, opt):
+    """Run the generators of a test model in opt.infer_dtype; used by test.py with '--infer_dtype'."""
+    dtype = DTYPES[opt.infer_dtype]
+    if dtype == torch.float32:
+        return
+    if model.device.type == "cpu" and dtype == torch.float16:
+        print("Warning: most CPUs have no fast fp16 kernels; bf16 is usually faster on the CPU")
+    for name in model.model_names:
+        if not name.startswith("G"):
+            continue
+        net = getattr(model, "net" + name)
+        reduced = ReducedPrecisionGenerator(net, dtype)
+        if opt.precision_check > 0:
+            reduced = PrecisionMonitor(reduced, net, opt.precision_check, name)
+        model.replace_network(name, reduced)
+
+
+def report_precision(model):
+    """Print the difference summary of the generators that were compared with fp32 on fewer batches than requested."""
+    for name in model.model_names:
+        net = getattr(model, "net" + name)
+        if isinstance(net, PrecisionMonitor) and net.reference is not None and net.scores:
+            net.report()
@@ -0,0 +1,266 @@
+"""This module implements structured channel pruning of trained generators.
+
+The channels of a generator are split into groups that must be removed together:
+    -- the output channels of a conv / transposed conv, with the norm layers that follow it and the input channels of the
+       layers that consume it;
+    -- for ResnetGenerator, the channels of the residual trunk: the last downsampling conv and the last conv of every
+       ResnetBlock add into the same channels, so they form a single group shared by all the blocks;
+    -- for UnetGenerator, the skip concatenations: the upsampling conv of a block reads the channels of its downsampling
+       conv followed by the output channels of its submodule, so both groups are sliced out of its input.
+The input and output channels of the generator are never pruned.
+
+Channels are ranked by the L1 norm of their filters ('l1'), the magnitude of their batchnorm scale ('bn'), or their
+mean absolute activation over calibration images ('activation'). The lowest ranked channels of every group are removed
+from the weights in place, so the optimizers of a model keep working for fine-tuning.
+
+A pruned network is saved with an architecture descriptor '<epoch>_net_<name>.json' next to its weights, which lists the
+channels of every conv and norm layer. <BaseModel.setup> resizes the layers of the default network to the descriptor
+before loading the weights, so test.py and train.py '--continue_train' rebuild the slimmer network.
+
+Example:
+    python scripts/prune_generator.py --dataroot ./datasets/maps --name maps_cyclegan --model cycle_gan --prune_ratio 0.5
+"""
+
+import json
+import torch
+import torch.nn as nn
+from . import networks
+
+
+CONV_LAYERS = (nn.Conv2d, nn.ConvTranspose2d)
+NORM_LAYERS = (nn.BatchNorm2d, nn.InstanceNorm2d)
+
+
+class ChannelGroup:
+    """A set of channels that are kept or removed together."""
+
+    def __init__(self, name, size, prunable=True):
+        self.name = name
+        self.size = size
+        self.prunable = prunable
+        self.producers = []  # convs whose output channels are the group
+        self.norms = []  # norm layers applied to the group
+        self.keep = list(range(size))
+
+
+def _is_depthwise(module):
+    return isinstance(module, nn.Conv2d) and module.groups > 1 and module.groups == module.in_channels == module.out_channels
+
+
+class _Tracer:
+    """Find the channel groups of a generator and the groups read and written by every layer."""
+
+    def __init__(self):
+        self.groups = []
+        self.layers = {}  # layer name -> (module, list of input groups, output group)
+
+    def new_group(self, name, size, prunable=True):
+        group = ChannelGroup(name, size, prunable)
+        self.groups.append(group)
+        return group
+
+    def add_conv(self, name, module, inputs, output):
+        self.layers[name] = (module, inputs, output)
+        if not _is_depthwise(module):
+            output.producers.append(module)
+
+    def chain(self, seq, prefix, current, out=None):
+        """Trace an nn.Sequential; the last dense conv writes to <out> if given. Return the group of the output."""
+        dense = [i for i, m in enumerate(seq) if isinstance(m, CONV_LAYERS) and not _is_depthwise(m)]
+        for i, module in enumerate(seq):
+            name = f"{prefix}.{i}"
+            if _is_depthwise(module):  # one filter per channel: keeps the group of its input
+                self.add_conv(name, module, [current], current)
+            elif isinstance(module, CONV_LAYERS):
+                output = out if (out is not None and i == dense[-1]) else self.new_group(name, module.out_channels)
+                self.add_conv(name, module, [current], output)
+                current = output
+            elif isinstance(module, NORM_LAYERS):
+                self.layers[name] = (module, [], current)
+                current.norms.append(module)
+            elif isinstance(module, networks.ResnetBlock):  # residual add: the block writes back to the trunk channels
+                self.chain(module.conv_block, f"{name}.conv_block", current, out=current)
+            elif isinstance(module, networks.UnetSkipConnectionBlock):
+                current = self.unet_block(module, name, current)
+        return current
+
+    def unet_block(self, block, prefix, current, out=None):
+        """Trace a UnetSkipConnectionBlock reading <current>; return the group written by its upsampling conv."""
+        down = up = None
+        up_inputs = None
+        for i, module in enumerate(block.model):
+            name = f"{prefix}.model.{i}"
+            if isinstance(module, nn.Conv2d):
+                down = self.new_group(name, module.out_channels)
+                self.add_conv(name, module, [current], down)
+            elif isinstance(module, networks.UnetSkipConnectionBlock):
+                up_inputs = [down, self.unet_block(module, name, down)]  # the submodule returns cat([x, up(x)])
+            elif isinstance(module, nn.ConvTranspose2d):
+                up = out if block.outermost else self.new_group(name, module.out_channels)
+                self.add_conv(name, module, up_inputs or [down], up)
+            elif isinstance(module, NORM_LAYERS):
+                group = up if up is not None else down
+                self.layers[name] = (module, [], group)
+                group.norms.append(module)
+        return up
+
+
+def trace_generator(net):
+    """Return the channel groups of a generator and the groups read and written by every conv and norm layer."""
+    tracer = _Tracer()
+    first = next(m for m in net.modules() if isinstance(m, CONV_LAYERS))
+    last = [m for m in net.modules() if isinstance(m, CONV_LAYERS)][-1]
+    input_group = tracer.new_group("input", first.in_channels, prunable=False)
+    output_group = tracer.new_group("output", last.out_channels, prunable=False)
+    if isinstance(net, networks.ResnetGenerator):
+        tracer.chain(net.model, "model", input_group, out=output_group)
+    elif isinstance(net, networks.UnetGenerator):
+        tracer.unet_block(net.model, "model", input_group, out=output_group)
+    else:
+        raise NotImplementedError(f"channel pruning is not implemented for [{type(net).__name__}]")
+    traced = {id(module) for module, _, _ in tracer.layers.values()}
+    if any(id(m) not in traced for m in net.modules() if isinstance(m, CONV_LAYERS)):  # e.g. the coupled channels of reversible blocks
+        raise NotImplementedError(f"channel pruning is not implemented for the blocks of this [{type(net).__name__}]")
+    return tracer.groups, tracer.layers
+
+
+class ActivationRecorder:
+    """Accumulate the mean absolute activation of the output channels of every conv of a network."""
+
+    def __init__(self, net):
+        self.stats = {}  # conv module -> per-channel sum of the mean absolute activations
+        self.handles = [m.register_forward_hook(self._hook) for m in net.modules() if isinstance(m, CONV_LAYERS)]
+
+    def _hook(self, module, input, output):
+        value = output.detach().abs().mean(dim=(0, 2, 3)).float().cpu()
+        self.stats[module] = self.stats.get(module, 0) + value
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+
+
+def _normalized(values):
+    return values / values.mean().clamp_min(1e-12)
+
+
+def channel_scores(group, criterion="l1", activations=None):
+    """Return the importance of every channel of a group; producers are normalized so that each has the same weight."""
+    scores = torch.zeros(group.size)
+    if criterion == "bn":
+        norms = [n for n in group.norms if isinstance(n, nn.BatchNorm2d) and n.affine]
+        if norms:
+            for norm in norms:
+                scores += _normalized(norm.weight.detach().abs().float().cpu())
+            return scores
+        criterion = "l1"  # no learned scales (e.g. instance norm): fall back to the filter norms
+    for conv in group.producers:
+        if criterion == "activation":
+            if activations is None or conv not in activations:
+                raise ValueError("the activation criterion needs the statistics of an ActivationRecorder")
+            value = activations[conv]
+        else:
+            weight = conv.weight.detach().abs().float().cpu()
+            value = weight.sum(dim=(0, 2, 3)) if isinstance(conv, nn.ConvTranspose2d) else weight.sum(dim=(1, 2, 3))
+        scores += _normalized(value)
+    return scores
+
+
+def _slice(tensor, dim, index):
+    return tensor.index_select(dim, torch.as_tensor(index, device=tensor.device)).clone()
+
+
+def _apply_keep(layers):
+    """Remove the channels that are not kept from the weights of every layer, in place."""
+    for module, inputs, output in layers.values():
+        out_index = output.keep
+        if isinstance(module, NORM_LAYERS):
+            for key in ("weight", "bias", "running_mean", "running_var"):
+                tensor = getattr(module, key, None)
+                if tensor is not None:
+                    tensor.data = _slice(tensor.data, 0, out_index)
+            module.num_features = len(out_index)
+            continue
+        if _is_depthwise(module):
+            module.weight.data = _slice(module.weight.data, 0, out_index)
+            module.in_channels = module.out_channels = module.groups = len(out_index)
+        else:
+            in_index, offset = [], 0
+            for group in inputs:  # concatenated inputs: slice every part
+                in_index += [offset + k for k in group.keep]
+                offset += group.size
+            out_dim, in_dim = (1, 0) if isinstance(module, nn.ConvTranspose2d) else (0, 1)
+            module.weight.data = _slice(_slice(module.weight.data, out_dim, out_index), in_dim, in_index)
+            module.in_channels, module.out_channels = len(in_index), len(out_index)
+        if module.bias is not None:
+            module.bias.data = _slice(module.bias.data, 0, out_index)
+
+
+def prune_generator(net, ratio=0.5, criterion="l1", activations=None):
+    """Remove the least important <ratio> of the channels of every prunable group of a generator, in place.
+
+    Parameters:
+        net (nn.Module)    -- a ResnetGenerator or UnetGenerator (including the mobile variants)
+        ratio (float)      -- the fraction of channels removed from every group
+        criterion (str)    -- how channels are ranked: l1 | bn | activation
+        activations (dict) -- the statistics of an ActivationRecorder, for the activation criterion
+
+    Return the number of parameters before and after pruning.
+    """
+    net = net.module if hasattr(net, "module") else net
+    num_before = sum(p.numel() for p in net.parameters())
+    groups, layers = trace_generator(net)
+    for group in groups:
+        if group.prunable:
+            num_keep = max(1, int(round(group.size * (1 - ratio))))
+            scores = channel_scores(group, criterion, activations)
+            group.keep = sorted(torch.topk(scores, num_keep).indices.tolist())
+    _apply_keep(layers)
+    net.pruned = True
+    return num_before, sum(p.numel() for p in net.parameters())
+
+
+def architecture_descriptor(net):
+    """Return the channels of every conv and norm layer of a network."""
+    layers = {}
+    for name, module in net.named_modules():
+        if isinstance(module, CONV_LAYERS):
+            layers[name] = {"in_channels": module.in_channels, "out_channels": module.out_channels, "groups": module.groups}
+        elif isinstance(module, NORM_LAYERS):
+            layers[name] = {"num_features": module.num_features}
+    return {"layers": layers}
+
+
+def save_architecture(net, path):
+    """Save the architecture descriptor of a pruned network."""
+    with open(path, "w") as f:
+        json.dump(architecture_descriptor(net), f, indent=1)
+
+
+def apply_architecture(net, descriptor):
+    """Resize the layers of a network to an architecture descriptor, in place; the weights must be loaded afterwards."""
+    for name, spec in descriptor["layers"].items():
+        module = net.get_submodule(name)
+        if isinstance(module, NORM_LAYERS):
+            n = spec["num_features"]
+            for key, value in (("weight", 1.0), ("bias", 0.0), ("running_mean", 0.0), ("running_var", 1.0)):
+                tensor = getattr(module, key, None)
+                if tensor is not None:
+                    tensor.data = torch.full((n,), value, dtype=tensor.dtype, device=tensor.device)
+            module.num_features = n
+            continue
+        module.in_channels, module.out_channels, module.groups = spec["in_channels"], spec["out_channels"], spec["groups"]
+        if isinstance(module, nn.ConvTranspose2d):
+            shape = (module.in_channels, module.out_channels // module.groups, *module.kernel_size)
+        else:
+            shape = (module.out_channels, module.in_channels // module.groups, *module.kernel_size)
+        module.weight.data = torch.empty(shape, dtype=module.weight.dtype, device=module.weight.device)
+        if module.bias is not None:
+            module.bias.data = torch.zeros(module.out_channels, dtype=module.bias.dtype, device=module.bias.device)
+    net.pruned = True
+
+
+def load_architecture(path):
+    """Read an architecture descriptor saved by <save_architecture>."""
+    with open(path) as f:
+        return json.load(f)
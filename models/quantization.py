@@ -0,0 +1,139 @@
+"""This module implements post-training static int8 quantization of generators for CPU inference.
+
+A float generator built by <networks.define_G> is traced with torch.fx, observers are inserted after every
+quantizable op, and a few images of the test set are run through it to calibrate the activation ranges.
+The calibrated graph is then converted to int8 kernels (x86 or ARM/qnnpack, depending on the CPU):
+    -- Conv2d / ConvTranspose2d run as quantized convolutions with per-channel int8 weights;
+    -- ReflectionPad2d / ReLU / LeakyReLU run directly on quantized tensors and keep the scale of their input;
+    -- InstanceNorm2d / BatchNorm2d run as quantized normalizations (BatchNorm is folded into the conv in eval mode);
+    -- Tanh uses fixed output quantization parameters for its [-1, 1] range;
+    -- the input is quantized and the output dequantized at the graph boundaries, so the quantized generator
+       takes and returns float tensors like the original one.
+
+The quantized weights are saved next to the float checkpoint as '<epoch>_net_G_int8.pth'. Every run compares the
+quantized outputs with the float ones on the calibration images (L1 and PSNR) and saves the result, with the calibration
+settings, to '<epoch>_net_G_int8.json', so a speedup is only approved with its accuracy. The quantized weights are reused
+as long as they are newer than the float checkpoint and were calibrated with the same settings ('--num_calibration',
+'--dataroot', '--phase', '--direction' and the quantized engine).
+
+Example:
+    python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --quantize
+"""
+
+import copy
+import json
+import math
+import warnings
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from . import networks
+
+
+def quantization_engine():
+    """Return the quantized kernel library of this CPU: 'x86' (fbgemm + onednn) or 'qnnpack' (ARM)."""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"no int8 CPU backend in this PyTorch build (supported engines: {engines})")
+
+
+def prepare_generator(net, example_input, engine=None):
+    """Trace a float generator and insert the observers that record its activation ranges."""
+    engine = engine or quantization_engine()
+    torch.backends.quantized.engine = engine
+    net = networks.to_contiguous_format(copy.deepcopy(net).cpu().eval())  # the int8 kernels choose their own layout
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # deprecation notices of the torch.ao.quantization API
+        return prepare_fx(net, get_default_qconfig_mapping(engine), (example_input.cpu(),))
+
+
+def quantize_generator(net, calibration_inputs, engine=None):
+    """Return an int8 copy of a float generator.
+
+    Parameters:
+        net (nn.Module)           -- the float generator; it is not modified
+        calibration_inputs (list) -- input batches covering the expected range of the images
+        engine (str)              -- the quantized kernel library; by default the best one for this CPU
+    """
+    prepared = prepare_generator(net, calibration_inputs[0], engine)
+    with torch.no_grad():
+        for input in calibration_inputs:
+            prepared(input.cpu())
+    return convert_fx(prepared)
+
+
+def load_quantized_generator(net, load_path, example_input, engine=None):
+    """Rebuild the int8 graph of a float generator and load quantized weights saved by <quantize_generator>."""
+    quantized = convert_fx(prepare_generator(net, example_input, engine))
+    quantized.load_state_dict(torch.load(load_path, map_location="cpu", weights_only=False))
+    return quantized
+
+
+def compare_outputs(reference, output):
+    """Return the mean L1 distance and the PSNR (dB) between two batches of generator outputs in [-1, 1]."""
+    reference, output = reference.float(), output.float()
+    mse = torch.mean(((reference - output) / 2) ** 2).item()  # on the [0, 1] scale of the saved images
+    return {"l1": torch.mean(torch.abs(reference - output)).item() / 2, "psnr": 10 * math.log10(1.0 / mse) if mse > 0 else float("inf")}
+
+
+def quantize_model(model, opt):
+    """Replace the generator of a test model with its int8 version; used by test.py with '--quantize'.
+
+    The generator is calibrated on its inputs from the first '--num_calibration' images of the test set, loaded with the
+    dataset of the model ('--dataset_mode', '--phase'). Quantized kernels run on the CPU, so the model is moved to the CPU.
+    """
+    from data import create_dataset
+
+    if not hasattr(model, "netG"):
+        raise ValueError(f"--quantize needs a model with a generator 'netG'; [{type(model).__name__}] has none")
+    if model.device.type != "cpu":
+        print("int8 inference runs on the CPU; moving the model to the CPU")
+        model.device = torch.device("cpu")
+    name = model.model_names[0]  # the loaded generator, e.g. G or G_A with '--model test --model_suffix _A'
+    net = model.netG.module if hasattr(model.netG, "module") else model.netG
+    net = net.cpu().eval()
+
+    # calibration images: the inputs of the generator, as set_input would pick them
+    calib_opt = copy.copy(opt)
+    calib_opt.batch_size, calib_opt.num_threads = 1, 0
+    calib_opt.serial_batches, calib_opt.max_dataset_size, calib_opt.num_shards = True, opt.num_calibration, 1
+    inputs = [data["B" if opt.direction == "BtoA" and "B" in data else "A"] for data in create_dataset(calib_opt)]
+    if len(inputs) == 0:
+        raise ValueError(f"no calibration image found in {opt.dataroot}")
+
+    load_suffix = f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch
+    float_path = model.save_dir / f"{load_suffix}_net_{name}.pth"
+    int8_path = model.save_dir / f"{load_suffix}_net_{name}_int8.pth"
+    report_path = model.save_dir / f"{load_suffix}_net_{name}_int8.json"
+    calibration = {"num_calibration": opt.num_calibration, "dataroot": str(opt.dataroot), "phase": opt.phase, "direction": opt.direction, "engine": quantization_engine()}
+    saved = {}
+    if report_path.exists():
+        with open(report_path) as f:
+            saved = json.load(f).get("calibration", {})
+    if int8_path.exists() and int8_path.stat().st_mtime >= float_path.stat().st_mtime and saved == calibration:
+        print(f"loading the int8 model from {int8_path}")
+        quantized = load_quantized_generator(net, int8_path, inputs[0], calibration["engine"])
+    else:
+        if int8_path.exists():
+            print(f"the int8 model {int8_path} is older than the float model or was calibrated with other settings ({saved})")
+        print(f"calibrating the int8 model on {len(inputs)} images")
+        quantized = quantize_generator(net, inputs, calibration["engine"])
+        torch.save(quantized.state_dict(), int8_path)
+        print(f"saved the int8 model to {int8_path}")
+
+    # accuracy of the int8 generator against the float one
+    with torch.no_grad():
+        scores = [compare_outputs(net(input), quantized(input)) for input in inputs]
+    report = {"num_images": len(inputs), "engine": torch.backends.quantized.engine, "calibration": calibration}
+    for metric in ("l1", "psnr"):
+        values = [s[metric] for s in scores]
+        report[f"{metric}_mean"] = sum(values) / len(values)
+        report[f"{metric}_worst"] = max(values) if metric == "l1" else min(values)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"int8 vs fp32 on {len(inputs)} images: L1 {report['l1_mean']:.4f} (worst {report['l1_worst']:.4f}), PSNR {report['psnr_mean']:.2f} dB (worst {report['psnr_worst']:.2f} dB)")
+
+    model.replace_network(name, quantized)
+    return report
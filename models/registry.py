@@ -0,0 +1,166 @@
+"""This module implements a registry of generators that serves many translation styles from a single process.
+
+Each style is an experiment directory 'checkpoints/<name>/' with a '<epoch>_net_G.pth' generator (see TestModel).
+Generators are loaded on demand through <models.create_model> and the most recently used ones are kept in memory;
+the least recently used style is evicted once '--max_cached_models' styles are cached or the cached weights
+exceed '--model_memory_budget' MB.
+
+Only the weights are cached per style. Styles with an identical architecture share one weight-less module
+(kept on the 'meta' device) that is run with <torch.func.functional_call>, so the (optionally compiled)
+graph of an architecture is built once and reused by all of its styles.
+
+Example:
+    >>> from models.registry import GeneratorRegistry
+    >>> registry = GeneratorRegistry(opt, max_models=4)
+    >>> registry.preload('styles.json')
+    >>> fake = registry.translate('horse2zebra_pretrained', real)
+"""
+
+import copy
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import torch
+from torch.func import functional_call
+from models.graph_optimizer import optimize_generator
+from models.pruning import architecture_descriptor
+
+
+# options that change the structure (not just the weights) of a generator
+ARCH_OPTIONS = ["netG", "input_nc", "output_nc", "ngf", "norm", "no_dropout", "eval", "optimize_graph"]
+
+
+def load_manifest(manifest_path):
+    """Read a style manifest.
+
+    The manifest is a JSON list. Each entry is either the name of an experiment in '--checkpoints_dir',
+    or a dict with a 'name' key and the options that differ from the command line for this style, e.g.
+        ["horse2zebra_pretrained", {"name": "facades_label2photo_pretrained", "netG": "unet_256", "norm": "batch"}]
+
+    Returns an ordered dict: style name -> dict of option overrides.
+    """
+    with open(manifest_path) as f:
+        entries = json.load(f)
+    styles = OrderedDict()
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        entry = dict(entry)
+        styles[entry.pop("name")] = entry
+    return styles
+
+
+class GeneratorRegistry:
+    """Load generators on demand and keep the hottest ones in memory with LRU eviction."""
+
+    def __init__(self, opt, max_models=8, memory_budget=0, compile=False, styles=None):
+        """Initialize the registry
+
+        Parameters:
+            opt (Option class)  -- the default options of every style; needs to be a subclass of TestOptions with '--model test'
+            max_models (int)    -- maximum number of styles kept in memory
+            memory_budget (int) -- maximum size (MB) of the cached weights; 0 means no limit
+            compile (bool)      -- compile the forward function of each architecture with torch.compile
+            styles (dict)       -- style name -> option overrides (see <load_manifest>); if given, only these styles can be loaded
+        """
+        self.opt = opt
+        self.max_models = max(1, max_models)
+        self.memory_budget = memory_budget * 1024 * 1024
+        self.compile = compile
+        self.styles = styles
+        self.cache = OrderedDict()  # style -> (state, arch key, #bytes, style options); most recently used last
+        self.graphs = {}  # arch key -> forward function shared by all the styles with this architecture
+        self.cached_bytes = 0
+        self.lock = threading.RLock()
+        self.hits = self.misses = self.evictions = 0
+
+    def style_options(self, style):
+        """Return the options of a style: the default options updated with its manifest overrides."""
+        if self.styles is not None:
+            if style not in self.styles:
+                raise KeyError(f"style [{style}] is not in the manifest")
+            overrides = self.styles[style]
+        else:
+            if Path(style).name != style or style.startswith("."):
+                raise KeyError(f"invalid style name [{style}]")
+            overrides = {}
+        opt = copy.copy(self.opt)
+        opt.name = style
+        for k, v in overrides.items():
+            setattr(opt, k, v)
+        return opt
+
+    def _load(self, style):
+        """Load the generator of a style through <create_model> and split it into its weights and its architecture."""
+        from models import create_model
+
+        opt = self.style_options(style)
+        if not (opt.checkpoints_dir and (Path(opt.checkpoints_dir) / style).is_dir()):
+            raise KeyError(f"style [{style}] has no checkpoint directory in {opt.checkpoints_dir}")
+        model = create_model(opt)
+        model.setup(opt)
+        if opt.eval:
+            model.eval()
+        net = model.netG
+        if getattr(opt, "optimize_graph", False):  # see models/graph_optimizer.py
+            example_input = torch.rand(1, opt.input_nc, 256, 256, device=opt.device) * 2 - 1
+            net = optimize_generator(net, example_input)
+        arch_key = tuple(getattr(opt, k) for k in ARCH_OPTIONS)
+        if getattr(net, "pruned", False):  # pruned styles only share the graph of a network with the same channels
+            arch_key += (json.dumps(architecture_descriptor(net), sort_keys=True),)
+        if arch_key not in self.graphs:
+            skeleton = copy.deepcopy(net).to("meta")
+
+            def forward(state, x, skeleton=skeleton):
+                return functional_call(skeleton, state, (x,))
+
+            self.graphs[arch_key] = torch.compile(forward) if self.compile else forward
+        state = {k: v.detach() for k, v in net.state_dict(keep_vars=True).items()}
+        nbytes = sum(v.numel() * v.element_size() for v in state.values())
+        return state, arch_key, nbytes, opt
+
+    def _evict(self, incoming_bytes):
+        """Drop least recently used styles until there is room for <incoming_bytes> more bytes and one more style."""
+        while len(self.cache) > 0 and (len(self.cache) >= self.max_models or (self.memory_budget > 0 and self.cached_bytes + incoming_bytes > self.memory_budget)):
+            style, (_, _, nbytes, _) = self.cache.popitem(last=False)
+            self.cached_bytes -= nbytes
+            self.evictions += 1
+            print(f"evicted style [{style}] from the generator cache")
+
+    def get(self, style):
+        """Return (forward function, weights, options) of a style, loading it if it is not cached."""
+        with self.lock:
+            if style in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(style)
+            else:
+                self.misses += 1
+                state, arch_key, nbytes, opt = self._load(style)
+                if self.memory_budget > 0 and nbytes > self.memory_budget:
+                    print(f"warning: style [{style}] ({nbytes / 2**20:.1f} MB) is larger than the memory budget")
+                self._evict(nbytes)
+                self.cache[style] = (state, arch_key, nbytes, opt)
+                self.cached_bytes += nbytes
+            state, arch_key, _, opt = self.cache[style]
+            return self.graphs[arch_key], state, opt
+
+    def translate(self, style, input):
+        """Run the generator of a style on a batch of images."""
+        forward, state, _ = self.get(style)
+        with torch.no_grad():
+            return forward(state, input)
+
+    def preload(self, manifest_path=None):
+        """Warm up the cache with the styles of a manifest (default: the registry's own styles), in order, as long as they fit."""
+        styles = list(load_manifest(manifest_path)) if manifest_path else list(self.styles or [self.opt.name])
+        for style in styles[: self.max_models]:
+            self.get(style)
+            if self.memory_budget > 0 and self.cached_bytes >= self.memory_budget:
+                break
+        print(f"preloaded {len(self.cache)} style(s): {list(self.cache)}")
+
+    def stats(self):
+        """Return the cache statistics as a dict."""
+        with self.lock:
+            return {"cached_styles": list(self.cache), "cached_mb": self.cached_bytes / 2**20, "architectures": len(self.graphs), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -30,14 +30,15 @@ class BaseOptions:
         parser.add_argument("--ngf", type=int, default=64, help="# of gen filters in the last conv layer")
         parser.add_argument("--ndf", type=int, default=64, help="# of discrim filters in the first conv layer")
         parser.add_argument("--netD", type=str, default="basic", help="specify discriminator architecture [basic | n_layers | pixel]. The basic model is a 70x70 PatchGAN. n_layers allows you to specify the layers in the discriminator")
-        parser.add_argument("--netG", type=str, default="resnet_9blocks", help="specify generator architecture [resnet_9blocks | resnet_6blocks | unet_256 | unet_128]")
+        parser.add_argument("--netG", type=str, default="resnet_9blocks", help="specify generator architecture [resnet_9blocks | resnet_6blocks | mobile_resnet_9blocks | mobile_resnet_6blocks | rev_resnet_9blocks | rev_resnet_6blocks | unet_256 | unet_128]")
         parser.add_argument("--n_layers_D", type=int, default=3, help="only used if netD==n_layers")
         parser.add_argument("--norm", type=str, default="instance", help="instance normalization or batch normalization [instance | batch | none | syncbatch]")
         parser.add_argument("--init_type", type=str, default="normal", help="network initialization [normal | xavier | kaiming | orthogonal]")
         parser.add_argument("--init_gain", type=float, default=0.02, help="scaling factor for normal, xavier and orthogonal.")
         parser.add_argument("--no_dropout", action="store_true", help="no dropout for the generator")
+        parser.add_argument("--memory_format", type=str, default="contiguous", choices=["contiguous", "channels_last"], help="memory format of the networks and their inputs; channels_last is faster for convs on recent CPUs (oneDNN) and tensor-core GPUs")
         # dataset parameters
-        parser.add_argument("--dataset_mode", type=str, default="unaligned", help="chooses how datasets are loaded. [unaligned | aligned | single | colorization]")
+        parser.add_argument("--dataset_mode", type=str, default="unaligned", help="chooses how datasets are loaded. [unaligned | aligned | single | colorization | synthetic]")
         parser.add_argument("--direction", type=str, default="AtoB", help="AtoB or BtoA")
         parser.add_argument("--serial_batches", action="store_true", help="if true, takes images in order to make batches, otherwise takes them randomly")
         parser.add_argument("--num_threads", default=4, type=int, help="# threads for loading data")
@@ -52,6 +53,12 @@ class BaseOptions:
         parser.add_argument("--epoch", type=str, default="latest", help="which epoch to load? set to latest to use latest cached model")
         parser.add_argument("--load_iter", type=int, default="0", help="which iteration to load? if load_iter > 0, the code will load models by iter_[load_iter]; otherwise, the code will load models by [epoch]")
         parser.add_argument("--verbose", action="store_true", help="if specified, print more debugging information")
+        parser.add_argument("--analyze_networks", action="store_true", help="if specified, print the MACs, activation memory and memory traffic of every network for a crop_size input at setup, and save their per-layer tables to [checkpoints_dir]/[name]/net_[name]_analysis.txt")
+        parser.add_argument("--seed", type=int, default=-1, help="if >= 0, seed the random number generators of python, numpy and torch (network initialization, data order, augmentation)")
+        parser.add_argument("--trace_layers", action="store_true", help="if specified, time the forward (and backward) pass of every layer of the networks, and save a report of the slowest layers and a Chrome trace to [checkpoints_dir]/[name]")
+        parser.add_argument("--trace_layers_skip", type=int, default=1, help="# of warm-up iterations (batches) before the layers are traced")
+        parser.add_argument("--trace_layers_iters", type=int, default=10, help="# of traced iterations (batches); 0 traces until the end of the run")
+        parser.add_argument("--trace_layers_top", type=int, default=20, help="# of the slowest layers in the report of --trace_layers")
         parser.add_argument("--suffix", default="", type=str, help="customized suffix: opt.name = opt.name + suffix: e.g., {model}_{netG}_size{load_size}")
         # wandb parameters
         parser.add_argument("--use_wandb", action="store_true", help="if specified, then init wandb logging")
@@ -59,24 +66,27 @@ class BaseOptions:
         self.initialized = True
         return parser
 
-    def gather_options(self):
+    def gather_options(self, args=None):
         """Initialize our parser with basic options(only once).
         Add additional model-specific and dataset-specific options.
         These options are defined in the <modify_commandline_options> function
         in model and dataset classes.
+
+        Parameters:
+            args (list) -- the command line arguments to parse; sys.argv by default
         """
         if not self.initialized:  # check if it has been initialized
             parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
             parser = self.initialize(parser)
 
         # get the basic options
-        opt, _ = parser.parse_known_args()
+        opt, _ = parser.parse_known_args(args)
 
         # modify model-related parser options
         model_name = opt.model
         model_option_setter = models.get_option_setter(model_name)
         parser = model_option_setter(parser, self.isTrain)
-        opt, _ = parser.parse_known_args()  # parse again with new defaults
+        opt, _ = parser.parse_known_args(args)  # parse again with new defaults
 
         # modify dataset-related parser options
         dataset_name = opt.dataset_mode
@@ -85,7 +95,7 @@ class BaseOptions:
 
         # save and return the parser
         self.parser = parser
-        return parser.parse_args()
+        return parser.parse_args(args)
 
     def print_options(self, opt):
         """Print and save options
@@ -0,0 +1,26 @@
+from .base_options import BaseOptions
+from .train_options import TrainOptions
+
+
+class PruneOptions(TrainOptions):
+    """This class includes options for pruning the generators of a trained model (scripts/prune_generator.py).
+
+    It also includes shared options defined in TrainOptions and BaseOptions; the training options are used by the fine-tuning.
+    """
+
+    def initialize(self, parser):
+        parser = TrainOptions.initialize(self, parser)  # define shared options
+        parser.add_argument('--prune_ratio', type=float, default=0.5, help='fraction of the channels removed from every prunable layer of the generators')
+        parser.add_argument('--prune_criterion', type=str, default='l1', help='how channels are ranked: l1 (filter norm) | bn (batchnorm scale; l1 for other norms) | activation (mean activation on calibration images)')
+        parser.add_argument('--num_calibration', type=int, default=32, help='# of training images used to rank channels with the activation criterion')
+        parser.add_argument('--finetune_iters', type=int, default=0, help='# of training iterations run on the pruned model before it is saved')
+        parser.add_argument('--pruned_name', type=str, default='', help='experiment the pruned model is saved to; defaults to [name]_pruned')
+        parser.set_defaults(continue_train=True)  # the trained networks are loaded from [checkpoints_dir]/[name]
+        return parser
+
+    def print_options(self, opt):
+        # save the options with the pruned model, not with the trained one
+        opt.pruned_name = opt.pruned_name or f'{opt.name}_pruned'
+        name, opt.name = opt.name, opt.pruned_name
+        BaseOptions.print_options(self, opt)
+        opt.name = name
@@ -0,0 +1,28 @@
+from .test_options import TestOptions
+
+
+class ServeOptions(TestOptions):
+    """This class includes options for the local HTTP inference server (serve.py).
+
+    It also includes shared options defined in TestOptions and BaseOptions.
+    """
+
+    def initialize(self, parser):
+        parser = TestOptions.initialize(self, parser)  # define shared options
+        # the server receives its images over HTTP, so no dataset folder is needed
+        for action in parser._actions:
+            if action.dest == 'dataroot':
+                action.required = False
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='address the server listens on')
+        parser.add_argument('--port', type=int, default=8000, help='port the server listens on')
+        parser.add_argument('--max_batch_size', type=int, default=8, help='maximum number of requests grouped into one forward pass')
+        parser.add_argument('--max_batch_wait', type=float, default=10.0, help='maximum time (ms) a worker waits for a batch to fill up after its first request')
+        parser.add_argument('--num_workers', type=int, default=1, help='number of inference worker processes')
+        parser.add_argument('--threads_per_worker', type=int, default=0, help='# of intra-op CPU threads per worker; 0 splits the available cores evenly across workers')
+        parser.add_argument('--request_timeout', type=float, default=60.0, help='seconds a request may wait for its result before the server answers 504')
+        # generator cache; see models/registry.py
+        parser.add_argument('--styles_manifest', type=str, default='', help='JSON list of the experiments (styles) that can be requested with POST /translate/<style>; they are preloaded in order')
+        parser.add_argument('--max_cached_models', type=int, default=8, help='maximum number of generators kept in memory by each worker')
+        parser.add_argument('--model_memory_budget', type=int, default=0, help='maximum size (MB) of the generator weights cached by each worker; 0 means no limit')
+        parser.set_defaults(phase='serve')
+        return parser
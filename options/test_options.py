@@ -15,6 +15,26 @@ class TestOptions(BaseOptions):
         # Dropout and Batchnorm has different behavioir during training and test.
         parser.add_argument('--eval', action='store_true', help='use eval mode during test time.')
         parser.add_argument('--num_test', type=int, default=50, help='how many test images to run')
+        parser.add_argument('--num_procs', type=int, default=1, help='split the test images into disjoint shards processed by this many local processes')
+        parser.add_argument('--threads_per_proc', type=int, default=0, help='# of intra-op CPU threads per process when sharding; 0 splits the available cores evenly')
+        parser.add_argument('--cache', action='store_true', help='skip the images whose results are already saved for the same input, checkpoint and options; keeps a manifest in the result directory so interrupted runs resume')
+        parser.add_argument('--num_save_threads', type=int, default=2, help='# threads for encoding and saving result images while the next batch runs; 0 saves them synchronously')
+        # tiled inference for large images; see util/tiling.py
+        parser.add_argument('--tile_size', type=int, default=0, help='translate full-resolution images in square tiles of this size (a valid input size of netG); 0 disables tiling')
+        parser.add_argument('--tile_overlap', type=int, default=32, help='# of pixels shared by neighbouring tiles, blended with a linear ramp to hide seams')
+        parser.add_argument('--tile_batch_size', type=int, default=4, help='# of tiles per forward pass')
+        # int8 inference; see models/quantization.py
+        parser.add_argument('--quantize', action='store_true', help='run the generator with static int8 CPU kernels; the quantized weights are saved next to the checkpoint')
+        parser.add_argument('--num_calibration', type=int, default=32, help='# of test images used to calibrate the int8 activation ranges')
+        # eval-time graph rewrite; see models/graph_optimizer.py
+        parser.add_argument('--optimize_graph', action='store_true', help='fold eval-mode batchnorm and padding layers into the convs of the generators and drop dropout; checked against the original graph')
+        parser.add_argument('--compile', action='store_true', help='compile the generators with torch.compile, which also fuses activations into the convs')
+        # reduced precision; see models/precision.py
+        parser.add_argument('--infer_dtype', type=str, default='fp32', choices=['fp32', 'bf16', 'fp16'], help='precision of the generator weights and activations; normalization layers always run in fp32')
+        parser.add_argument('--precision_check', type=int, default=4, help='# of batches also translated in fp32 to report the output differences of --infer_dtype')
+        # inference backend; see models/onnx_export.py
+        parser.add_argument('--backend', type=str, default='pytorch', choices=['pytorch', 'onnxruntime'], help='run the generators with PyTorch, or export them to ONNX and run them with ONNX Runtime on the CPU')
+        parser.add_argument('--ort_threads', type=int, default=0, help='# of intra-op threads of ONNX Runtime; 0 uses all the cores')
         # rewrite devalue values
         parser.set_defaults(model='test')
         # To avoid cropping, the load_size should be the same as crop_size
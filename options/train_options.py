@@ -30,6 +30,22 @@ class TrainOptions(BaseOptions):
         parser.add_argument('--pool_size', type=int, default=50, help='the size of image buffer that stores previously generated images')
         parser.add_argument('--lr_policy', type=str, default='linear', help='learning rate policy. [linear | step | plateau | cosine]')
         parser.add_argument('--lr_decay_iters', type=int, default=50, help='multiply by a gamma every lr_decay_iters iterations')
+        # automatic batch size parameters
+        parser.add_argument('--auto_batch', action='store_true', help='before training, search the batch size (or crop size) that fits --auto_batch_memory with trial steps on random images, and train with it; see util/auto_batch.py')
+        parser.add_argument('--auto_batch_target', type=str, default='batch_size', help='what --auto_batch searches [batch_size | crop_size]. batch_size: the fastest batch size (images/s) that fits at --crop_size; crop_size: the largest crop size that fits at --batch_size, up to --load_size')
+        parser.add_argument('--auto_batch_memory', type=float, default=0, help='memory budget (MB) of --auto_batch; 0: 90%% of the free GPU memory, or of the available host memory on the CPU')
+        parser.add_argument('--auto_batch_max', type=int, default=64, help='largest batch size tried by --auto_batch')
+        parser.add_argument('--auto_batch_steps', type=int, default=3, help='# of measured trial steps per configuration of --auto_batch')
+        # data loader tuning parameters
+        parser.add_argument('--auto_workers', action='store_true', help='tune the # of data loading workers (--num_threads), their prefetch depth and, on the CPU, the intra-op threads of torch from the measured data-wait time; changes are applied at the start of an epoch and logged to loss_log.txt')
+        parser.add_argument('--auto_workers_window', type=int, default=50, help='# of iterations measured for every configuration of --auto_workers')
+        parser.add_argument('--auto_workers_max', type=int, default=0, help='largest # of workers tried by --auto_workers; 0: the # of CPU cores')
+        # profiling parameters
+        parser.add_argument('--profile', action='store_true', help='measure the time of every phase of the training iterations (set_input, forward, backward_*, optimizer steps, ...) and save its p50/p95/max every <print_freq> iterations; see util/profiler.py')
+        parser.add_argument('--profile_window', type=int, default=100, help='# of iterations of the rolling statistics of --profile')
+        parser.add_argument('--profile_memory', action='store_true', help='record the memory after every phase of the training iterations, and report how it splits into activations, parameters, gradients, optimizer state and image pools at the end of the first epoch')
+        parser.add_argument('--profile_trace_iter', type=int, default=0, help='if > 0, save a torch.profiler trace of the iterations after this iteration')
+        parser.add_argument('--profile_trace_steps', type=int, default=5, help='# of iterations in the torch.profiler trace')
 
         self.isTrain = True
         return parser
@@ -0,0 +1,55 @@
+"""Estimate the MACs, activation memory and memory traffic of the generators and discriminators, layer by layer.
+
+For every combination of '--netG' / '--netD' and '--crop_sizes', a summary line is printed; with '--table', the
+per-layer table is printed as well, with the totals per layer type and per block (see models/analysis.py). With the
+peak compute rate '--gflops' and memory bandwidth '--bandwidth' of a device, the table also gives a roofline estimate
+of the time of every layer. Use it to compare architectures against a latency budget before training.
+
+Example:
+    python scripts/analyze_networks.py --netG resnet_9blocks,mobile_resnet_9blocks,unet_256 --netD basic --crop_sizes 256,512
+    python scripts/analyze_networks.py --netG resnet_9blocks --netD "" --crop_sizes 1024 --table --gflops 500 --bandwidth 50
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import networks
+from models.analysis import analyze_network, format_analysis, summary_line
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="estimate the compute and memory costs of the networks", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--netG", type=str, default="resnet_9blocks,resnet_6blocks,mobile_resnet_9blocks,rev_resnet_9blocks,unet_256", help="comma-separated list of generators")
+    parser.add_argument("--netD", type=str, default="basic,pixel", help="comma-separated list of discriminators")
+    parser.add_argument("--crop_sizes", type=str, default="256", help="comma-separated list of input sizes")
+    parser.add_argument("--batch_size", type=int, default=1, help="input batch size")
+    parser.add_argument("--input_nc", type=int, default=3, help="# of input image channels")
+    parser.add_argument("--output_nc", type=int, default=3, help="# of output image channels")
+    parser.add_argument("--ngf", type=int, default=64, help="# of gen filters in the last conv layer")
+    parser.add_argument("--ndf", type=int, default=64, help="# of discrim filters in the first conv layer")
+    parser.add_argument("--n_layers_D", type=int, default=3, help="only used if netD==n_layers")
+    parser.add_argument("--norm", type=str, default="instance", help="instance normalization or batch normalization [instance | batch | none]")
+    parser.add_argument("--table", action="store_true", help="print the per-layer tables")
+    parser.add_argument("--gflops", type=float, default=0, help="peak compute rate of the device (GFLOP/s) for the roofline estimate")
+    parser.add_argument("--bandwidth", type=float, default=0, help="memory bandwidth of the device (GB/s) for the roofline estimate")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    nets = [(netG, lambda netG=netG: networks.define_G(args.input_nc, args.output_nc, args.ngf, netG, args.norm), args.input_nc) for netG in args.netG.split(",") if netG]
+    nets += [(netD, lambda netD=netD: networks.define_D(args.output_nc, args.ndf, netD, args.n_layers_D, args.norm), args.output_nc) for netD in args.netD.split(",") if netD]
+    for crop_size in [int(s) for s in args.crop_sizes.split(",") if s]:
+        for name, define, channels in nets:
+            input_shape = (args.batch_size, channels, crop_size, crop_size)
+            try:
+                rows = analyze_network(define(), input_shape)
+            except (RuntimeError, ValueError) as error:  # e.g. a U-Net with an input smaller than its depth
+                print(f"[Network {name}] {crop_size}px: not applicable ({str(error).splitlines()[0]})")
+                continue
+            if args.table:
+                print(format_analysis(rows, args.gflops, args.bandwidth))
+            print(summary_line(name, rows, input_shape))
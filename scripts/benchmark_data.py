@@ -0,0 +1,186 @@
+"""Measure the throughput of the data pipeline (create_dataset) for every dataset mode and preprocessing.
+
+For every '--dataset_modes' x '--preprocess' x '--batch_sizes' combination:
+    -- the time of every stage of a batch is measured in the main process:
+         decode    (reading and decoding the image files),
+         transform (get_transform and the conversions of the dataset, e.g. rgb2lab for colorization),
+         collate   (stacking the samples into a batch),
+         ipc       (moving a batch from a worker to the main process: shared memory and pickling);
+    -- the images per second of the real loader (create_dataset, as in train.py) are measured for every '--num_threads'.
+The images are synthetic (smooth random images of '--resolution', saved as '--image_format'), generated once in
+'--data_dir' in the folder layout of every dataset mode, so the benchmark runs without any dataset.
+
+With '--step_time', the time of a training step per batch (e.g. measured by scripts/benchmark_networks.py), every loader
+configuration is marked as loader-bound when it produces batches slower than the model consumes them.
+
+Example:
+    python scripts/benchmark_data.py --dataset_modes unaligned,aligned --num_threads 0,2,4,8 --batch_sizes 1,4 --step_time 250 --output data.json
+"""
+
+import sys
+import argparse
+import pickle
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import torch
+from multiprocessing.reduction import ForkingPickler
+from PIL import Image
+from torch.utils.data import default_collate
+from data import create_dataset
+from options.train_options import TrainOptions
+from util.benchmark import save_results, summarize
+
+
+DATASET_MODES = ["unaligned", "aligned", "single", "colorization", "synthetic"]  # synthetic: the cost of the loader alone
+PREPROCESS_MODES = ["resize_and_crop", "crop", "scale_width", "scale_width_and_crop", "none"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="measure the throughput of the data pipeline", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--dataset_modes", type=str, default=",".join(DATASET_MODES), help="comma-separated list of dataset modes")
+    parser.add_argument("--preprocess", type=str, default=",".join(PREPROCESS_MODES), help="comma-separated list of preprocessing modes")
+    parser.add_argument("--batch_sizes", type=str, default="1,4", help="comma-separated list of batch sizes")
+    parser.add_argument("--num_threads", type=str, default="0,2,4", help="comma-separated list of loader worker counts")
+    parser.add_argument("--load_size", type=int, default=286, help="scale images to this size")
+    parser.add_argument("--crop_size", type=int, default=256, help="then crop to this size")
+    parser.add_argument("--data_dir", type=str, default="./datasets/benchmark_data", help="folder of the synthetic images; they are generated if missing")
+    parser.add_argument("--num_images", type=int, default=64, help="# of synthetic images per folder")
+    parser.add_argument("--resolution", type=int, default=512, help="width and height of the synthetic images")
+    parser.add_argument("--image_format", type=str, default="jpg", help="file format of the synthetic images [jpg | png]")
+    parser.add_argument("--num_batches", type=int, default=20, help="# of measured batches per configuration")
+    parser.add_argument("--step_time", type=float, default=0, help="time (ms) of a training step per batch; loader configurations slower than this are loader-bound")
+    parser.add_argument("--output", type=str, default="", help="save the results to this JSON file")
+    return parser.parse_args()
+
+
+def csv(value, type=str):
+    return [type(v) for v in value.split(",") if v]
+
+
+def synthetic_image(size, rng):
+    """Return a smooth random RGB image; natural images compress (and decode) more like it than like noise."""
+    coarse = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize(size, Image.BICUBIC)
+    noise = rng.normal(0, 8, (size[1], size[0], 3))
+    return Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8))
+
+
+def make_synthetic_data(args):
+    """Generate the folders of every dataset mode once and return the dataroot of every mode."""
+    root = Path(args.data_dir) / f"{args.resolution}px_{args.num_images}_{args.image_format}"
+    size = (args.resolution, args.resolution)
+    folders = {"trainA": size, "trainB": size, "train_aligned": (2 * args.resolution, args.resolution)}  # aligned images are A and B side by side
+    rng = np.random.default_rng(0)
+    for folder, folder_size in folders.items():
+        path = root / folder
+        if path.is_dir() and len(list(path.iterdir())) >= args.num_images:
+            continue
+        path.mkdir(parents=True, exist_ok=True)
+        print(f"generating {args.num_images} synthetic images in {path}")
+        for i in range(args.num_images):
+            synthetic_image(folder_size, rng).save(path / f"{i:05d}.{args.image_format}", quality=90)
+    aligned = root / "aligned"
+    aligned.mkdir(exist_ok=True)
+    if not (aligned / "train").exists():  # aligned and colorization datasets read [dataroot]/[phase]
+        (aligned / "train").symlink_to((root / "train_aligned").resolve(), target_is_directory=True)
+    colorization = root / "colorization"
+    colorization.mkdir(exist_ok=True)
+    if not (colorization / "train").exists():
+        (colorization / "train").symlink_to((root / "trainA").resolve(), target_is_directory=True)
+    return {"unaligned": root, "aligned": aligned, "single": root / "trainA", "colorization": colorization, "synthetic": root}
+
+
+def data_options(dataroot, dataset_mode, preprocess, batch_size, num_threads, args):
+    """Return the training options of a loader configuration, without printing or saving them."""
+    argv = ["--dataroot", str(dataroot), "--dataset_mode", dataset_mode, "--preprocess", preprocess, "--batch_size", str(batch_size), "--num_threads", str(num_threads), "--load_size", str(args.load_size), "--crop_size", str(args.crop_size), "--serial_batches"]
+    if dataset_mode == "colorization":
+        argv += ["--model", "colorization"]
+    opt = TrainOptions().gather_options(argv)
+    opt.isTrain = True
+    return opt
+
+
+def ipc_time(batch):
+    """Return the time to pass a batch from a DataLoader worker to the main process.
+
+    A worker collates the batch directly in shared memory; the batch is then pickled with the handles of its shared
+    memory and unpickled (mapped) by the main process.
+    """
+    shared = {k: v.clone().share_memory_() if torch.is_tensor(v) else v for k, v in batch.items()}
+    start = time.perf_counter()
+    pickle.loads(ForkingPickler.dumps(shared))
+    return time.perf_counter() - start
+
+
+def stage_times(dataset, batch_size, num_batches):
+    """Return the mean time (ms) per batch of every stage, measured in the main process."""
+    times = {"decode": [], "transform": [], "collate": [], "ipc": []}
+    dataset[0]  # warm up the lazy imports and caches of the transforms
+    for b in range(num_batches):
+        samples, decode, total = [], 0.0, 0.0
+        for i in range(b * batch_size, (b + 1) * batch_size):
+            index = i % len(dataset)
+            start = time.perf_counter()
+            for path in dataset.get_input_paths(index) or []:
+                Image.open(path).convert("RGB")
+            decode += time.perf_counter() - start
+            start = time.perf_counter()
+            samples.append(dataset[index])  # decodes again, then transforms
+            total += time.perf_counter() - start
+        times["decode"].append(decode)
+        times["transform"].append(max(total - decode, 0.0))
+        start = time.perf_counter()
+        batch = default_collate(samples)
+        times["collate"].append(time.perf_counter() - start)
+        times["ipc"].append(ipc_time(batch))
+    return {f"{stage}_ms": float(np.mean(values)) * 1000 for stage, values in times.items()}
+
+
+def loader_times(opt, num_batches):
+    """Return the time to the first batch and the durations of the next <num_batches> batches of create_dataset."""
+    start = time.perf_counter()
+    loader = create_dataset(opt).dataloader
+
+    def batches():
+        while True:
+            yield from loader  # a new epoch restarts the workers, like in train.py
+
+    batch_iter = batches()
+    next(batch_iter)
+    first = time.perf_counter() - start
+    times = []
+    for i in range(num_batches):
+        start = time.perf_counter()
+        next(batch_iter)
+        times.append(time.perf_counter() - start)
+    return first, times
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    dataroots = make_synthetic_data(args)
+    results = {}
+    for dataset_mode in csv(args.dataset_modes):
+        for preprocess in csv(args.preprocess):
+            for batch_size in csv(args.batch_sizes, int):
+                opt = data_options(dataroots[dataset_mode], dataset_mode, preprocess, batch_size, 0, args)
+                stages = stage_times(create_dataset(opt).dataset, batch_size, args.num_batches)
+                print(f"{dataset_mode}/{preprocess}/b{batch_size} per batch: " + ", ".join(f"{k[:-3]} {v:.1f} ms" for k, v in stages.items()))
+                for num_threads in csv(args.num_threads, int):
+                    opt = data_options(dataroots[dataset_mode], dataset_mode, preprocess, batch_size, num_threads, args)
+                    first, times = loader_times(opt, args.num_batches)
+                    key = f"{dataset_mode}/{preprocess}/b{batch_size}/w{num_threads}"
+                    result = dict(summarize(times, batch_size), first_batch_ms=first * 1000, **stages)
+                    result["config"] = {"dataset_mode": dataset_mode, "preprocess": preprocess, "batch_size": batch_size, "num_threads": num_threads, "resolution": args.resolution, "image_format": args.image_format}
+                    message = f"{key:<45} {result['throughput']:8.1f} images/s, {result['latency_ms']:7.1f} ms per batch (first batch {first * 1000:.0f} ms)"
+                    if args.step_time > 0:
+                        result["loader_bound"] = result["latency_ms"] > args.step_time
+                        message += ", loader-bound" if result["loader_bound"] else ", compute-bound"
+                    print(message)
+                    results[key] = result
+    if args.output:
+        save_results(args.output, results)
@@ -0,0 +1,103 @@
+"""Compare the speed of generators and discriminators in the contiguous (NCHW) and channels_last memory formats.
+
+Every network is converted like with '--memory_format channels_last' (see <networks.to_channels_last>) and timed on a
+training step (forward and backward) or an inference forward pass. The discriminators are fed like in the models: the
+conditional concatenation of pix2pix followed by the ImagePool of CycleGAN. The number of conv layers whose input is not
+in channels_last order (a silent conversion back to NCHW) is also reported; it should be 0.
+
+Example:
+    python scripts/benchmark_memory_format.py --netG resnet_9blocks,unet_256 --netD basic --crop_size 256 --batch_size 4
+"""
+
+import sys
+import argparse
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import torch
+import torch.nn as nn
+from models import networks
+from util.image_pool import ImagePool
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="measure the speed of the networks in the NCHW and channels_last memory formats", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--netG", type=str, default="resnet_9blocks,mobile_resnet_9blocks,unet_256", help="comma-separated list of generators")
+    parser.add_argument("--netD", type=str, default="basic,pixel", help="comma-separated list of discriminators")
+    parser.add_argument("--norm", type=str, default="instance", help="instance normalization or batch normalization [instance | batch | none]")
+    parser.add_argument("--ngf", type=int, default=64, help="# of gen filters in the last conv layer")
+    parser.add_argument("--ndf", type=int, default=64, help="# of discrim filters in the first conv layer")
+    parser.add_argument("--crop_size", type=int, default=256, help="input image size")
+    parser.add_argument("--batch_size", type=int, default=1, help="input batch size")
+    parser.add_argument("--mode", type=str, default="train", choices=["train", "test"], help="time a training step (forward and backward) or an inference forward pass")
+    parser.add_argument("--steps", type=int, default=5, help="# of measured steps")
+    parser.add_argument("--warmup", type=int, default=2, help="# of steps before measuring")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu", help="device to run on")
+    return parser.parse_args()
+
+
+def count_fallbacks(net, make_input):
+    """Return the number of convs whose input is not in channels_last order."""
+    fallbacks = []
+
+    def hook(module, input, output):
+        if not input[0].is_contiguous(memory_format=torch.channels_last):
+            fallbacks.append(module)
+
+    handles = [m.register_forward_hook(hook) for m in net.modules() if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d))]
+    with torch.no_grad():
+        net(make_input())
+    for handle in handles:
+        handle.remove()
+    return len(fallbacks)
+
+
+def benchmark(net, make_input, args):
+    """Return the median time of a step and the number of NCHW fallbacks."""
+    device = torch.device(args.device)
+    times = []
+    for i in range(args.warmup + args.steps):
+        input = make_input()
+        start = time.perf_counter()
+        if args.mode == "train":
+            net.zero_grad()
+            net(input).mean().backward()
+        else:
+            with torch.no_grad():
+                net(input)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        if i >= args.warmup:
+            times.append(time.perf_counter() - start)
+    fallbacks = count_fallbacks(net, make_input) if next(net.parameters()).is_contiguous(memory_format=torch.channels_last) else 0
+    return float(np.median(times)), fallbacks
+
+
+def networks_to_compare(args):
+    """Yield (description, network builder, input builder) for every network."""
+    size = (args.batch_size, 3, args.crop_size, args.crop_size)
+    for netG in args.netG.split(","):
+        yield f"G {netG}", lambda netG=netG: networks.define_G(3, 3, args.ngf, netG, args.norm), lambda fmt: torch.rand(size, device=args.device).to(memory_format=fmt)
+    for netD in args.netD.split(","):
+        pool = ImagePool(50)
+
+        def make_input(fmt):  # conditional input of pix2pix, through the ImagePool of CycleGAN
+            real_A, fake_B = (torch.rand(size, device=args.device).to(memory_format=fmt) for _ in range(2))
+            return pool.query(torch.cat((real_A, fake_B), 1))
+
+        yield f"D {netD}", lambda netD=netD: networks.define_D(6, args.ndf, netD, norm=args.norm), make_input
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    torch.backends.cudnn.benchmark = True
+    print(f"{args.mode} step, batch {args.batch_size}, crop {args.crop_size}, norm {args.norm}, device {args.device}")
+    for description, make_net, make_input in networks_to_compare(args):
+        net = make_net().to(args.device).train(args.mode == "train")
+        time_nchw, _ = benchmark(net, lambda: make_input(torch.contiguous_format), args)
+        networks.to_channels_last(net)
+        time_cl, fallbacks = benchmark(net, lambda: make_input(torch.channels_last), args)
+        print(f"{description:>26}: NCHW {time_nchw * 1000:8.1f} ms, channels_last {time_cl * 1000:8.1f} ms ({time_nchw / time_cl:.2f}x speedup), {fallbacks} NCHW fallbacks")
@@ -0,0 +1,147 @@
+"""Microbenchmarks of the generators and discriminators, with a comparison against stored baselines.
+
+'run' measures the latency and throughput of every combination of '--netG' / '--netD' / '--norm' (all the
+architectures of networks.define_G / define_D by default), '--batch_sizes', '--crop_sizes' and '--num_threads':
+    -- forward:  an inference forward pass (eval mode, no gradients)
+    -- backward: a training forward and backward pass
+    -- optimize: a full <optimize_parameters> step of '--models' (e.g. cycle_gan: 2 generators and 2 discriminators)
+                 for every netG x netD x norm combination, on random images
+The results are saved to '--output' (see util/benchmark.py for the format).
+
+'compare' flags the configurations of a result file that are slower than a baseline by more than '--tolerance',
+and exits with status 1 if there is any regression.
+
+Example:
+    python scripts/benchmark_networks.py run --netG resnet_9blocks,unet_256 --norm instance --batch_sizes 1,4 --output baseline.json
+    python scripts/benchmark_networks.py run --netG resnet_9blocks,unet_256 --norm instance --batch_sizes 1,4 --output current.json
+    python scripts/benchmark_networks.py compare baseline.json current.json --tolerance 0.1
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch
+from models import networks, create_model
+from options.train_options import TrainOptions
+from util.benchmark import compare_results, load_results, print_comparison, save_results, summarize, time_function
+
+
+GENERATORS = ["resnet_9blocks", "resnet_6blocks", "mobile_resnet_9blocks", "mobile_resnet_6blocks", "rev_resnet_9blocks", "rev_resnet_6blocks", "unet_128", "unet_256"]
+DISCRIMINATORS = ["basic", "n_layers", "pixel"]
+MIN_SIZES = {"unet_128": 128, "unet_256": 256}  # the U-Nets downsample to 1x1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark the generators and discriminators", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="measure and save the results", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    run.add_argument("--netG", type=str, default=",".join(GENERATORS), help="comma-separated list of generators")
+    run.add_argument("--netD", type=str, default=",".join(DISCRIMINATORS), help="comma-separated list of discriminators")
+    run.add_argument("--norm", type=str, default="instance,batch,none", help="comma-separated list of normalization layers")
+    run.add_argument("--modes", type=str, default="forward,backward,optimize", help="comma-separated list of measurements [forward | backward | optimize]")
+    run.add_argument("--models", type=str, default="cycle_gan", help="comma-separated list of models for the optimize measurement [cycle_gan | pix2pix]")
+    run.add_argument("--batch_sizes", type=str, default="1", help="comma-separated list of batch sizes")
+    run.add_argument("--crop_sizes", type=str, default="256", help="comma-separated list of image sizes")
+    run.add_argument("--num_threads", type=str, default=str(torch.get_num_threads()), help="comma-separated list of intra-op thread counts")
+    run.add_argument("--ngf", type=int, default=64, help="# of gen filters in the last conv layer")
+    run.add_argument("--ndf", type=int, default=64, help="# of discrim filters in the first conv layer")
+    run.add_argument("--warmup", type=int, default=2, help="# of runs before measuring")
+    run.add_argument("--repeat", type=int, default=10, help="# of measured runs")
+    run.add_argument("--device", type=str, default="cpu", help="device to run on")
+    run.add_argument("--output", type=str, default="benchmark_networks.json", help="JSON file the results are saved to")
+    compare = commands.add_parser("compare", help="compare a result file with a baseline", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    compare.add_argument("baseline", type=str, help="baseline result file")
+    compare.add_argument("current", type=str, help="current result file")
+    compare.add_argument("--metric", type=str, default="latency_ms", help="compared metric [latency_ms | p90_ms | min_ms | throughput]")
+    compare.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown accepted before a configuration is a regression")
+    return parser.parse_args()
+
+
+def csv(value, type=str):
+    return [type(v) for v in value.split(",") if v]
+
+
+def bench_network(net, input, mode, args):
+    """Return the durations of a forward (inference) or forward+backward (training) pass of a network."""
+    if mode == "forward":
+        net.eval()
+
+        def step():
+            with torch.no_grad():
+                net(input.clone())  # some generators modify their input in place
+
+    else:
+        net.train()
+
+        def step():
+            net.zero_grad(set_to_none=True)
+            net(input.clone()).mean().backward()
+
+    return time_function(step, args.warmup, args.repeat, args.device)
+
+
+def bench_model(model_name, netG, netD, norm, batch_size, crop_size, args):
+    """Return the durations of the <optimize_parameters> step of a model on random images."""
+    argv = ["--dataroot", "unused", "--model", model_name, "--netG", netG, "--netD", netD, "--norm", norm, "--ngf", str(args.ngf), "--ndf", str(args.ndf), "--batch_size", str(batch_size), "--crop_size", str(crop_size)]
+    opt = TrainOptions().gather_options(argv)
+    opt.isTrain, opt.device = True, torch.device(args.device)
+    model = create_model(opt)
+    for name in model.model_names:  # <setup> without loading, printing and schedulers
+        net = getattr(model, "net" + name)
+        networks.init_weights(net, opt.init_type, opt.init_gain)
+        net.to(opt.device)
+    data = {"A": torch.rand(batch_size, opt.input_nc, crop_size, crop_size) * 2 - 1, "B": torch.rand(batch_size, opt.output_nc, crop_size, crop_size) * 2 - 1, "A_paths": ["A"] * batch_size, "B_paths": ["B"] * batch_size}
+
+    def step():
+        model.set_input(data)
+        model.optimize_parameters()
+
+    return time_function(step, args.warmup, args.repeat, args.device)
+
+
+def configurations(args):
+    """Yield (key, config, function returning the durations) for every measured configuration."""
+    modes = csv(args.modes)
+    for threads in csv(args.num_threads, int):
+        for crop_size in csv(args.crop_sizes, int):
+            for batch_size in csv(args.batch_sizes, int):
+                size = f"b{batch_size}/{crop_size}px/t{threads}"
+                shape = (batch_size, 3, crop_size, crop_size)
+                for norm in csv(args.norm):
+                    for mode in [m for m in modes if m != "optimize"]:
+                        for netG in csv(args.netG):
+                            if crop_size >= MIN_SIZES.get(netG, 4):
+                                config = {"net": "G", "arch": netG, "norm": norm, "mode": mode, "batch_size": batch_size, "crop_size": crop_size, "num_threads": threads}
+                                yield f"G/{netG}/{norm}/{mode}/{size}", config, lambda netG=netG, norm=norm, mode=mode: bench_network(networks.define_G(3, 3, args.ngf, netG, norm).to(args.device), torch.rand(shape, device=args.device) * 2 - 1, mode, args)
+                        for netD in csv(args.netD):
+                            config = {"net": "D", "arch": netD, "norm": norm, "mode": mode, "batch_size": batch_size, "crop_size": crop_size, "num_threads": threads}
+                            yield f"D/{netD}/{norm}/{mode}/{size}", config, lambda netD=netD, norm=norm, mode=mode: bench_network(networks.define_D(3, args.ndf, netD, norm=norm).to(args.device), torch.rand(shape, device=args.device) * 2 - 1, mode, args)
+                    if "optimize" in modes:
+                        for model_name in csv(args.models):
+                            for netG in csv(args.netG):
+                                for netD in csv(args.netD):
+                                    if crop_size >= MIN_SIZES.get(netG, 4):
+                                        config = {"net": model_name, "arch": f"{netG}+{netD}", "norm": norm, "mode": "optimize", "batch_size": batch_size, "crop_size": crop_size, "num_threads": threads}
+                                        yield f"{model_name}/{netG}+{netD}/{norm}/optimize/{size}", config, lambda m=model_name, netG=netG, netD=netD, norm=norm: bench_model(m, netG, netD, norm, batch_size, crop_size, args)
+
+
+def run(args):
+    results = {}
+    for key, config, measure in configurations(args):
+        torch.set_num_threads(config["num_threads"])
+        results[key] = dict(summarize(measure(), config["batch_size"]), config=config)
+        print(f"{key:<60} {results[key]['latency_ms']:10.2f} ms (p90 {results[key]['p90_ms']:10.2f} ms) {results[key]['throughput']:8.2f} images/s")
+    save_results(args.output, results)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        baseline, current = load_results(args.baseline), load_results(args.current)
+        regressions = print_comparison(compare_results(baseline, current, args.metric, args.tolerance), baseline, current)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,141 @@
+"""Compare the training memory and step time of a ResNet generator with its reversible variant.
+
+For every crop size, one training step (forward, L1 loss, backward, Adam update) of each generator is measured:
+    -- the activation memory: the size of the tensors kept by autograd for the backward pass at the end of the forward pass
+       (excluding the weights); on a GPU, the peak memory allocated during the step is also reported;
+    -- the median step time over '--steps' steps, after '--warmup' steps.
+The reversible trunk ('rev_resnet_*') only keeps the output of its blocks, so its activation memory does not grow with the
+number of blocks; the cost is one more forward pass of the blocks during backward.
+
+With '--check_ddp', every generator is also trained in DistributedDataParallel (gloo backend, one process), with one and
+with two generator calls per step, and its gradients are compared with those of the same generator without DDP.
+
+Example:
+    python scripts/benchmark_reversible.py --netG resnet_9blocks,rev_resnet_9blocks --crop_sizes 256,512,1024 --batch_size 1
+    python scripts/benchmark_reversible.py --netG rev_resnet_6blocks --crop_sizes 64 --check_ddp
+"""
+
+import os
+import sys
+import copy
+import argparse
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from models import networks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="measure the training memory and step time of reversible generators", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--netG", type=str, default="resnet_9blocks,rev_resnet_9blocks", help="comma-separated list of generators")
+    parser.add_argument("--crop_sizes", type=str, default="256,512", help="comma-separated list of crop sizes")
+    parser.add_argument("--batch_size", type=int, default=1, help="input batch size")
+    parser.add_argument("--ngf", type=int, default=64, help="# of gen filters in the last conv layer")
+    parser.add_argument("--norm", type=str, default="instance", help="instance normalization or batch normalization [instance | batch | none]")
+    parser.add_argument("--use_dropout", action="store_true", help="use dropout in the generators")
+    parser.add_argument("--steps", type=int, default=5, help="# of measured training steps")
+    parser.add_argument("--warmup", type=int, default=1, help="# of training steps before measuring")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu", help="device to run on")
+    parser.add_argument("--check_ddp", action="store_true", help="also check the gradients of every generator in DistributedDataParallel")
+    return parser.parse_args()
+
+
+def activation_bytes(net, loss_fn, input):
+    """Return the size of the tensors saved for backward by a forward pass, excluding the weights."""
+    weights = {p.untyped_storage().data_ptr() for p in net.parameters()}
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() not in weights:
+            storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        loss = loss_fn(net(input))
+    loss.backward()
+    net.zero_grad()
+    return sum(storages.values())
+
+
+def benchmark(netG, crop_size, args):
+    device = torch.device(args.device)
+    net = networks.define_G(3, 3, args.ngf, netG, args.norm, args.use_dropout).to(device).train()
+    optimizer = torch.optim.Adam(net.parameters(), lr=0.0002, betas=(0.5, 0.999))
+    input = torch.rand(args.batch_size, 3, crop_size, crop_size, device=device) * 2 - 1
+    target = torch.rand_like(input) * 2 - 1
+
+    def loss_fn(output):
+        return (output - target).abs().mean()
+
+    result = {"activations": activation_bytes(net, loss_fn, input)}
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    times = []
+    for i in range(args.warmup + args.steps):
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        loss_fn(net(input)).backward()
+        optimizer.step()
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        if i >= args.warmup:
+            times.append(time.perf_counter() - start)
+    result["time"] = float(np.median(times))
+    if device.type == "cuda":
+        result["peak"] = torch.cuda.max_memory_allocated(device)
+    return result
+
+
+def check_ddp(netG, crop_size, args):
+    """Return the largest difference between the gradients of a generator with and without DistributedDataParallel.
+
+    The step runs the generator once, then twice (as the cycle loss of CycleGAN does), before the backward pass.
+    """
+    if not dist.is_initialized():
+        os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+        os.environ.setdefault("MASTER_PORT", "29500")
+        dist.init_process_group("gloo", rank=0, world_size=1)
+    device = torch.device(args.device)
+    net = networks.define_G(3, 3, args.ngf, netG, args.norm, args.use_dropout).to(device).train()
+    ddp_net = torch.nn.parallel.DistributedDataParallel(copy.deepcopy(net), device_ids=[device.index] if device.type == "cuda" else None)
+    input = torch.rand(args.batch_size, 3, crop_size, crop_size, device=device) * 2 - 1
+    difference = 0.0
+    for calls in (1, 2):
+        grads = []
+        for model in (net, ddp_net):
+            model.zero_grad()
+            torch.manual_seed(calls)  # the same dropout masks with and without DDP
+            output = input
+            for _ in range(calls):
+                output = model(output)
+            output.abs().mean().backward()
+            grads.append([p.grad for p in model.parameters()])
+        for grad, ddp_grad in zip(*grads):
+            difference = max(difference, (grad - ddp_grad).abs().max().item())
+    return difference
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.check_ddp:
+        for netG in args.netG.split(","):
+            difference = check_ddp(netG, int(args.crop_sizes.split(",")[0]), args)
+            print(f"DDP check {netG:>22}: max gradient difference to the generator without DDP {difference:.2e}")
+            assert difference < 1e-4, f"the gradients of {netG} differ in DistributedDataParallel"
+        dist.destroy_process_group()
+    for crop_size in [int(s) for s in args.crop_sizes.split(",")]:
+        baseline = None
+        for netG in args.netG.split(","):
+            result = benchmark(netG, crop_size, args)
+            baseline = baseline or result
+            message = f"crop {crop_size:5d} {netG:>22}: activations {result['activations'] / 2**20:8.1f} MB ({result['activations'] / baseline['activations']:.2f}x), step {result['time'] * 1000:8.1f} ms ({result['time'] / baseline['time']:.2f}x)"
+            if "peak" in result:
+                message += f", peak allocated {result['peak'] / 2**20:8.1f} MB"
+            print(message)
@@ -0,0 +1,98 @@
+"""Benchmark client for the local HTTP inference server (serve.py).
+
+It sends '--requests' translation requests at each concurrency level and reports the throughput
+and latency percentiles, together with the batch size histogram reported by the server.
+
+Example:
+    python serve.py --name horse2zebra_pretrained --no_dropout --max_batch_size 8
+    python scripts/benchmark_server.py --url http://127.0.0.1:8000 --concurrency 1,2,4,8,16 --output results.json
+"""
+
+import argparse
+import io
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="measure throughput/latency of serve.py under concurrent load", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="address of the server")
+    parser.add_argument("--image", type=str, default="", help="image sent with every request; a random image is generated if empty")
+    parser.add_argument("--size", type=int, default=256, help="size of the generated random image")
+    parser.add_argument("--concurrency", type=str, default="1,2,4,8,16", help="comma-separated list of concurrent clients")
+    parser.add_argument("--requests", type=int, default=64, help="number of requests sent at each concurrency level")
+    parser.add_argument("--warmup", type=int, default=4, help="number of requests sent before measuring")
+    parser.add_argument("--output", type=str, default="", help="save the results to this JSON file")
+    return parser.parse_args()
+
+
+def load_payload(args):
+    if args.image:
+        with open(args.image, "rb") as f:
+            return f.read()
+    img = Image.fromarray(np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def send(url, payload):
+    """Send one request and return its latency in seconds (None if it failed)."""
+    t0 = time.perf_counter()
+    request = urllib.request.Request(url + "/translate", data=payload, headers={"Content-Type": "application/octet-stream"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+    except Exception as e:
+        print(f"request failed: {e}")
+        return None
+    return time.perf_counter() - t0
+
+
+def get_metrics(url):
+    with urllib.request.urlopen(url + "/metrics") as response:
+        return json.loads(response.read())
+
+
+def run_level(url, payload, concurrency, num_requests):
+    """Send <num_requests> requests with <concurrency> clients and return the measured statistics."""
+    batches_before = get_metrics(url)["batch_size_histogram"]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda _: send(url, payload), range(num_requests)))
+    elapsed = time.perf_counter() - t0
+    batches_after = get_metrics(url)["batch_size_histogram"]
+    ok = np.array([t for t in latencies if t is not None]) * 1000.0
+    histogram = {k: v - batches_before.get(k, 0) for k, v in batches_after.items() if v - batches_before.get(k, 0) > 0}
+    result = {"concurrency": concurrency, "requests": num_requests, "errors": num_requests - len(ok), "throughput": len(ok) / elapsed, "batch_size_histogram": histogram}
+    if len(ok) > 0:
+        result.update({"latency_mean": float(ok.mean()), "latency_p50": float(np.percentile(ok, 50)), "latency_p95": float(np.percentile(ok, 95)), "latency_p99": float(np.percentile(ok, 99))})
+    return result
+
+
+def main():
+    args = parse_args()
+    url = args.url.rstrip("/")
+    payload = load_payload(args)
+    for _ in range(args.warmup):
+        send(url, payload)
+
+    results = []
+    print(f"{'clients':>8} {'img/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  batch sizes")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        r = run_level(url, payload, concurrency, args.requests)
+        results.append(r)
+        print(f"{r['concurrency']:>8} {r['throughput']:>9.2f} {r.get('latency_p50', float('nan')):>9.1f} {r.get('latency_p95', float('nan')):>9.1f} {r.get('latency_p99', float('nan')):>9.1f}  {r['batch_size_histogram']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": url, "results": results, "server_metrics": get_metrics(url)}, f, indent=2)
+        print(f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
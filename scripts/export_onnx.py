@@ -0,0 +1,38 @@
+"""Export the generators of a trained model to ONNX.
+
+The generators are loaded like in test.py (same options) and exported with dynamic batch, height and width
+next to their checkpoints as '<epoch>_net_<name>.onnx'. Each export is checked against PyTorch with ONNX Runtime
+if it is installed. The exported files run with onnxruntime alone, without PyTorch.
+
+Example:
+    python scripts/export_onnx.py --name horse2zebra_pretrained --model test --no_dropout
+    python scripts/export_onnx.py --name maps_cyclegan --model cycle_gan --dataroot ./datasets/maps
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch
+from options.test_options import TestOptions
+from models import create_model
+from models.onnx_export import ONNXGenerator, check_parity, export_model
+
+
+if __name__ == "__main__":
+    # the generators are exported from their checkpoints, no images are needed
+    sys.argv += [] if "--dataroot" in sys.argv else ["--dataroot", "unused"]
+    opt = TestOptions().parse()
+    opt.device = torch.device("cpu")
+    model = create_model(opt)
+    model.setup(opt)
+    for name, path in export_model(model, opt).items():
+        try:
+            onnx_net = ONNXGenerator(path)
+        except ImportError:
+            print("onnxruntime is not installed; skipping the parity check")
+            break
+        net = getattr(model, "net" + name)
+        first_conv = next(m for m in net.modules() if isinstance(m, torch.nn.Conv2d))
+        print(f"net{name}: max difference between ONNX Runtime and PyTorch {check_parity(net, onnx_net, first_conv.in_channels):.2e}")
@@ -0,0 +1,67 @@
+"""Prune the generators of a trained model and optionally fine-tune them.
+
+The model is loaded like in train.py '--continue_train' (same options) from '--checkpoints_dir/--name'. '--prune_ratio'
+of the channels of every generator layer are removed (see models/pruning.py), the pruned model is fine-tuned for
+'--finetune_iters' iterations, and saved to '--checkpoints_dir/--pruned_name' as 'latest_net_<name>.pth' with the
+architecture descriptors 'latest_net_<name>.json'. test.py (and train.py '--continue_train') rebuild the pruned
+generators from the descriptors, so the pruned model is used like any other experiment.
+
+Example:
+    python scripts/prune_generator.py --dataroot ./datasets/maps --name maps_cyclegan --model cycle_gan --prune_ratio 0.5 --finetune_iters 2000
+    python test.py --dataroot ./datasets/maps --name maps_cyclegan_pruned --model cycle_gan
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from options.prune_options import PruneOptions
+from data import create_dataset
+from models import create_model
+from models.pruning import ActivationRecorder, prune_generator
+from util.util import init_ddp, mkdirs
+
+
+if __name__ == "__main__":
+    opt = PruneOptions().parse()
+    opt.device = init_ddp()
+    dataset = create_dataset(opt)
+    model = create_model(opt)
+    model.setup(opt)  # loads the trained networks
+    gen_names = [name for name in model.model_names if name.startswith("G")]
+
+    activations = None
+    if opt.prune_criterion == "activation":  # rank the channels by their mean activation on calibration images
+        recorders = [ActivationRecorder(getattr(model, "net" + name)) for name in gen_names]
+        for i, data in enumerate(dataset):
+            if i * opt.batch_size >= opt.num_calibration:
+                break
+            model.set_input(data)
+            model.test()
+        activations = {}
+        for recorder in recorders:
+            recorder.remove()
+            activations.update(recorder.stats)
+
+    for name in gen_names:
+        num_before, num_after = prune_generator(getattr(model, "net" + name), opt.prune_ratio, opt.prune_criterion, activations)
+        print(f"net{name}: {num_before / 1e6:.3f} M -> {num_after / 1e6:.3f} M parameters ({num_after / num_before:.1%})")
+
+    # the pruned weights are the same Parameter objects, so the optimizers of the model fine-tune them
+    total_iters = 0
+    while total_iters < opt.finetune_iters:
+        for data in dataset:
+            if total_iters >= opt.finetune_iters:
+                break
+            model.set_input(data)
+            model.optimize_parameters()
+            total_iters += 1
+            if total_iters % opt.print_freq == 0 or total_iters == opt.finetune_iters:
+                losses = model.get_current_losses()
+                print(f"(fine-tune iters: {total_iters}) " + " ".join(f"{k}: {v:.3f}" for k, v in losses.items()))
+
+    model.save_dir = Path(opt.checkpoints_dir) / opt.pruned_name
+    mkdirs(model.save_dir)
+    model.save_networks("latest")
+    print(f"saved the pruned model to {model.save_dir}")
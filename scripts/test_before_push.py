@@ -65,6 +65,25 @@ class TestBeforePush:
         
         assert test_result.returncode == 0, f"CycleGAN testing failed: {test_result.stderr}"
 
+    def test_batched_test(self):
+        """Test batched inference with parallel data loading."""
+        train_result = subprocess.run([
+            "python", "train.py", "--model", "cycle_gan", "--name", "temp_cyclegan_batched",
+            "--dataroot", "./datasets/mini", "--n_epochs", "1", "--n_epochs_decay", "0",
+            "--save_latest_freq", "10"
+        ], capture_output=True, text=True)
+
+        assert train_result.returncode == 0, f"CycleGAN training failed: {train_result.stderr}"
+
+        test_result = subprocess.run([
+            "python", "test.py", "--model", "test", "--name", "temp_cyclegan_batched", "--dataroot", "./datasets/mini",
+            "--num_test", "5", "--model_suffix", "_A", "--no_dropout", "--batch_size", "4", "--num_threads", "2"
+        ], capture_output=True, text=True)
+
+        assert test_result.returncode == 0, f"Batched testing failed: {test_result.stderr}"
+        images = list(Path("./results/temp_cyclegan_batched/test_latest/images").glob("*_fake.png"))
+        assert len(images) == 5, f"expected 5 results, found {len(images)}"
+
     def test_pix2pix_train_test(self):
         """Test pix2pix training and testing pipeline."""
         # Train
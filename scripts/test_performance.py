@@ -0,0 +1,182 @@
+"""Performance regression tests: train.py and test.py on generated data, checked against a recorded baseline.
+
+Every case trains a model for one epoch of a tiny dataset generated in '--work_dir' (nothing is downloaded), with fixed
+seeds and without data loading workers, and then tests it. For train.py and test.py, it measures:
+    -- throughput: the images per second of the training iterations (from their printed time, without the first
+       WARMUP_ITERS iterations) and of the test loop (printed by test.py, without its first batch);
+    -- peak_memory_mb: the peak resident memory of the process.
+The results are saved to [work_dir]/report.json, in the format of util/benchmark.py, and their comparison with the
+baseline to [work_dir]/comparison.json. A result is a regression when it is worse than the baseline by more than the
+tolerance of its metric, or when it is missing.
+
+Record a baseline on the machine that runs the tests, e.g. before a change or a release:
+    python scripts/test_performance.py --record
+Check the current code against it:
+    python -m pytest scripts/test_performance.py
+    python scripts/test_performance.py --throughput_tolerance 0.1
+The tests are skipped when there is no baseline. With pytest, the environment variables PERF_WORK_DIR, PERF_BASELINE,
+PERF_THROUGHPUT_TOLERANCE and PERF_MEMORY_TOLERANCE replace the command line options.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from util.benchmark import compare_results, load_results, print_comparison, save_results
+
+
+SEED = 0
+WARMUP_ITERS = 2  # training iterations not measured
+NUM_TRAIN = 12  # images, i.e. training iterations
+NUM_TEST = 16
+TOLERANCES = {"throughput": 0.2, "peak_memory_mb": 0.1}  # default relative tolerances
+TRAIN_ARGS = ["--n_epochs", "1", "--n_epochs_decay", "0", "--print_freq", "1", "--display_freq", "1000000", "--no_html", "--save_epoch_freq", "1", "--save_latest_freq", "1000000", "--serial_batches"]
+CASES = {  # name -> dataset, options of train.py and test.py, extra options of train.py, extra options of test.py (and its folder of the dataset)
+    "cycle_gan": {
+        "data": "unaligned",
+        "args": ["--load_size", "64", "--crop_size", "64"],
+        "train": ["--model", "cycle_gan"],
+        "test": ["--model", "test", "--model_suffix", "_A", "--no_dropout", "--dataset_mode", "single"],
+        "test_folder": "testA",
+    },
+    "pix2pix": {
+        "data": "aligned",
+        "args": ["--model", "pix2pix", "--netG", "unet_128", "--load_size", "128", "--crop_size", "128"],
+        "train": [],
+        "test": [],
+    },
+    "colorization": {
+        "data": "colorization",
+        "args": ["--model", "colorization", "--netG", "unet_128", "--load_size", "128", "--crop_size", "128"],
+        "train": [],
+        "test": [],
+    },
+}
+
+
+def make_datasets(data_dir):
+    """Generate the images of every dataset once and return the dataroot of every dataset."""
+    folders = {  # folder -> image size (aligned images are A and B side by side)
+        "unaligned/trainA": ((64, 64), NUM_TRAIN),
+        "unaligned/trainB": ((64, 64), NUM_TRAIN),
+        "unaligned/testA": ((64, 64), NUM_TEST),
+        "aligned/train": ((256, 128), NUM_TRAIN),
+        "aligned/test": ((256, 128), NUM_TEST),
+        "colorization/train": ((128, 128), NUM_TRAIN),
+        "colorization/test": ((128, 128), NUM_TEST),
+    }
+    for k, (folder, (size, num_images)) in enumerate(folders.items()):
+        path = Path(data_dir) / folder
+        if path.is_dir() and len(list(path.iterdir())) == num_images:
+            continue
+        rng = np.random.default_rng(SEED + k)  # the same images whichever folders already exist
+        path.mkdir(parents=True, exist_ok=True)
+        for i in range(num_images):  # smooth random colors: decoded and processed like natural images
+            coarse = Image.fromarray(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8))
+            coarse.resize(size, Image.BICUBIC).save(path / f"{i:04d}.jpg", quality=90)
+    return {name: Path(data_dir) / name for name in ("unaligned", "aligned", "colorization")}
+
+
+def run(argv):
+    """Run a script of the repository in a new process; return its output and its peak resident memory (MB)."""
+    proc = subprocess.Popen([sys.executable] + argv, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = proc.stdout.read()
+    proc.stdout.close()
+    _, status, usage = os.wait4(proc.pid, 0)  # the resource usage of this process only
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed with exit code {proc.returncode}:\n{output[-4000:]}")
+    return output, usage.ru_maxrss / 1024  # KB on Linux
+
+
+def measure(work_dir, cases=CASES):
+    """Train and test every case; return the results in the format of util/benchmark.py."""
+    work_dir = Path(work_dir)
+    dataroots = make_datasets(work_dir / "data")
+    results = {}
+    for name, case in cases.items():
+        common = ["--name", f"perf_{name}", "--checkpoints_dir", str(work_dir / "checkpoints"), "--seed", str(SEED), "--num_threads", "0"] + case["args"]
+        dataroot = dataroots[case["data"]]
+        train_argv = ["train.py", "--dataroot", str(dataroot)] + common + TRAIN_ARGS + case["train"]
+        print(f"[{name}] python {' '.join(train_argv)}")
+        output, memory = run(train_argv)
+        times = [float(t) for t in re.findall(r"time: ([\d.]+)", output)][WARMUP_ITERS:]  # seconds per image
+        assert times, f"no training iteration of {name} was printed"
+        results[f"{name}/train"] = {"throughput": 1 / max(float(np.median(times)), 1e-3), "peak_memory_mb": memory, "config": {"argv": train_argv}}
+
+        test_argv = ["test.py", "--dataroot", str(dataroot / case.get("test_folder", ""))] + common + ["--results_dir", str(work_dir / "results"), "--num_test", str(NUM_TEST)] + case["test"]
+        print(f"[{name}] python {' '.join(test_argv)}")
+        output, memory = run(test_argv)
+        match = re.search(r"processed (\d+) images; \d+ images after the first batch in [\d.]+ sec \(([\d.]+) images/sec\)", output)
+        assert match and int(match.group(1)) == NUM_TEST, f"test.py did not process {NUM_TEST} images of {name}"
+        results[f"{name}/test"] = {"throughput": float(match.group(2)), "peak_memory_mb": memory, "config": {"argv": test_argv}}
+    return results
+
+
+def check(work_dir, baseline_path, tolerances=TOLERANCES):
+    """Measure the current code, save the report and its comparison with the baseline; return the comparison per metric."""
+    work_dir = Path(work_dir)
+    save_results(work_dir / "report.json", measure(work_dir))
+    baseline, current = load_results(baseline_path), load_results(work_dir / "report.json")
+    comparison = {}
+    for metric, tolerance in tolerances.items():
+        print(f"---------- {metric} (tolerance {tolerance:.0%}) ----------")
+        rows = compare_results(baseline, current, metric, tolerance)
+        print_comparison(rows, baseline, current)
+        comparison[metric] = {"tolerance": tolerance, "rows": [dict(zip(("key", "baseline", "current", "change", "status"), row)) for row in rows]}
+    with open(work_dir / "comparison.json", "w") as f:
+        json.dump(comparison, f, indent=1)
+    return comparison
+
+
+def failures(comparison, metric):
+    return [row for row in comparison[metric]["rows"] if row["status"] in ("regression", "missing")]
+
+
+@pytest.fixture(scope="module")
+def comparison():
+    """Measure the current code once and compare it with the recorded baseline."""
+    work_dir = Path(os.environ.get("PERF_WORK_DIR", ROOT / "checkpoints" / "perf"))
+    baseline_path = Path(os.environ.get("PERF_BASELINE", work_dir / "baseline.json"))
+    if not baseline_path.exists():
+        pytest.skip(f"no performance baseline at {baseline_path}; record one with 'python scripts/test_performance.py --record'")
+    tolerances = {"throughput": float(os.environ.get("PERF_THROUGHPUT_TOLERANCE", TOLERANCES["throughput"])), "peak_memory_mb": float(os.environ.get("PERF_MEMORY_TOLERANCE", TOLERANCES["peak_memory_mb"]))}
+    return check(work_dir, baseline_path, tolerances)
+
+
+class TestPerformance:
+    """Test suite to catch performance regressions of training and inference before a release."""
+
+    def test_throughput(self, comparison):
+        """Test that training and inference are not slower than the baseline."""
+        assert not failures(comparison, "throughput"), f"throughput regressions: {failures(comparison, 'throughput')}"
+
+    def test_peak_memory(self, comparison):
+        """Test that training and inference do not use more memory than the baseline."""
+        assert not failures(comparison, "peak_memory_mb"), f"peak memory regressions: {failures(comparison, 'peak_memory_mb')}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="check train.py and test.py for performance regressions", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--work_dir", type=str, default=str(ROOT / "checkpoints" / "perf"), help="where the data, checkpoints, results and reports are saved")
+    parser.add_argument("--baseline", type=str, default="", help="baseline result file; by default [work_dir]/baseline.json")
+    parser.add_argument("--record", action="store_true", help="measure the current code and save it as the baseline")
+    parser.add_argument("--throughput_tolerance", type=float, default=TOLERANCES["throughput"], help="accepted relative loss of throughput")
+    parser.add_argument("--memory_tolerance", type=float, default=TOLERANCES["peak_memory_mb"], help="accepted relative increase of peak memory")
+    args = parser.parse_args()
+    baseline_path = Path(args.baseline or Path(args.work_dir) / "baseline.json")
+    if args.record:
+        save_results(baseline_path, measure(args.work_dir))
+    else:
+        comparison = check(args.work_dir, baseline_path, {"throughput": args.throughput_tolerance, "peak_memory_mb": args.memory_tolerance})
+        sys.exit(1 if any(failures(comparison, metric) for metric in comparison) else 0)
@@ -0,0 +1,2 @@
+set -ex
+python train.py --dataroot ./datasets/horse2zebra/trainA --name horse2zebra_mobile --model distill --teacher_name horse2zebra_pretrained --netG mobile_resnet_9blocks --ngf 32 --use_wandb
@@ -0,0 +1,34 @@
+"""Local HTTP inference server for image-to-image translation.
+
+Once you have trained your model with train.py, you can use this script to serve it over HTTP on localhost.
+It loads the generator the same way as test.py with '--model test', starts '--num_workers' worker processes
+(each pinned to '--threads_per_worker' CPU threads) and groups concurrent requests into batches of up to
+'--max_batch_size' images, waiting at most '--max_batch_wait' ms for a batch to fill up.
+
+Example:
+    Serve a pretrained CycleGAN generator:
+        python serve.py --name horse2zebra_pretrained --no_dropout --port 8000
+
+    Translate an image:
+        curl --data-binary @horse.jpg http://127.0.0.1:8000/translate -o zebra.png
+
+    Inspect queue depth, batch size histogram and per-stage latencies:
+        curl http://127.0.0.1:8000/metrics
+
+    Measure throughput/latency under concurrent load:
+        python scripts/benchmark_server.py --url http://127.0.0.1:8000 --concurrency 1,4,16
+
+See options/base_options.py, options/test_options.py and options/serve_options.py for more options.
+"""
+
+import torch
+from options.serve_options import ServeOptions
+from util.server import serve
+
+
+if __name__ == "__main__":
+    opt = ServeOptions().parse()  # get serving options
+    opt.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    assert opt.model == "test", "serve.py only supports '--model test' (a single generator)"
+    opt.no_flip = True  # no flip at inference time
+    serve(opt)
@@ -22,19 +22,59 @@ Example (You need to train models first or download pre-trained models from our
     Test a pix2pix model:
         python test.py --dataroot ./datasets/facades --name facades_pix2pix --model pix2pix --direction BtoA
 
+    Split the test images across 8 local processes (or launch with 'torchrun --nproc_per_node 8 test.py ...'):
+        python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --num_procs 8
+    Each process runs a disjoint shard of the images with its own thread budget; the HTML of all the shards is merged at the end.
+
+    Only translate the images that are new or changed since the last run (and resume interrupted runs):
+        python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --cache
+
+    Run the generator with int8 kernels on the CPU, calibrated on the first 32 test images:
+        python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --quantize
+    The accuracy of the int8 generator against the float one is printed and saved next to the checkpoint.
+
+    Fold batchnorm and padding into the convs and let torch.compile fuse the activations (pix2pix, needs --eval):
+        python test.py --dataroot ./datasets/facades --name facades_pix2pix --model pix2pix --direction BtoA --eval --optimize_graph --compile
+
+    Export the generator to ONNX (if needed) and run it with ONNX Runtime on the CPU:
+        python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --backend onnxruntime
+
+    Run the generator in bf16 and compare it with fp32 on the first 4 batches:
+        python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --infer_dtype bf16
+
+    Translate images of any size in overlapping 512x512 tiles whose seams are blended over 64 pixels:
+        python test.py --dataroot datasets/maps/testA --name maps_cyclegan --model test --no_dropout --tile_size 512 --tile_overlap 64
+
+    Time every layer of the generator on the first 10 batches, and save the slowest layers and a Chrome trace:
+        python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --trace_layers
+
 See options/base_options.py and options/test_options.py for more test options.
 See training and test tips at: https://github.com/junyanz/pytorch-CycleGAN-and-pix2pix/blob/master/docs/tips.md
 See frequently asked questions at: https://github.com/junyanz/pytorch-CycleGAN-and-pix2pix/blob/master/docs/qa.md
 """
 
 import os
+import json
+import time
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
+from PIL import Image
 from options.test_options import TestOptions
 from data import create_dataset
 from models import create_model
-from util.visualizer import save_images
+from models.quantization import quantize_model
+from models.graph_optimizer import optimize_model
+from models.onnx_export import onnx_model
+from models.precision import set_infer_dtype, report_precision
+from util.visualizer import save_images, save_webpage, merge_shard_results
+from util.inference_cache import InferenceCache
+from util.tiling import translate_tiled, save_tiled_result
+from util.layer_tracer import LayerTracer
+from util.util import set_seed
 from util import html
 import torch
+import torch.distributed as dist
 
 try:
     import wandb
@@ -42,38 +82,197 @@ except ImportError:
     print('Warning: wandb package cannot be found. The option "--use_wandb" will result in error.')
 
 
-if __name__ == "__main__":
-    opt = TestOptions().parse()  # get test options
-    opt.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-    # hard-code some parameters for test
-    opt.num_threads = 0  # test code only supports num_threads = 0
-    opt.batch_size = 1  # test code only supports batch_size = 1
-    opt.serial_batches = True  # disable data shuffling; comment this line if results on randomly chosen images are needed.
-    opt.no_flip = True  # no flip; comment this line if results on flipped images are needed.
-    
+def get_web_dir(opt):
+    """Return the directory of the result website."""
+    web_dir = Path(opt.results_dir) / opt.name / f"{opt.phase}_{opt.epoch}"  # define the website directory
+    if opt.load_iter > 0:  # load_iter is 0 by default
+        web_dir = Path(f"{web_dir}_iter{opt.load_iter}")
+    return web_dir
+
+
+def run_test(opt):
+    """Run inference on the images of shard <opt.shard_id> (all the images if opt.num_shards == 1) and save the results."""
     dataset = create_dataset(opt)  # create a dataset given opt.dataset_mode and other options
     model = create_model(opt)  # create a model given opt.model and other options
     model.setup(opt)  # regular setup: load and print networks; create schedulers
 
     # create a website
-    web_dir = Path(opt.results_dir) / opt.name / f"{opt.phase}_{opt.epoch}"  # define the website directory
-    if opt.load_iter > 0:  # load_iter is 0 by default
-        web_dir = Path(f"{web_dir}_iter{opt.load_iter}")
+    web_dir = get_web_dir(opt)
     print(f"creating web directory {web_dir}")
-    webpage = html.HTML(web_dir, f"Experiment = {opt.name}, Phase = {opt.phase}, Epoch = {opt.epoch}")
+    title = f"Experiment = {opt.name}, Phase = {opt.phase}, Epoch = {opt.epoch}"
+    webpage = html.HTML(web_dir, title)
+    records = []  # (index in the whole dataset, image name, visual labels) of every result of this shard
+    indices = dataset.indices()[: opt.num_test]  # dataset index of every image this process is responsible for
+    cache = None
+    if opt.cache:  # skip the images whose results are already saved
+        load_suffix = f"iter_{opt.load_iter}" if opt.load_iter > 0 else opt.epoch
+        checkpoints = [model.save_dir / f"{load_suffix}_net_{name}.pth" for name in model.model_names]
+        cache = InferenceCache(web_dir, opt, checkpoints, opt.shard_id, opt.num_shards)
+        todo = []
+        for index in indices:
+            input_paths = dataset.dataset.get_input_paths(index)
+            labels = cache.lookup(input_paths) if input_paths is not None else None
+            if labels is None:
+                todo.append(index)
+            else:
+                records.append({"index": index, "name": Path(input_paths[0]).stem, "labels": labels})
+        print(f"found {len(records)} cached results; {len(todo)} images left to process")
+        indices = todo
+        dataset.select(indices)
     # test with eval mode. This only affects layers like batchnorm and dropout.
     # For [pix2pix]: we use batchnorm and dropout in the original pix2pix. You can experiment it with and without eval() mode.
     # For [CycleGAN]: It should not affect CycleGAN as CycleGAN uses instancenorm without dropout.
     if opt.eval:
         model.eval()
-    for i, data in enumerate(dataset):
-        if i >= opt.num_test:  # only apply our model to opt.num_test images.
-            break
-        model.set_input(data)  # unpack data from data loader
-        model.test()  # run inference
-        visuals = model.get_current_visuals()  # get image results
-        img_path = model.get_image_paths()  # get image paths
-        if i % 5 == 0:  # save images to an HTML file
-            print(f"processing ({i:04d})-th image... {img_path}")
-        save_images(webpage, visuals, img_path, aspect_ratio=opt.aspect_ratio, width=opt.display_winsize)
-    webpage.save()  # save the HTML
+    elif opt.batch_size > 1 and opt.norm in ("batch", "syncbatch"):
+        print("Warning: without --eval, batchnorm uses the statistics of the whole batch, so results depend on --batch_size.")
+    if opt.backend == "onnxruntime":  # run the exported generators with ONNX Runtime; see models/onnx_export.py
+        onnx_model(model, opt)
+    elif opt.quantize:  # run the generator with int8 CPU kernels; see models/quantization.py
+        if opt.optimize_graph:
+            print("--optimize_graph is ignored with --quantize: the int8 conversion already folds batchnorm into the convs")
+        quantize_model(model, opt)
+    else:
+        if opt.optimize_graph:  # fold norms, merge padding and drop dropout in the generators; see models/graph_optimizer.py
+            optimize_model(model, opt)
+        if opt.infer_dtype != "fp32":  # run the generators in bf16/fp16; see models/precision.py
+            set_infer_dtype(model, opt)
+    if opt.compile and opt.backend == "pytorch":  # torch.compile also fuses the activations into the convs
+        for name in model.model_names:
+            if name.startswith("G"):
+                model.replace_network(name, torch.compile(getattr(model, "net" + name)))
+    tracer = LayerTracer(opt)  # time every layer of the networks with --trace_layers
+    tracer.instrument(model)
+    if opt.tile_size > 0:  # translate every image tile by tile; see util/tiling.py
+        records += run_tiled(opt, model, dataset.dataset, indices, web_dir, cache)
+    else:
+        # encode and save the results of a batch in the background while the next batch runs
+        executor = ThreadPoolExecutor(opt.num_save_threads) if opt.num_save_threads > 0 else None
+        pending = []
+        unrecorded = []  # (futures, dataset index, labels) of results not yet added to the cache
+        num_done = 0  # number of images processed so far
+        start_time, num_warmup = None, 0  # the first batch is warm-up and not timed
+        for i, data in enumerate(dataset):
+            if num_done >= len(indices):  # only apply our model to opt.num_test images.
+                break
+            model.set_input(data)  # unpack data from data loader
+            model.test()  # run inference
+            tracer.step()
+            visuals = model.get_current_visuals()  # get image results
+            img_path = model.get_image_paths()[: len(indices) - num_done]  # get image paths
+            if i % max(1, 5 // opt.batch_size) == 0:  # save images to an HTML file
+                print(f"processing ({num_done:04d})-th image... {img_path}")
+            if len(pending) > 4 * opt.batch_size * len(visuals):  # bound the number of results waiting to be saved
+                done, pending = wait(pending, return_when="FIRST_COMPLETED")
+                pending = list(pending)
+                for future in done:
+                    future.result()
+            futures = save_images(webpage, visuals, img_path, aspect_ratio=opt.aspect_ratio, width=opt.display_winsize, executor=executor)
+            pending += futures
+            for k, path in enumerate(img_path):
+                index = indices[num_done + k]
+                records.append({"index": index, "name": Path(path).stem, "labels": list(visuals.keys())})
+                if cache is not None:
+                    unrecorded.append((futures[k * len(visuals) : (k + 1) * len(visuals)], index, list(visuals.keys())))
+            num_done += len(img_path)
+            if start_time is None:
+                start_time, num_warmup = time.time(), num_done
+            if cache is not None:  # only record results whose images are on the disk, so an interrupted job resumes correctly
+                while unrecorded and all(f.done() for f in unrecorded[0][0]):
+                    futures, index, labels = unrecorded.pop(0)
+                    if all(f.exception() is None for f in futures):  # a failed save is re-raised below, never cached
+                        cache.add(dataset.dataset.get_input_paths(index), labels)
+        for future in pending:
+            future.result()  # re-raise errors from the background jobs
+        if num_done > num_warmup:
+            elapsed, num_timed = time.time() - start_time, num_done - num_warmup
+            print(f"processed {num_done} images; {num_timed} images after the first batch in {elapsed:.2f} sec ({num_timed / max(elapsed, 1e-9):.2f} images/sec)")
+        if cache is not None:
+            for _, index, labels in unrecorded:
+                cache.add(dataset.dataset.get_input_paths(index), labels)
+            cache.save()
+    tracer.close()
+    report_precision(model)
+    if opt.num_shards > 1:  # the merge step builds the HTML of all the shards
+        with open(web_dir / f"shard_{opt.shard_id}_of_{opt.num_shards}.json", "w") as f:
+            json.dump(records, f)
+    else:
+        save_webpage(web_dir, title, records, width=opt.display_winsize)
+
+
+def run_tiled(opt, model, dataset, indices, web_dir, cache=None):
+    """Translate the images of <indices> tile by tile and return their records; memory is bounded by the tile size, not the image size."""
+    if opt.model != "test":
+        raise ValueError("tiled inference (--tile_size) only supports '--model test'")
+    Image.MAX_IMAGE_PIXELS = None  # allow the very large images tiled inference is meant for
+    records = []
+    for n, index in enumerate(indices):
+        input_paths = dataset.get_input_paths(index)
+        name = Path(input_paths[0]).stem
+        print(f"processing ({n:04d})-th image... {input_paths[0]}")
+        image = Image.open(input_paths[0]).convert("RGB")
+        if opt.input_nc == 1:
+            image = image.convert("L")
+        result = translate_tiled(model.netG, image, opt.tile_size, opt.tile_overlap, opt.tile_batch_size, model.device)
+        image.save(web_dir / "images" / f"{name}_real.png")
+        save_tiled_result(result, web_dir / "images" / f"{name}_fake.png")
+        del image, result
+        records.append({"index": index, "name": name, "labels": ["real", "fake"]})
+        if cache is not None:
+            cache.add(input_paths, ["real", "fake"])
+    if cache is not None:
+        cache.save()
+    return records
+
+
+def run_shard(opt, shard_id, num_shards, num_threads):
+    """Entry point of a worker process started with '--num_procs'."""
+    torch.set_num_threads(num_threads)
+    opt.shard_id, opt.num_shards = shard_id, num_shards
+    run_test(opt)
+
+
+if __name__ == "__main__":
+    opt = TestOptions().parse()  # get test options
+    if opt.seed >= 0:
+        set_seed(opt.seed)
+    # hard-code some parameters for test
+    opt.serial_batches = True  # disable data shuffling; comment this line if results on randomly chosen images are needed.
+    opt.no_flip = True  # no flip; comment this line if results on flipped images are needed.
+    opt.shard_id, opt.num_shards = 0, 1
+    world_size = int(os.environ.get("WORLD_SIZE", 1))  # set by torchrun
+    num_shards = max(opt.num_procs, world_size)
+    opt.max_dataset_size = min(opt.max_dataset_size, opt.num_test)  # only load the first opt.num_test images
+    if num_shards > 1:
+        num_threads = opt.threads_per_proc if opt.threads_per_proc > 0 else max(1, (os.cpu_count() or 1) // num_shards)
+    title = f"Experiment = {opt.name}, Phase = {opt.phase}, Epoch = {opt.epoch}"
+
+    if world_size > 1:  # launched with torchrun: this process runs the shard of its rank
+        local_rank = int(os.environ.get("LOCAL_RANK", 0))
+        opt.device = torch.device(f"cuda:{local_rank}" if torch.cuda.is_available() else "cpu")
+        torch.set_num_threads(num_threads)
+        opt.shard_id, opt.num_shards = int(os.environ["RANK"]), world_size
+        run_test(opt)
+        dist.init_process_group(backend="gloo")
+        dist.barrier()  # wait for all the shards before merging
+        if dist.get_rank() == 0:
+            merge_shard_results(get_web_dir(opt), title, world_size, width=opt.display_winsize)
+            if opt.cache:
+                InferenceCache.merge_shards(get_web_dir(opt))
+        dist.destroy_process_group()
+    elif opt.num_procs > 1:  # start a local process pool; each process runs one shard
+        opt.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        procs = [mp.Process(target=run_shard, args=(opt, k, opt.num_procs, num_threads)) for k in range(opt.num_procs)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        failed = [k for k, p in enumerate(procs) if p.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"test processes of shards {failed} failed")
+        merge_shard_results(get_web_dir(opt), title, opt.num_procs, width=opt.display_winsize)
+        if opt.cache:
+            InferenceCache.merge_shards(get_web_dir(opt))
+    else:
+        opt.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        run_test(opt)
@@ -22,14 +22,24 @@ See frequently asked questions at: https://github.com/junyanz/pytorch-CycleGAN-a
 import time
 from options.train_options import TrainOptions
 from data import create_dataset
+from data.worker_tuner import WorkerTuner
 from models import create_model
 from util.visualizer import Visualizer
-from util.util import init_ddp, cleanup_ddp
+from util.profiler import PhaseProfiler
+from util.layer_tracer import LayerTracer
+from util.auto_batch import find_batch_size
+from util.util import init_ddp, cleanup_ddp, set_seed
 
 
 if __name__ == "__main__":
-    opt = TrainOptions().parse()  # get training options
+    options = TrainOptions()
+    opt = options.parse()  # get training options
     opt.device = init_ddp()
+    if opt.seed >= 0:
+        set_seed(opt.seed)
+    if opt.auto_batch:  # search the batch size (or crop size) for the memory budget, and save it to train_opt.txt
+        find_batch_size(opt)
+        options.print_options(opt)
     dataset = create_dataset(opt)  # create a dataset given opt.dataset_mode and other options
     dataset_size = len(dataset)  # get the number of images in the dataset.
     print(f"The number of training images = {dataset_size}")
@@ -37,6 +47,11 @@ if __name__ == "__main__":
     model = create_model(opt)  # create a model given opt.model and other options
     model.setup(opt)  # regular setup: load and print networks; create schedulers
     visualizer = Visualizer(opt)  # create a visualizer that display/save images and plots
+    profiler = PhaseProfiler(opt)  # time the phases of every iteration with --profile / --profile_memory / --profile_trace_iter
+    profiler.instrument(model)
+    tracer = LayerTracer(opt)  # time every layer of the networks with --trace_layers
+    tracer.instrument(model)
+    tuner = WorkerTuner(opt, dataset, log=visualizer.log_message)  # adapt the data loading workers with --auto_workers
     total_iters = 0  # the total number of training iterations
     for epoch in range(opt.epoch_count, opt.n_epochs + opt.n_epochs_decay + 1):
         epoch_start_time = time.time()  # timer for entire epoch
@@ -51,6 +66,7 @@ if __name__ == "__main__":
             iter_start_time = time.time()  # timer for computation per iteration
             if total_iters % opt.print_freq == 0:
                 t_data = iter_start_time - iter_data_time
+            profiler.record("data", iter_start_time - iter_data_time)
 
             total_iters += opt.batch_size
             epoch_iter += opt.batch_size
@@ -59,22 +75,33 @@ if __name__ == "__main__":
 
             if total_iters % opt.display_freq == 0:  # display images on visdom and save images to a HTML file
                 save_result = total_iters % opt.update_html_freq == 0
-                model.compute_visuals()
-                visualizer.display_current_results(model.get_current_visuals(), epoch, total_iters, save_result)
+                with profiler.phase("display"):
+                    model.compute_visuals()
+                    visualizer.display_current_results(model.get_current_visuals(), epoch, total_iters, save_result)
 
             if total_iters % opt.print_freq == 0:  # print training losses and save logging information to the disk
                 losses = model.get_current_losses()
                 t_comp = (time.time() - iter_start_time) / opt.batch_size
                 visualizer.print_current_losses(epoch, epoch_iter, losses, t_comp, t_data)
                 visualizer.plot_current_losses(total_iters, losses)
+                if opt.profile:
+                    stats = profiler.summary()
+                    visualizer.print_current_profile(epoch, epoch_iter, stats)
+                    visualizer.plot_current_profile(total_iters, stats)
 
             if total_iters % opt.save_latest_freq == 0:  # cache our latest model every <save_latest_freq> iterations
                 print(f"saving the latest model (epoch {epoch}, total_iters {total_iters})")
                 save_suffix = f"iter_{total_iters}" if opt.save_by_iter else "latest"
                 model.save_networks(save_suffix)
 
+            tuner.observe(iter_start_time - iter_data_time, time.time() - iter_start_time)
             iter_data_time = time.time()
+            profiler.step()
+            tracer.step()
 
+        if opt.profile_memory and epoch == opt.epoch_count:  # the memory of the first epoch
+            profiler.memory_report(model)
+        tuner.end_epoch()
         model.update_learning_rate()  # update learning rates at the end of every epoch
 
         if epoch % opt.save_epoch_freq == 0:  # cache our model every <save_epoch_freq> epochs
@@ -84,4 +111,6 @@ if __name__ == "__main__":
 
         print(f"End of epoch {epoch} / {opt.n_epochs + opt.n_epochs_decay} \t Time Taken: {time.time() - epoch_start_time:.0f} sec")
 
+    profiler.close()
+    tracer.close()
     cleanup_ddp()
@@ -0,0 +1,170 @@
+"""This module implements 'train.py --auto_batch': the search of the batch size or crop size for a memory budget.
+
+Every tried configuration runs a few trial <optimize_parameters> steps of a fresh model on random images:
+    -- on a GPU, its memory is the peak allocated memory of the steps; running out of memory means it does not fit;
+    -- on the CPU, its memory is estimated with util/memory.py: parameters, gradients, optimizer state, image pools and
+       the peak of the activations (the temporary buffers of the layers are not included).
+The searched value starts from the current one (1 for the batch size) and is doubled until a configuration does not
+fit, then the limit is found by bisection. For the batch size, the configuration with the highest throughput (images/s)
+is chosen, which is often smaller than the largest one that fits; for the crop size, the largest one that fits is chosen.
+With DDP, only rank 0 searches, and its choice is broadcast to the other ranks, so that all of them train alike.
+
+Example:
+    python train.py --dataroot ./datasets/maps --name maps_cyclegan --model cycle_gan --auto_batch --auto_batch_memory 10000
+"""
+
+import copy
+import gc
+import torch
+import torch.distributed as dist
+from models import create_model, networks
+from .benchmark import time_function
+from .memory import MB, ActivationCounter, model_memory, model_networks
+
+
+CROP_MULTIPLES = {"unet_128": 128, "unet_256": 256}  # the U-Nets downsample to 1x1; the other generators by 4
+
+
+def memory_budget(opt):
+    """Return the memory budget (bytes): --auto_batch_memory, or 90% of the free GPU memory / available host memory."""
+    if opt.auto_batch_memory > 0:
+        return opt.auto_batch_memory * MB
+    if torch.device(opt.device).type == "cuda":
+        return 0.9 * torch.cuda.mem_get_info(opt.device)[0]
+    try:
+        with open("/proc/meminfo") as f:
+            available = next(line for line in f if line.startswith("MemAvailable"))
+        return 0.9 * int(available.split()[1]) * 1024
+    except (OSError, StopIteration):
+        raise ValueError("the available memory is unknown on this platform; set --auto_batch_memory") from None
+
+
+def _out_of_memory(error):
+    return isinstance(error, torch.cuda.OutOfMemoryError) or "out of memory" in str(error) or "can't allocate memory" in str(error)
+
+
+def trial(opt, batch_size, crop_size):
+    """Run trial training steps with <batch_size> random images of <crop_size>.
+
+    Return (memory in bytes, images per second), or None if the device ran out of memory.
+    """
+    trial_opt = copy.copy(opt)
+    trial_opt.batch_size, trial_opt.crop_size = batch_size, crop_size
+    device = torch.device(opt.device)
+    memory_format = torch.channels_last if opt.memory_format == "channels_last" else torch.contiguous_format
+    nc_A, nc_B = (opt.input_nc, opt.output_nc) if opt.direction == "AtoB" else (opt.output_nc, opt.input_nc)
+    model = counter = None
+    try:
+        model = create_model(trial_opt)
+        for name in model.model_names:  # <setup> without loading, printing and schedulers
+            net = getattr(model, "net" + name)
+            networks.init_weights(net, opt.init_type, opt.init_gain)
+            net.to(device)
+            if memory_format == torch.channels_last:
+                setattr(model, "net" + name, networks.to_channels_last(net))
+        data = {"A": torch.rand(batch_size, nc_A, crop_size, crop_size) * 2 - 1, "B": torch.rand(batch_size, nc_B, crop_size, crop_size) * 2 - 1, "A_paths": ["A"] * batch_size, "B_paths": ["B"] * batch_size}
+
+        def step():
+            model.set_input(data)
+            model.optimize_parameters()
+
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(device)
+        else:
+            counter = ActivationCounter(p for net in model_networks(model).values() for p in net.parameters())
+            counter.start()
+        times = time_function(step, warmup=1, repeat=opt.auto_batch_steps, device=device)
+        if device.type == "cuda":
+            memory = torch.cuda.max_memory_allocated(device)
+        else:
+            memory = sum(model_memory(model).values()) + counter.peak
+        return memory, batch_size * len(times) / sum(times)
+    except RuntimeError as error:
+        if not _out_of_memory(error):
+            raise
+        return None
+    finally:
+        if counter is not None:
+            counter.stop()
+        del model
+        gc.collect()
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+
+def search(measure, unit, start, limit, budget):
+    """Return the results of every tried value: value -> (memory, throughput) or None (out of memory).
+
+    Parameters:
+        measure (function) -- runs the trial steps of a value; see <trial>
+        unit (int)         -- the tried values are multiples of unit
+        start (int)        -- the first tried value
+        limit (int)        -- the largest tried value
+        budget (float)     -- the memory budget in bytes
+    """
+    results = {}
+
+    def fits(k):
+        value = k * unit
+        if value not in results:
+            results[value] = measure(value)
+            memory, throughput = results[value] or (None, None)
+            status = "out of memory" if memory is None else f"{memory / MB:.0f} MB, {throughput:.2f} images/s" + ("" if memory <= budget else " (over the budget)")
+            print(f"auto_batch: {value:5d} -> {status}")
+        return results[value] is not None and results[value][0] <= budget
+
+    low, high, k = 0, limit // unit + 1, max(start // unit, 1)
+    while k < high:  # double until a value does not fit
+        if not fits(k):
+            high = k
+            break
+        low, k = k, 2 * k
+    while high - low > 1:  # then bisect between the largest value that fits and the smallest one that does not
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return results
+
+
+def find_batch_size(opt):
+    """Search the batch size (or crop size, with --auto_batch_target crop_size) for the memory budget; update opt.
+
+    With DDP, rank 0 searches on its device and the other ranks use its result.
+    """
+    if not dist.is_initialized():
+        chosen = _search(opt)
+    else:
+        result = [None, None]  # (chosen value, error message of rank 0)
+        if dist.get_rank() == 0:
+            try:
+                result[0] = _search(opt)
+            except Exception as e:  # let the other ranks fail too instead of waiting for the broadcast
+                result[1] = f"{type(e).__name__}: {e}"
+        dist.broadcast_object_list(result, src=0)
+        if result[1] is not None:
+            raise RuntimeError(f"auto_batch failed on rank 0: {result[1]}")
+        chosen = result[0]
+    setattr(opt, opt.auto_batch_target, chosen)
+    return chosen
+
+
+def _search(opt):
+    """Return the chosen batch size (or crop size) for the memory budget of this process."""
+    budget = memory_budget(opt)
+    print(f"auto_batch: searching the {opt.auto_batch_target} for a memory budget of {budget / MB:.0f} MB")
+    if opt.auto_batch_target == "batch_size":
+        results = search(lambda b: trial(opt, b, opt.crop_size), 1, 1, opt.auto_batch_max, budget)
+    elif opt.auto_batch_target == "crop_size":
+        results = search(lambda c: trial(opt, opt.batch_size, c), CROP_MULTIPLES.get(opt.netG, 4), opt.crop_size, opt.load_size, budget)
+    else:
+        raise ValueError(f"--auto_batch_target {opt.auto_batch_target} is not recognized [batch_size | crop_size]")
+    fitting = {value: result for value, result in results.items() if result is not None and result[0] <= budget}
+    if not fitting:
+        raise RuntimeError(f"auto_batch: no {opt.auto_batch_target} fits the memory budget of {budget / MB:.0f} MB")
+    largest = max(fitting)
+    fastest = max(fitting, key=lambda value: fitting[value][1])
+    chosen = fastest if opt.auto_batch_target == "batch_size" else largest
+    print(f"auto_batch: the largest {opt.auto_batch_target} that fits is {largest} ({fitting[largest][1]:.2f} images/s), the fastest is {fastest} ({fitting[fastest][1]:.2f} images/s); using {chosen}")
+    return chosen
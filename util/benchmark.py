@@ -0,0 +1,110 @@
+"""This module provides helper functions for the benchmark scripts: timing, result files, and baseline comparison.
+
+A result file is a JSON dict with the environment the benchmark ran in and one entry per measured configuration:
+    {"environment": {...}, "results": {"<key>": {"latency_ms": ..., "p90_ms": ..., "throughput": ..., "config": {...}}}}
+Two result files are compared key by key with <compare_results>: a configuration is a regression when its metric is
+worse than the baseline by more than a relative tolerance.
+"""
+
+import json
+import os
+import platform
+import time
+import numpy as np
+import torch
+
+
+def synchronize(device):
+    """Wait for the pending kernels of a device, so that they are included in the measured time."""
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_function(fn, warmup=2, repeat=10, device="cpu"):
+    """Run fn() <warmup> + <repeat> times and return the durations (seconds) of the last <repeat> runs."""
+    times = []
+    for i in range(warmup + repeat):
+        synchronize(device)
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        if i >= warmup:
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times, items=1):
+    """Return the latency statistics (ms) of a list of durations and the throughput (items per second)."""
+    times = np.asarray(times)
+    median = float(np.median(times))
+    return {"latency_ms": median * 1000, "p90_ms": float(np.percentile(times, 90)) * 1000, "min_ms": float(times.min()) * 1000, "throughput": items / median, "runs": len(times)}
+
+
+def environment_info():
+    """Return the properties of the machine and software that affect the measured speed."""
+    info = {"torch": torch.__version__, "python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count(), "num_threads": torch.get_num_threads()}
+    if torch.cuda.is_available():
+        info["cuda"] = torch.version.cuda
+        info["gpu"] = torch.cuda.get_device_name(0)
+    return info
+
+
+def save_results(path, results):
+    """Save the results of a benchmark with the environment it ran in."""
+    with open(path, "w") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, indent=1)
+    print(f"saved {len(results)} results to {path}")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# metrics where a larger value is better; for the others (latencies, times, memory), smaller is better
+HIGHER_IS_BETTER = {"throughput"}
+
+
+def compare_results(baseline, current, metric="latency_ms", tolerance=0.1):
+    """Compare the results of two benchmark files on one metric.
+
+    Parameters:
+        baseline (dict)   -- a result file loaded with <load_results>
+        current (dict)    -- a result file loaded with <load_results>
+        metric (str)      -- the compared metric, e.g. latency_ms | p90_ms | throughput
+        tolerance (float) -- the relative change accepted before a configuration is flagged
+
+    Returns a list of (key, baseline value, current value, relative change, status), where a positive change is worse
+    and status is one of: regression | improvement | ok | missing (only in the baseline) | new (only in the current results).
+    """
+    rows = []
+    base, cur = baseline["results"], current["results"]
+    for key in sorted(set(base) | set(cur)):
+        if key not in cur:
+            rows.append((key, base[key].get(metric), None, None, "missing"))
+            continue
+        if key not in base:
+            rows.append((key, None, cur[key].get(metric), None, "new"))
+            continue
+        b, c = base[key][metric], cur[key][metric]
+        change = (c - b) / b if b else 0.0
+        if metric in HIGHER_IS_BETTER:
+            change = -change
+        status = "regression" if change > tolerance else "improvement" if change < -tolerance else "ok"
+        rows.append((key, b, c, change, status))
+    return rows
+
+
+def print_comparison(rows, baseline=None, current=None):
+    """Print the table of <compare_results> and warn if the two environments differ; return the number of regressions."""
+    if baseline is not None and current is not None:
+        for k, v in baseline.get("environment", {}).items():
+            if current.get("environment", {}).get(k) != v:
+                print(f"warning: the environments differ in {k}: {v} (baseline) vs {current['environment'].get(k)} (current)")
+    width = max([len(row[0]) for row in rows] + [10])
+    for key, b, c, change, status in rows:
+        values = [f"{v:12.3f}" if v is not None else f"{'-':>12}" for v in (b, c)] + [f"{change:+8.1%}" if change is not None else f"{'':>8}"]
+        print(f"{key:<{width}} {' '.join(values)}  {status}")
+    regressions = sum(row[4] == "regression" for row in rows)
+    print(f"{len(rows)} configurations: {regressions} regressions, {sum(row[4] == 'improvement' for row in rows)} improvements")
+    return regressions
@@ -1,5 +1,6 @@
 import random
 import torch
+from .util import memory_format_of
 
 
 class ImagePool:
@@ -50,5 +51,5 @@ class ImagePool:
                     return_images.append(tmp)
                 else:  # by another 50% chance, the buffer will return the current image
                     return_images.append(image)
-        return_images = torch.cat(return_images, 0)  # collect all the images and return
+        return_images = torch.cat(return_images, 0).contiguous(memory_format=memory_format_of(images))  # collect all the images (in the memory format of the input) and return
         return return_images
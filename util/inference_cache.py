@@ -0,0 +1,133 @@
+"""This module implements a content-addressed cache of test results, so that test.py can skip images it already translated.
+
+Every result is keyed by the hash of its input file(s), the hash of the loaded checkpoints and the options that change the output.
+The keys and the saved visual labels are kept in a manifest '<web_dir>/cache_manifest.json'. It is updated while test.py runs,
+so an interrupted job resumes where it stopped, and a job over a growing folder only translates the new images.
+Sharded runs write one manifest per shard, which are merged into the main manifest once all the shards are done.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from PIL import Image
+
+
+# options that change the results of test.py for the same input and checkpoint
+RESULT_OPTIONS = ["model", "model_suffix", "dataset_mode", "direction", "input_nc", "output_nc", "netG", "ngf", "norm", "no_dropout", "eval", "preprocess", "load_size", "crop_size", "aspect_ratio", "tile_size", "tile_overlap", "quantize", "backend", "infer_dtype"]
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file's content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class InferenceCache:
+    """Keep track of the results saved by test.py and of the inputs, checkpoints and options they were computed with."""
+
+    def __init__(self, web_dir, opt, checkpoint_paths, shard_id=0, num_shards=1, flush_freq=50):
+        """Load the manifest of a result directory
+
+        Parameters:
+            web_dir (str)           -- the result website directory; images are in <web_dir>/images
+            opt (Option class)      -- stores all the experiment flags; needs to be a subclass of TestOptions
+            checkpoint_paths (list) -- the network files loaded by the model
+            shard_id (int)          -- the shard run by this process
+            num_shards (int)        -- the number of shards; each shard writes its own manifest
+            flush_freq (int)        -- write the manifest to the disk every <flush_freq> new results
+        """
+        self.web_dir = Path(web_dir)
+        self.img_dir = self.web_dir / "images"
+        self.flush_freq = flush_freq
+        if num_shards > 1:
+            self.manifest_path = self.web_dir / f"cache_manifest_shard_{shard_id}_of_{num_shards}.json"
+        else:
+            self.manifest_path = self.web_dir / "cache_manifest.json"
+        h = hashlib.sha256()
+        for path in sorted(str(p) for p in checkpoint_paths):
+            h.update(hash_file(path).encode())
+        h.update(json.dumps({k: getattr(opt, k, None) for k in RESULT_OPTIONS}, sort_keys=True, default=str).encode())
+        self.model_key = h.hexdigest()
+        self.entries = self.load_entries(self.web_dir)
+        # path -> [[size, mtime], content hash] of every known input file, to avoid re-hashing unchanged files
+        self.inputs = {p: v for entry in self.entries.values() for p, v in entry.get("inputs", {}).items()}
+        self.num_new = 0
+
+    @staticmethod
+    def load_entries(web_dir):
+        """Read the main manifest and the manifests left by sharded runs."""
+        entries = {}
+        for manifest in [Path(web_dir) / "cache_manifest.json"] + sorted(Path(web_dir).glob("cache_manifest_shard_*.json")):
+            if manifest.exists():
+                with open(manifest) as f:
+                    entries.update(json.load(f))
+        return entries
+
+    @staticmethod
+    def merge_shards(web_dir):
+        """Merge the shard manifests into the main manifest; called after all the shards of a run are done."""
+        web_dir = Path(web_dir)
+        entries = InferenceCache.load_entries(web_dir)
+        InferenceCache._write(web_dir / "cache_manifest.json", entries)
+        for manifest in web_dir.glob("cache_manifest_shard_*.json"):
+            manifest.unlink()
+
+    def key(self, input_paths):
+        """Return the cache key and the input stamps of a data point given its input files.
+
+        The content hash of a file is reused if its size and modification time did not change.
+        """
+        h = hashlib.sha256(self.model_key.encode())
+        inputs = {}
+        for path in input_paths:
+            stat = os.stat(path)
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            known = self.inputs.get(str(path))
+            content = known[1] if known is not None and known[0] == stamp else hash_file(path)
+            inputs[str(path)] = self.inputs[str(path)] = [stamp, content]
+            h.update(content.encode())
+        return h.hexdigest(), inputs
+
+    def _valid(self, image_name):
+        try:
+            with Image.open(self.img_dir / image_name) as im:
+                im.verify()
+            return True
+        except Exception:
+            return False
+
+    def lookup(self, input_paths):
+        """Return the visual labels of a cached data point, or None if it needs to be computed.
+
+        The first input path names the results (see <save_images>).
+        """
+        name = Path(input_paths[0]).stem
+        entry = self.entries.get(name)
+        if entry is None or entry["key"] != self.key(input_paths)[0]:
+            return None
+        if not all(self._valid(f"{name}_{label}.png") for label in entry["labels"]):
+            return None
+        return entry["labels"]
+
+    def add(self, input_paths, labels):
+        """Record the results of a data point once all its images are saved."""
+        key, inputs = self.key(input_paths)
+        self.entries[Path(input_paths[0]).stem] = {"key": key, "labels": list(labels), "inputs": inputs}
+        self.num_new += 1
+        if self.num_new % self.flush_freq == 0:
+            self.save()
+
+    def save(self):
+        """Write the manifest to the disk."""
+        self._write(self.manifest_path, self.entries)
+
+    @staticmethod
+    def _write(path, entries):
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)  # atomic, so an interrupted job never leaves a broken manifest
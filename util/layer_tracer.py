@@ -0,0 +1,201 @@
+"""This module implements a tracer of the time of every layer of the networks of a model ('--trace_layers').
+
+<LayerTracer.instrument> adds hooks to every leaf module (Conv2d, ReflectionPad2d, InstanceNorm2d, ReLU, ...) of every
+network in model_names, without changing the code of the model:
+    -- forward: a pre-hook and a hook around the call of the module;
+    -- backward (train.py): hooks before and after every autograd node created by the module (e.g. the view and norm
+       nodes of InstanceNorm2d), found after its forward pass by walking back from its output to the nodes of the
+       layers before it. The layers that return their input unchanged (e.g. Identity) have no backward.
+The first '--trace_layers_skip' iterations are warm-up and not traced; the next '--trace_layers_iters' iterations are.
+Then the hooks are removed, and:
+    -- a report of the '--trace_layers_top' slowest layers (time per iteration, share of the traced time, cumulative
+       share), followed by the time per layer type and per network, is printed and saved to
+       [checkpoints_dir]/[name]/layer_report.txt;
+    -- a Chrome trace with one event per layer call, one row per network and direction, is saved to
+       [checkpoints_dir]/[name]/layer_trace.json; open it in https://ui.perfetto.dev or chrome://tracing.
+
+On a GPU, the device is synchronized in every hook so that the kernels of a layer are attributed to it; this slows the
+traced iterations down, and hides the overlap of consecutive kernels.
+
+Example:
+    python test.py --dataroot datasets/horse2zebra/testA --name horse2zebra_pretrained --model test --no_dropout --trace_layers
+"""
+
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+import torch
+from .benchmark import synchronize
+
+
+MAX_LAYER_NODES = 32  # autograd nodes of a leaf module; a longer walk left the layer
+
+
+def layer_nodes(output_node, claimed):
+    """Return the autograd nodes created by a layer, walking back from the node of its output.
+
+    Parameters:
+        output_node   -- the autograd node of the output of the layer
+        claimed (set) -- the nodes of the layers that ran before it, and the node of its input; the walk stops there
+    """
+    nodes, stack = [], [output_node]
+    while stack:
+        node = stack.pop()
+        if node in claimed or node in nodes or type(node).__name__ == "AccumulateGrad":
+            continue
+        nodes.append(node)
+        if len(nodes) > MAX_LAYER_NODES:  # e.g. through an input that is not its first argument
+            return [output_node]
+        stack.extend(n for n, _ in node.next_functions if n is not None)
+    return nodes
+
+
+class LayerTracer:
+    """This class measures the forward and backward time of every leaf module of the networks of a model."""
+
+    def __init__(self, opt):
+        """Initialize the LayerTracer class
+
+        Parameters:
+            opt -- train or test options; uses trace_layers, trace_layers_skip, trace_layers_iters and trace_layers_top
+        """
+        self.enabled = opt.trace_layers
+        self.device = opt.device
+        self.skip = opt.trace_layers_skip
+        self.iters = opt.trace_layers_iters
+        self.top = opt.trace_layers_top
+        self.report_path = Path(opt.checkpoints_dir) / opt.name / "layer_report.txt"
+        self.trace_path = Path(opt.checkpoints_dir) / opt.name / "layer_trace.json"
+        self.layers = OrderedDict()  # (network, layer) -> its type, output shape, calls and forward / backward time (s)
+        self.events = []  # Chrome trace events
+        self.rows = OrderedDict()  # (network, direction) -> row (tid) in the Chrome trace
+        self.handles = []
+        self.start = 0.0
+        self.input_node = None  # autograd node of the input of the current layer
+        self.claimed = set()  # autograd nodes of the layers traced in the current iteration
+        self.iteration = 0
+        self.traced = 0  # number of traced iterations
+        self.origin = time.perf_counter()
+
+    @property
+    def tracing(self):
+        return self.enabled and self.iteration >= self.skip
+
+    def instrument(self, model):
+        """Add the forward and backward hooks to every leaf module of the networks of a model."""
+        if not self.enabled:
+            return
+        for name in model.model_names:
+            net = getattr(model, "net" + name)
+            net = net.module if hasattr(net, "module") else net  # DistributedDataParallel
+            if not isinstance(net, torch.nn.Module) or hasattr(net, "_orig_mod"):
+                print(f"[Network {name}] is not traced: only the layers of uncompiled PyTorch networks can be traced")
+                continue
+            for layer, module in net.named_modules():
+                if not list(module.children()):
+                    self.handles.append(module.register_forward_pre_hook(self.before_forward))
+                    self.handles.append(module.register_forward_hook(lambda module, input, output, key=(name, layer): self.after_forward(key, module, input, output)))
+
+    def before_forward(self, module, input):
+        if self.tracing:
+            self.input_node = input[0].grad_fn if input and isinstance(input[0], torch.Tensor) else None
+            synchronize(self.device)
+            self.start = time.perf_counter()
+
+    def after_forward(self, key, module, input, output):
+        if not self.tracing:
+            return
+        synchronize(self.device)
+        end = time.perf_counter()
+        if key not in self.layers:
+            shape = "x".join(str(s) for s in output.shape) if isinstance(output, torch.Tensor) else ""
+            self.layers[key] = {"type": type(module).__name__, "shape": shape, "calls": 0, "forward": 0.0, "backward": 0.0}
+        self.layers[key]["calls"] += 1
+        self.layers[key]["forward"] += end - self.start
+        self.add_event(key, "forward", self.start, end)
+        node = output.grad_fn if isinstance(output, torch.Tensor) else None
+        if node is not None and node is not self.input_node:  # layers like Identity add no autograd node
+            if self.input_node is not None:
+                self.claimed.add(self.input_node)
+            for layer_node in layer_nodes(node, self.claimed):
+                self.claimed.add(layer_node)
+                started = []
+                layer_node.register_prehook(lambda grad_outputs, started=started: started.append(self.now()))
+                layer_node.register_hook(lambda grad_inputs, grad_outputs, started=started: self.after_backward(key, started.pop()))
+
+    def after_backward(self, key, start):
+        end = self.now()
+        self.layers[key]["backward"] += end - start
+        self.add_event(key, "backward", start, end)
+
+    def now(self):
+        synchronize(self.device)
+        return time.perf_counter()
+
+    def add_event(self, key, direction, start, end):
+        network, layer = key
+        tid = self.rows.setdefault((network, direction), len(self.rows))
+        args = {"type": self.layers[key]["type"], "output": self.layers[key]["shape"], "iteration": self.iteration}
+        self.events.append({"name": layer, "cat": direction, "ph": "X", "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "pid": 0, "tid": tid, "args": args})
+
+    def step(self):
+        """End the current iteration; remove the hooks and save the results after the traced iterations."""
+        if not self.enabled:
+            return
+        if self.tracing:
+            self.traced += 1
+        self.iteration += 1
+        self.claimed = set()
+        if self.iters > 0 and self.traced >= self.iters:
+            self.close()
+
+    def close(self):
+        """Remove the hooks, then print and save the report and the Chrome trace of the traced iterations."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        for handle in self.handles:
+            handle.remove()
+        if not self.layers:
+            print(f"no layer was traced: there were {self.iteration} iterations, with {self.skip} iterations of warm-up (--trace_layers_skip)")
+            return
+        report = self.format_report()
+        print(report)
+        with open(self.report_path, "w") as f:
+            f.write(report + "\n")
+        names = [{"ph": "M", "name": "thread_name", "pid": 0, "tid": tid, "args": {"name": f"{network} {direction}"}} for (network, direction), tid in self.rows.items()]
+        with open(self.trace_path, "w") as f:
+            json.dump({"traceEvents": names + self.events, "displayTimeUnit": "ms"}, f)
+        print(f"saved the layer report to {self.report_path} and the Chrome trace to {self.trace_path}")
+
+    def format_report(self):
+        """Return the slowest layers, and the time per layer type and per network, in ms per traced iteration."""
+        iters = max(self.traced, 1)
+        total = sum(layer["forward"] + layer["backward"] for layer in self.layers.values())
+        width = max(len(f"{network}.{layer}") for network, layer in self.layers)
+        lines = [f"---------- layer times over {iters} iterations (ms per iteration) ----------"]
+        lines.append(f"{'layer':<{width}} {'type':<18} {'output':<20} {'calls':>5} {'forward':>9} {'backward':>9} {'total':>9} {'share':>7} {'cumul.':>7}")
+        ranked = sorted(self.layers.items(), key=lambda item: -(item[1]["forward"] + item[1]["backward"]))
+        cumulative = 0.0
+        for (network, layer), stats in ranked[: self.top]:
+            time_ = stats["forward"] + stats["backward"]
+            cumulative += time_
+            lines.append(
+                f"{network + '.' + layer:<{width}} {stats['type']:<18} {stats['shape']:<20} {stats['calls'] // iters:>5} {stats['forward'] * 1000 / iters:9.3f} "
+                f"{stats['backward'] * 1000 / iters:9.3f} {time_ * 1000 / iters:9.3f} {time_ / total:7.1%} {cumulative / total:7.1%}"
+            )
+        for title, group_of in (("layer type", lambda key, stats: stats["type"]), ("network", lambda key, stats: key[0])):
+            groups = OrderedDict()
+            for key, stats in self.layers.items():
+                group = groups.setdefault(group_of(key, stats), {"layers": 0, "forward": 0.0, "backward": 0.0})
+                group["layers"] += 1
+                group["forward"] += stats["forward"]
+                group["backward"] += stats["backward"]
+            lines.append(f"---------- per {title} ----------")
+            lines.append(f"{'':<{width + 39}} {'count':>5} {'forward':>9} {'backward':>9} {'total':>9} {'share':>7}")
+            for group, stats in sorted(groups.items(), key=lambda item: -(item[1]["forward"] + item[1]["backward"])):
+                time_ = stats["forward"] + stats["backward"]
+                lines.append(f"{group:<{width + 39}} {stats['layers']:>5} {stats['forward'] * 1000 / iters:9.3f} {stats['backward'] * 1000 / iters:9.3f} {time_ * 1000 / iters:9.3f} {time_ / total:7.1%}")
+        lines.append(f"total: {total * 1000 / iters:.2f} ms per iteration in {len(self.layers)} layers")
+        return "\n".join(lines)
@@ -0,0 +1,164 @@
+"""This module implements the memory accounting of 'train.py --profile_memory'.
+
+The memory of training is attributed to:
+    -- the parameters and gradients of every network;
+    -- the optimizer state (e.g. the two moving averages of Adam);
+    -- the ImagePool buffers (the fake images kept for the discriminators);
+    -- the activations: the tensors saved by autograd for the backward pass, counted by <ActivationCounter> while they
+       are alive. A tensor saved by several layers is counted once; the weights are not activations.
+After every phase of an iteration (see util/profiler.py), the live activations and their peak since the start of the
+iteration, the memory allocated on the GPU and its peak since the start of the iteration, and the resident memory of
+the process (RSS) are recorded. The report lists the maximum of every value over the iterations, so the phase where a
+peak is reached is the first phase that shows it.
+"""
+
+import os
+from collections import OrderedDict
+import torch
+from .image_pool import ImagePool
+
+
+MB = 1024**2
+
+
+def tensor_bytes(tensors):
+    """Return the total size of an iterable of tensors; None entries are skipped."""
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None)
+
+
+def rss_bytes():
+    """Return the resident memory (RSS) of the process, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+class _SavedTensor:
+    """A tensor saved for backward; it removes itself from its counter when autograd frees it."""
+
+    def __init__(self, counter, tensor):
+        self.counter = counter
+        self.tensor = tensor
+        storage = tensor.untyped_storage()
+        self.key, self.nbytes = storage.data_ptr(), storage.nbytes()
+        counter.add(self.key, self.nbytes)
+
+    def __del__(self):
+        self.counter.remove(self.key, self.nbytes)
+
+
+class ActivationCounter:
+    """Count the size of the tensors saved by autograd for the backward pass while they are alive."""
+
+    def __init__(self, parameters):
+        """Initialize the ActivationCounter class
+
+        Parameters:
+            parameters (iterable) -- the weights of the networks; they are saved by the layers but are not activations
+        """
+        self.weights = {p.untyped_storage().data_ptr() for p in parameters}
+        self.refs = {}  # storage pointer -> number of alive saved tensors that share it
+        self.live = 0
+        self.peak = 0
+        self.hooks = torch.autograd.graph.saved_tensors_hooks(self.pack, self.unpack)
+
+    def pack(self, tensor):
+        if tensor.untyped_storage().data_ptr() in self.weights:
+            return tensor
+        return _SavedTensor(self, tensor)
+
+    def unpack(self, saved):
+        return saved.tensor if isinstance(saved, _SavedTensor) else saved
+
+    def add(self, key, nbytes):
+        if self.refs.get(key, 0) == 0:
+            self.live += nbytes
+            self.peak = max(self.peak, self.live)
+        self.refs[key] = self.refs.get(key, 0) + 1
+
+    def remove(self, key, nbytes):
+        self.refs[key] -= 1
+        if self.refs[key] == 0:
+            del self.refs[key]
+            self.live -= nbytes
+
+    def start(self):
+        """Count the tensors saved from now on, in this thread."""
+        self.hooks.__enter__()
+
+    def stop(self):
+        self.hooks.__exit__(None, None, None)
+
+    def reset_peak(self):
+        self.peak = self.live
+
+
+def model_networks(model):
+    """Return the networks of a model (net<name> attributes), including the ones not in model_names, e.g. a teacher."""
+    return OrderedDict((attr[3:], value) for attr, value in vars(model).items() if attr.startswith("net") and isinstance(value, torch.nn.Module))
+
+
+def model_memory(model):
+    """Return the size of the parameters (per network), gradients, optimizer state and ImagePool buffers of a model."""
+    memory = OrderedDict()
+    seen = set()
+    for name, net in model_networks(model).items():
+        params = [p for p in net.parameters() if id(p) not in seen]
+        seen.update(id(p) for p in params)
+        memory[f"parameters {name}"] = tensor_bytes(params)
+        memory[f"gradients {name}"] = tensor_bytes(p.grad for p in params)
+    memory["optimizer state"] = tensor_bytes(v for optimizer in model.optimizers for state in optimizer.state.values() for v in state.values() if torch.is_tensor(v))
+    memory["image pools"] = tensor_bytes(image for value in vars(model).values() if isinstance(value, ImagePool) and value.pool_size > 0 for image in value.images)
+    return memory
+
+
+def memory_snapshot(device, activations):
+    """Return the current memory: live activations and their peak, GPU allocated memory and its peak, and RSS."""
+    snapshot = {"activations": activations.live, "activations_peak": activations.peak}
+    if torch.device(device).type == "cuda":
+        snapshot["allocated"] = torch.cuda.memory_allocated(device)
+        snapshot["allocated_peak"] = torch.cuda.max_memory_allocated(device)
+    rss = rss_bytes()
+    if rss is not None:
+        snapshot["rss"] = rss
+    return snapshot
+
+
+def reset_peaks(device, activations):
+    """Start measuring the peaks of a new iteration."""
+    activations.reset_peak()
+    if torch.device(device).type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def format_memory_report(phases, model):
+    """Return the report of the memory per phase and of the components of the peak.
+
+    Parameters:
+        phases (OrderedDict) -- phase -> the maximum of every value of <memory_snapshot> after the phase
+        model (BaseModel)    -- the model, for the size of its parameters, gradients, optimizer state and image pools
+    """
+    columns = [key for key in ["activations", "activations_peak", "allocated", "allocated_peak", "rss"] if any(key in values for values in phases.values())]
+    width = max([len(name) for name in phases] + [10])
+    lines = ["---------- Memory per phase (MB) -------------", f"{'after':<{width}} " + " ".join(f"{key:>16}" for key in columns)]
+    for name, values in phases.items():
+        lines.append(f"{name:<{width}} " + " ".join(f"{values[key] / MB:16.1f}" if key in values else f"{'-':>16}" for key in columns))
+    components = model_memory(model)
+    components["activations (peak)"] = max(values.get("activations_peak", 0) for values in phases.values())
+    peak = max((values.get("allocated_peak", 0) for values in phases.values()), default=0)
+    if peak:  # on a GPU: the rest of the peak is the inputs, the temporaries of the layers and the losses
+        components["other (inputs, temporaries)"] = max(peak - sum(components.values()), 0)
+    lines.append("---------- Memory components (MB) ------------")
+    for name, nbytes in components.items():
+        lines.append(f"{name:<32} {nbytes / MB:10.1f}")
+    total = peak or sum(components.values())
+    largest = max(components, key=components.get)
+    lines.append(f"{'total' + (' (GPU peak)' if peak else ''):<32} {total / MB:10.1f}")
+    lines.append(f"the largest component is {largest} ({components[largest] / max(total, 1):.0%} of the total)")
+    rss = max((values.get("rss", 0) for values in phases.values()), default=0)
+    if rss:
+        lines.append(f"{'host RSS (peak after a phase)':<32} {rss / MB:10.1f}")
+    lines.append("-----------------------------------------------")
+    return "\n".join(lines)
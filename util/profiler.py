@@ -0,0 +1,193 @@
+"""This module implements a profiler of the phases of a training iteration.
+
+<PhaseProfiler.instrument> times the parts of a training step without changing the code of the model:
+    -- set_input, forward, compute_visuals, save_networks and every backward_* method without arguments
+       (e.g. backward_G, backward_D_A);
+    -- the forward pass of every network, as forward_<name> (e.g. forward_G_A), with module hooks;
+    -- the step of every optimizer, as step_<name> (e.g. step_G for optimizer_G), with optimizer hooks;
+    -- the query of every ImagePool, as <name>.query (e.g. fake_B_pool.query).
+train.py adds the time waiting for the data loader ('data') and the display of the results ('display'); 'iteration' is
+the time between two iterations. Phases can be nested: a phase includes the phases it calls (e.g. backward_G includes
+forward_D_A). The time of every phase is summed over an iteration, and the rolling statistics (p50 / p95 / max over
+the last '--profile_window' iterations where the phase ran) are saved to loss_log.txt and wandb by the Visualizer.
+
+With '--profile_trace_iter N', a torch.profiler trace of the '--profile_trace_steps' iterations after iteration N is
+saved to [checkpoints_dir]/[name]/profile_trace_iter_N.json, with the phases as labeled ranges; open it in
+https://ui.perfetto.dev or chrome://tracing.
+
+With '--profile_memory', the memory after every phase is recorded as well, and a report that attributes it to the
+activations, parameters, gradients, optimizer state and ImagePool buffers is printed at the end of the first epoch and
+saved to [checkpoints_dir]/[name]/memory_report.txt; see util/memory.py.
+
+On a GPU, the device is synchronized at the boundaries of every phase so that its kernels are attributed to it,
+which slows training down a little.
+
+Example:
+    python train.py --dataroot ./datasets/maps --name maps_cyclegan --model cycle_gan --profile --profile_trace_iter 100
+"""
+
+import functools
+import inspect
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import torch
+from .benchmark import synchronize
+from .image_pool import ImagePool
+from .memory import ActivationCounter, format_memory_report, memory_snapshot, model_networks, reset_peaks
+
+
+MODEL_METHODS = ["set_input", "forward", "compute_visuals", "save_networks"]
+
+
+class PhaseProfiler:
+    """This class measures the time of the phases of every training iteration and keeps their rolling statistics."""
+
+    def __init__(self, opt):
+        """Initialize the PhaseProfiler class
+
+        Parameters:
+            opt -- training options; uses profile, profile_window, profile_memory, profile_trace_iter and profile_trace_steps
+        """
+        self.active = opt.profile or opt.profile_memory or opt.profile_trace_iter > 0
+        self.device = opt.device
+        self.trace_iter = opt.profile_trace_iter
+        self.trace_steps = opt.profile_trace_steps
+        self.trace_path = Path(opt.checkpoints_dir) / opt.name / f"profile_trace_iter_{opt.profile_trace_iter}.json"
+        self.history = OrderedDict()  # phase -> its time (s) in the last <profile_window> iterations where it ran
+        self.window = opt.profile_window
+        self.current = OrderedDict()  # phase -> its time (s) in the current iteration
+        self.running = []  # stack of the started phases: (name, start time, profiler range)
+        self.iteration = 0
+        self.last_step = None
+        self.trace = None
+        self.memory_path = Path(opt.checkpoints_dir) / opt.name / "memory_report.txt"
+        self.memory = OrderedDict() if opt.profile_memory else None  # phase -> the maximum of every value of memory_snapshot after it
+        self.activations = None
+
+    def instrument(self, model):
+        """Time the methods, networks, optimizers and image pools of a model."""
+        if not self.active:
+            return
+        methods = MODEL_METHODS + [name for name in dir(type(model)) if name.startswith("backward")]
+        for name in methods:
+            method = getattr(model, name, None)
+            if method is None or (name not in MODEL_METHODS and inspect.signature(method).parameters):
+                continue  # helpers like backward_D_basic are timed by their callers
+            setattr(model, name, self.timed(name, method))
+        for name in model.model_names:
+            net = getattr(model, "net" + name)
+            net.register_forward_pre_hook(lambda module, input, phase=f"forward_{name}": self.start(phase))
+            net.register_forward_hook(lambda module, input, output: self.stop())
+        for attr, value in list(vars(model).items()):
+            if isinstance(value, torch.optim.Optimizer):
+                phase = "step" + attr[len("optimizer") :] if attr.startswith("optimizer") else f"{attr}.step"
+                value.register_step_pre_hook(lambda optimizer, args, kwargs, phase=phase: self.start(phase))
+                value.register_step_post_hook(lambda optimizer, args, kwargs: self.stop())
+            elif isinstance(value, ImagePool):
+                value.query = self.timed(f"{attr}.query", value.query)
+        if self.memory is not None:
+            self.activations = ActivationCounter(p for net in model_networks(model).values() for p in net.parameters())
+            self.activations.start()
+            reset_peaks(self.device, self.activations)
+
+    def timed(self, name, fn):
+        """Return fn, timed as the phase <name>."""
+
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+
+        return timed_fn
+
+    @contextmanager
+    def phase(self, name):
+        """Time the code of a with-block as the phase <name>."""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def start(self, name):
+        if not self.active:
+            return
+        synchronize(self.device)
+        label = torch.profiler.record_function(name)  # a labeled range in the torch.profiler trace
+        label.__enter__()
+        self.running.append((name, time.perf_counter(), label))
+
+    def stop(self):
+        if not self.running:
+            return
+        synchronize(self.device)
+        name, start, label = self.running.pop()
+        label.__exit__(None, None, None)
+        self.record(name, time.perf_counter() - start)
+        if self.activations is not None:
+            values = self.memory.setdefault(name, {})
+            for key, value in memory_snapshot(self.device, self.activations).items():
+                values[key] = max(values.get(key, 0), value)
+
+    def record(self, name, duration):
+        """Add <duration> (s) to the time of the phase <name> in the current iteration."""
+        if self.active:
+            self.current[name] = self.current.get(name, 0.0) + duration
+
+    def step(self):
+        """End the current iteration; start or stop the torch.profiler trace."""
+        if not self.active:
+            return
+        now = time.perf_counter()
+        if self.last_step is not None:
+            self.current["iteration"] = now - self.last_step
+        self.last_step = now
+        for name, duration in self.current.items():
+            self.history.setdefault(name, deque(maxlen=self.window)).append(duration)
+        self.current = OrderedDict()
+        self.iteration += 1
+        if self.activations is not None:
+            reset_peaks(self.device, self.activations)
+        if self.trace is not None and self.iteration >= self.trace_iter + self.trace_steps:
+            self.close()
+        elif self.trace_iter > 0 and self.iteration == self.trace_iter:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            print(f"capturing a torch.profiler trace of iterations {self.trace_iter + 1} to {self.trace_iter + self.trace_steps}")
+            self.trace = torch.profiler.profile(activities=activities, record_shapes=True)
+            self.trace.start()
+
+    def memory_report(self, model):
+        """Print the memory per phase and its components, and save the report to memory_report.txt."""
+        if not self.memory:
+            return
+        report = format_memory_report(self.memory, model)
+        print(report)
+        with open(self.memory_path, "w") as f:
+            f.write(report + "\n")
+        self.activations.stop()  # the report is made once: stop the saved-tensor hooks and the snapshots
+        self.activations = None
+        self.memory = None
+
+    def close(self):
+        """Stop the torch.profiler trace if it is running, and save it."""
+        if self.trace is None:
+            return
+        self.trace.stop()
+        self.trace.export_chrome_trace(str(self.trace_path))
+        sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+        print(self.trace.key_averages().table(sort_by=sort_by, row_limit=15))
+        print(f"saved the torch.profiler trace to {self.trace_path}")
+        self.trace = None
+
+    def summary(self):
+        """Return the p50 / p95 / max time (ms) of every phase over the window of iterations."""
+        stats = OrderedDict()
+        for name, durations in self.history.items():
+            values = np.asarray(durations) * 1000
+            stats[name] = {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)), "max": float(values.max())}
+        return stats
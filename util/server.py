@@ -0,0 +1,340 @@
+"""This module implements a local HTTP inference server with dynamic batching.
+
+Incoming images are put on a shared request queue. Each worker process pulls requests from the queue
+and groups them into a batch until <max_batch_size> requests are collected or <max_batch_wait> ms have passed
+since the first one arrived. It then runs a single forward pass of the generator for the whole batch.
+The main process answers the HTTP requests and keeps the server metrics (see <ServerMetrics>).
+"""
+
+import io
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing as mp
+import numpy as np
+import torch
+from PIL import Image
+
+
+STAGES = ["queue", "preprocess", "forward", "encode", "total"]
+
+
+class DynamicBatcher:
+    """Collect requests from a queue into batches bounded by size and waiting time."""
+
+    def __init__(self, request_queue, max_batch_size, max_batch_wait):
+        """Initialize the batcher
+
+        Parameters:
+            request_queue (Queue)  -- the queue shared by the server and all the workers; None is the shutdown signal
+            max_batch_size (int)   -- maximum number of requests in a batch
+            max_batch_wait (float) -- maximum time (in seconds) to wait for a batch to fill up after its first request
+        """
+        self.request_queue = request_queue
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_wait = max_batch_wait
+        self.stopped = False
+
+    def next_batch(self):
+        """Block until a batch is ready and return it; return None once the shutdown signal is received."""
+        if self.stopped:
+            return None
+        item = self.request_queue.get()
+        if item is None:
+            self.stopped = True
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.request_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:  # finish the current batch before shutting down
+                self.stopped = True
+                break
+            batch.append(item)
+        return batch
+
+
+class ServerMetrics:
+    """Thread-safe collection of queue depth, batch size histogram and per-stage latencies."""
+
+    def __init__(self, window=1000):
+        """Initialize the metrics
+
+        Parameters:
+            window (int) -- number of most recent requests used to compute the latency percentiles
+        """
+        self.lock = threading.Lock()
+        self.latencies = {stage: deque(maxlen=window) for stage in STAGES}
+        self.batch_sizes = Counter()
+        self.num_requests = 0
+        self.num_errors = 0
+        self.in_flight = 0
+        self.start_time = time.monotonic()
+
+    def request_started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def request_finished(self, stage_times, ok=True):
+        with self.lock:
+            self.in_flight -= 1
+            self.num_requests += 1
+            if not ok:
+                self.num_errors += 1
+            for stage, t in stage_times.items():
+                self.latencies[stage].append(t)
+
+    def batch_done(self, batch_size):
+        with self.lock:
+            self.batch_sizes[batch_size] += 1
+
+    def summary(self, queue_depth=None):
+        """Return all the metrics as a JSON-serializable dict (latencies in ms)."""
+        with self.lock:
+            latency = {}
+            for stage, values in self.latencies.items():
+                if len(values) == 0:
+                    continue
+                v = np.array(values) * 1000.0
+                latency[stage] = {"count": len(v), "mean": float(v.mean()), "p50": float(np.percentile(v, 50)), "p95": float(np.percentile(v, 95)), "p99": float(np.percentile(v, 99)), "max": float(v.max())}
+            return {
+                "uptime": time.monotonic() - self.start_time,
+                "requests": self.num_requests,
+                "errors": self.num_errors,
+                "in_flight": self.in_flight,
+                "queue_depth": self.in_flight if queue_depth is None else queue_depth,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "latency_ms": latency,
+            }
+
+
+def _worker_loop(worker_id, opt, request_queue, result_queue, num_threads):
+    """Inference loop of a worker process.
+
+    The worker builds its own generator registry, then repeatedly takes a batch from the request queue,
+    runs one forward pass per (style, input size) and sends the encoded PNGs back through the result queue.
+    """
+    from models.registry import GeneratorRegistry, load_manifest
+    from data.base_dataset import get_transform
+    from util import util
+
+    torch.set_num_threads(num_threads)
+    styles = load_manifest(opt.styles_manifest) if opt.styles_manifest else None
+    registry = GeneratorRegistry(opt, opt.max_cached_models, opt.model_memory_budget, opt.compile, styles)
+    registry.preload()
+    transforms = {}  # style -> preprocessing transform
+    result_queue.put(("ready", worker_id, None))
+
+    batcher = DynamicBatcher(request_queue, opt.max_batch_size, opt.max_batch_wait / 1000.0)
+    while True:
+        batch = batcher.next_batch()
+        if batch is None:
+            break
+        t_start = time.monotonic()
+        # decode and preprocess every request; only images of the same style and size can share a forward pass
+        groups = {}
+        for request_id, style, payload, t_enqueue in batch:
+            t0 = time.monotonic()
+            try:
+                forward, state, style_opt = registry.get(style)
+            except KeyError as e:
+                result_queue.put(("result", request_id, (404, e.args[0], {"queue": t_start - t_enqueue})))
+                continue
+            except Exception as e:  # e.g. a directory without the checkpoint, or a checkpoint of another architecture
+                result_queue.put(("result", request_id, (500, f"cannot load style [{style}]: {e}", {"queue": t_start - t_enqueue})))
+                continue
+            try:
+                if style not in transforms:
+                    transforms[style] = get_transform(style_opt, grayscale=(style_opt.input_nc == 1))
+                img = Image.open(io.BytesIO(payload)).convert("RGB")
+                tensor = transforms[style](img).to(style_opt.device)
+            except Exception as e:
+                result_queue.put(("result", request_id, (400, f"cannot decode image: {e}", {"queue": t_start - t_enqueue})))
+                continue
+            times = {"queue": t_start - t_enqueue, "preprocess": time.monotonic() - t0}
+            groups.setdefault((style, tuple(tensor.shape)), (forward, state, []))[2].append((request_id, tensor, times, t_enqueue))
+
+        for forward, state, items in groups.values():
+            answered = set()
+            try:
+                t0 = time.monotonic()
+                with torch.no_grad():
+                    fake = forward(state, torch.stack([tensor for _, tensor, _, _ in items]))
+                t_forward = time.monotonic() - t0
+                result_queue.put(("batch", worker_id, len(items)))
+                for i, (request_id, _, times, t_enqueue) in enumerate(items):
+                    t0 = time.monotonic()
+                    buffer = io.BytesIO()
+                    Image.fromarray(util.tensor2im(fake[i : i + 1])).save(buffer, format="PNG")
+                    times["forward"] = t_forward
+                    times["encode"] = time.monotonic() - t0
+                    times["total"] = time.monotonic() - t_enqueue
+                    result_queue.put(("result", request_id, (200, buffer.getvalue(), times)))
+                    answered.add(request_id)
+            except Exception as e:  # fail the requests of this group only; the worker keeps serving
+                for request_id, _, times, _ in items:
+                    if request_id not in answered:
+                        result_queue.put(("result", request_id, (500, f"inference failed: {e}", times)))
+        result_queue.put(("registry", worker_id, registry.stats()))
+
+
+class InferenceServer:
+    """Own the worker processes and route requests and results between them and the HTTP handlers."""
+
+    def __init__(self, opt):
+        """Start the worker processes
+
+        Parameters:
+            opt (Option class) -- stores all the experiment flags; needs to be a subclass of ServeOptions
+        """
+        self.opt = opt
+        self.metrics = ServerMetrics()
+        num_workers = max(1, opt.num_workers)
+        num_threads = opt.threads_per_worker if opt.threads_per_worker > 0 else max(1, (os.cpu_count() or 1) // num_workers)
+        ctx = mp.get_context("spawn")
+        self.request_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.pending = {}  # request id -> [event, result]
+        self.pending_lock = threading.Lock()
+        self.ready_workers = set()
+        self.registry_stats = {}  # worker id -> generator cache statistics
+        self.workers = [ctx.Process(target=_worker_loop, args=(i, opt, self.request_queue, self.result_queue, num_threads), daemon=True) for i in range(num_workers)]
+        for w in self.workers:
+            w.start()
+        print(f"started {num_workers} inference worker(s) with {num_threads} thread(s) each")
+        self.collector = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector.start()
+
+    def _collect_results(self):
+        """Dispatch the messages sent by the workers; runs in a background thread."""
+        while True:
+            kind, key, value = self.result_queue.get()
+            if kind == "ready":
+                self.ready_workers.add(key)
+                print(f"worker {key} is ready")
+            elif kind == "registry":
+                self.registry_stats[key] = value
+            elif kind == "batch":
+                self.metrics.batch_done(value)
+            elif kind == "result":
+                with self.pending_lock:
+                    slot = self.pending.get(key)
+                if slot is not None:
+                    slot[1] = value
+                    slot[0].set()
+
+    def queue_depth(self):
+        """Return the number of requests waiting for a worker (falls back to the in-flight count if unsupported)."""
+        try:
+            return self.request_queue.qsize()
+        except NotImplementedError:  # e.g. macOS
+            return None
+
+    def translate(self, payload, style=None):
+        """Translate an encoded image with a style (default: '--name') and return (HTTP status, PNG bytes or error message)."""
+        if not self.alive_workers():
+            return 503, "no inference worker is running"
+        request_id = uuid.uuid4().hex
+        slot = [threading.Event(), None]
+        with self.pending_lock:
+            self.pending[request_id] = slot
+        self.metrics.request_started()
+        self.request_queue.put((request_id, style or self.opt.name, payload, time.monotonic()))
+        finished = slot[0].wait(self.opt.request_timeout)
+        with self.pending_lock:
+            self.pending.pop(request_id, None)
+        if not finished:
+            self.metrics.request_finished({}, ok=False)
+            return 504, "timed out"
+        status, data, stage_times = slot[1]
+        self.metrics.request_finished(stage_times, ok=status == 200)
+        return status, data
+
+    def alive_workers(self):
+        """Return the ids of the worker processes that are still running."""
+        return [i for i, w in enumerate(self.workers) if w.is_alive()]
+
+    def shutdown(self):
+        """Stop all the workers after they finish their current batch."""
+        for _ in self.workers:
+            self.request_queue.put(None)
+        for w in self.workers:
+            w.join(timeout=10)
+
+
+def make_handler(server):
+    """Return a request handler class bound to an <InferenceServer>.
+
+    Endpoints:
+        POST /translate         -- body is an encoded image (PNG, JPEG, ...); returns the image translated by '--name' as PNG
+        POST /translate/<style> -- same, with the generator of another experiment (see models/registry.py)
+        GET  /metrics           -- queue depth, batch size histogram, per-stage latency percentiles and generator cache statistics as JSON
+        GET  /health            -- number of ready and running workers and the ids of the dead ones; 503 if a worker died
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body, content_type="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                metrics = server.metrics.summary(server.queue_depth())
+                metrics["registry"] = server.registry_stats
+                self._send(200, json.dumps(metrics).encode())
+            elif self.path == "/health":
+                alive = server.alive_workers()
+                dead = [i for i in range(len(server.workers)) if i not in alive]
+                health = {"ready_workers": len(server.ready_workers & set(alive)), "alive_workers": len(alive), "dead_workers": dead, "workers": len(server.workers)}
+                self._send(503 if dead else 200, json.dumps(health).encode())
+            else:
+                self._send(404, b'{"error": "not found"}')
+
+        def do_POST(self):
+            parts = self.path.strip("/").split("/")
+            if parts[0] != "translate" or len(parts) > 2:
+                self._send(404, b'{"error": "not found"}')
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            if length == 0:
+                self._send(400, b'{"error": "empty request body"}')
+                return
+            status, data = server.translate(self.rfile.read(length), parts[1] if len(parts) == 2 else None)
+            if status == 200:
+                self._send(200, data, content_type="image/png")
+            else:
+                self._send(status, json.dumps({"error": data}).encode())
+
+        def log_message(self, format, *args):  # keep the console quiet; use /metrics instead
+            pass
+
+    return Handler
+
+
+def serve(opt):
+    """Start the workers and serve HTTP requests until interrupted."""
+    server = InferenceServer(opt)
+    httpd = ThreadingHTTPServer((opt.host, opt.port), make_handler(server))
+    httpd.daemon_threads = True
+    print(f"serving [{opt.name}] on http://{opt.host}:{opt.port} (POST /translate, GET /metrics, GET /health)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server.shutdown()
@@ -0,0 +1,99 @@
+"""This module implements tiled inference, so that test.py can translate images far larger than the generator fits in memory.
+
+The image is cut into overlapping tiles of '--tile_size' pixels that are translated in batches of '--tile_batch_size'.
+The outputs are blended with a feathered window: inside the '--tile_overlap' border of a tile the weight ramps down
+linearly, so overlapping tiles cross-fade instead of leaving visible seams.
+
+Tiles are processed one row of tiles at a time. Only the rows still covered by the next row of tiles are kept in
+float accumulators; the finished rows are written to the 8-bit result right away. The generator's memory is bounded by
+the tile batch, and the blending buffers by one row of tiles, whatever the size of the image.
+
+Example:
+    >>> from util.tiling import translate_tiled
+    >>> result = translate_tiled(model.netG, Image.open(path).convert('RGB'), tile_size=512, overlap=64, batch_size=4, device=model.device)
+"""
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+
+def tile_starts(length, tile_size, overlap):
+    """Return the offsets of the tiles covering [0, length); the last tile is aligned with the end of the image."""
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    return starts + [length - tile_size]
+
+
+def blend_window(tile_size, overlap):
+    """Return the (tile_size, tile_size) blending weights of a tile: 1 in the center, ramping down linearly over <overlap> pixels at each border."""
+    ramp = np.ones(tile_size, dtype=np.float32)
+    if overlap > 0:
+        edge = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap  # never 0, so that image borders keep a valid weight
+        ramp[:overlap] = edge
+        ramp[-overlap:] = np.minimum(ramp[-overlap:], edge[::-1])
+    return np.outer(ramp, ramp)
+
+
+def _load_tile(image, x, y, tile_size):
+    """Crop a tile from a PIL image and normalize it to [-1, 1]; tiles of images smaller than <tile_size> are padded by replication."""
+    tile = np.asarray(image.crop((x, y, min(x + tile_size, image.width), min(y + tile_size, image.height))), dtype=np.float32)
+    if tile.ndim == 2:
+        tile = tile[:, :, None]
+    tile = torch.from_numpy(tile).permute(2, 0, 1) / 127.5 - 1.0
+    pad_w, pad_h = tile_size - tile.shape[2], tile_size - tile.shape[1]
+    if pad_w > 0 or pad_h > 0:
+        tile = F.pad(tile[None], (0, pad_w, 0, pad_h), mode="replicate")[0]
+    return tile
+
+
+def translate_tiled(net, image, tile_size=512, overlap=32, batch_size=4, device="cpu"):
+    """Translate a PIL image tile by tile and return the result as a uint8 numpy array (H x W x output channels).
+
+    Parameters:
+        net (nn.Module)   -- the generator; <tile_size> must be a valid input size for it (a multiple of 4 for resnet, 2^num_downs for unet)
+        image (PIL image) -- the input image, in the mode the generator expects ('RGB' or 'L')
+        tile_size (int)   -- the side of the square tiles fed to the generator
+        overlap (int)     -- the number of pixels shared by neighbouring tiles, blended with a linear ramp
+        batch_size (int)  -- the number of tiles per forward pass
+        device            -- the device the generator runs on
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"tile overlap ({overlap}) must be smaller than the tile size ({tile_size})")
+    width, height = image.size
+    xs, ys = tile_starts(width, tile_size, overlap), tile_starts(height, tile_size, overlap)
+    acc_width = max(width, tile_size)
+    window = blend_window(tile_size, overlap)
+    result = None
+    acc = weight = None  # blending buffers of the rows [y, y + tile_size) of the current row of tiles
+    for r, y in enumerate(ys):
+        for b in range(0, len(xs), batch_size):
+            batch_xs = xs[b : b + batch_size]
+            batch = torch.stack([_load_tile(image, x, y, tile_size) for x in batch_xs]).to(device)
+            with torch.no_grad():
+                out = net(batch).float().cpu().numpy()
+            if result is None:
+                result = np.empty((height, width, out.shape[1]), dtype=np.uint8)
+                acc = np.zeros((out.shape[1], tile_size, acc_width), dtype=np.float32)
+                weight = np.zeros((tile_size, acc_width), dtype=np.float32)
+            for x, tile in zip(batch_xs, out):
+                acc[:, :, x : x + tile_size] += tile * window
+                weight[:, x : x + tile_size] += window
+        # rows above the next row of tiles are final: write them out and shift the buffers
+        done = (ys[r + 1] if r + 1 < len(ys) else y + tile_size) - y
+        rows = min(done, height - y)
+        blended = acc[:, :rows, :width] / weight[None, :rows, :width]
+        result[y : y + rows] = ((np.transpose(blended, (1, 2, 0)) + 1) / 2.0 * 255.0).clip(0, 255).astype(np.uint8)
+        acc[:, : tile_size - done] = acc[:, done:]
+        acc[:, tile_size - done :] = 0
+        weight[: tile_size - done] = weight[done:]
+        weight[tile_size - done :] = 0
+    return result
+
+
+def save_tiled_result(result, image_path):
+    """Save a result of <translate_tiled> as an image."""
+    Image.fromarray(result[:, :, 0] if result.shape[2] == 1 else result).save(image_path)
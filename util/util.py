@@ -7,29 +7,39 @@ from PIL import Image
 from pathlib import Path
 import torch.distributed as dist
 import os
+import random
 
 
-def tensor2im(input_image, imtype=np.uint8):
+def tensor2im(input_image, imtype=np.uint8, index=0):
     """ "Converts a Tensor array into a numpy image array.
 
     Parameters:
         input_image (tensor) --  the input image tensor array
         imtype (type)        --  the desired type of the converted numpy array
+        index (int)          --  which image of the batch to convert
     """
     if not isinstance(input_image, np.ndarray):
         if isinstance(input_image, torch.Tensor):  # get the data from a variable
             image_tensor = input_image.data
         else:
             return input_image
-        image_numpy = image_tensor[0].cpu().float().numpy()  # convert it into a numpy array
+        image_numpy = image_tensor[index].cpu().float().numpy()  # convert it into a numpy array
         if image_numpy.shape[0] == 1:  # grayscale to RGB
             image_numpy = np.tile(image_numpy, (3, 1, 1))
         image_numpy = (np.transpose(image_numpy, (1, 2, 0)) + 1) / 2.0 * 255.0  # post-processing: tranpose and scaling
+        image_numpy = np.clip(image_numpy, 0, 255)  # reduced-precision outputs may overshoot [-1, 1] slightly
+    elif input_image.ndim == 4:  # a batch of numpy images
+        image_numpy = input_image[index]
     else:  # if it is a numpy array, do nothing
         image_numpy = input_image
     return image_numpy.astype(imtype)
 
 
+def memory_format_of(tensor):
+    """Return torch.channels_last if a 4D tensor is stored in channels_last order, otherwise torch.contiguous_format."""
+    return torch.channels_last if tensor.dim() == 4 and tensor.is_contiguous(memory_format=torch.channels_last) else torch.contiguous_format
+
+
 def diagnose_network(net, name="network"):
     """Calculate and print the mean of average absolute(gradients)
 
@@ -49,6 +59,13 @@ def diagnose_network(net, name="network"):
     print(mean)
 
 
+def set_seed(seed):
+    """Seed the random number generators of python, numpy and torch, so that two runs with the same options match"""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
 # initialize ddp
 def init_ddp():
     # Initialize DDP if LOCAL_RANK is set
@@ -1,3 +1,4 @@
+import json
 import numpy as np
 import sys
 import ntpath
@@ -6,35 +7,95 @@ from . import util, html
 from pathlib import Path
 import wandb
 import os
+import torch
 import torch.distributed as dist
 
 
-def save_images(webpage, visuals, image_path, aspect_ratio=1.0, width=256):
+def save_images(webpage, visuals, image_path, aspect_ratio=1.0, width=256, executor=None):
     """Save images to the disk.
 
     Parameters:
         webpage (the HTML class) -- the HTML webpage class that stores these imaegs (see html.py for more details)
         visuals (OrderedDict)    -- an ordered dictionary that stores (name, images (either tensor or numpy) ) pairs
-        image_path (str)         -- the string is used to create image paths
+        image_path (str list)    -- the paths of the images in the batch; used to create image paths
         aspect_ratio (float)     -- the aspect ratio of saved images
         width (int)              -- the images will be resized to width x width
+        executor (Executor)      -- if given, images are converted and encoded in the background by this executor
 
     This function will save images stored in 'visuals' to the HTML file specified by 'webpage'.
+    One row is added for each of the first len(image_path) images of the batch.
+    It returns the list of futures of the background jobs (empty without an executor).
     """
     image_dir = webpage.get_image_dir()
-    name = Path(image_path[0]).stem
+    if isinstance(image_path, (str, Path)):
+        image_path = [image_path]
+    # copy the batch to the CPU once; the model will overwrite its visuals with the next batch
+    visuals = {label: im_data.detach().cpu() if isinstance(im_data, torch.Tensor) else im_data for label, im_data in visuals.items()}
+    futures = []
+    for index, path in enumerate(image_path):
+        name = Path(path).stem
+        webpage.add_header(name)
+        ims, txts, links = [], [], []
+        for label, im_data in visuals.items():
+            image_name = f"{name}_{label}.png"
+            save_path = image_dir / image_name
+            if executor is None:
+                _save_visual(im_data, index, save_path, aspect_ratio)
+            else:
+                futures.append(executor.submit(_save_visual, im_data, index, save_path, aspect_ratio))
+            ims.append(image_name)
+            txts.append(label)
+            links.append(image_name)
+        webpage.add_images(ims, txts, links, width=width)
+    return futures
+
+
+def _save_visual(im_data, index, save_path, aspect_ratio):
+    """Convert the <index>-th image of a batch and save it to the disk."""
+    im = util.tensor2im(im_data, index=index)
+    util.save_image(im, save_path, aspect_ratio=aspect_ratio)
+
+
+def save_webpage(web_dir, title, records, width=256):
+    """Save an HTML with one row per result.
 
-    webpage.add_header(name)
-    ims, txts, links = [], [], []
-    for label, im_data in visuals.items():
-        im = util.tensor2im(im_data)
-        image_name = f"{name}_{label}.png"
-        save_path = image_dir / image_name
-        util.save_image(im, save_path, aspect_ratio=aspect_ratio)
-        ims.append(image_name)
-        txts.append(label)
-        links.append(image_name)
-    webpage.add_images(ims, txts, links, width=width)
+    Parameters:
+        web_dir (str)  -- the website directory; images are in <web_dir>/images
+        title (str)    -- the webpage name
+        records (list) -- one dict per result with its index in the dataset, its name and its visual labels
+        width (int)    -- the images will be resized to width x width
+
+    The rows are added in dataset order.
+    """
+    webpage = html.HTML(web_dir, title)
+    for record in sorted(records, key=lambda r: r["index"]):
+        name = record["name"]
+        ims = [f"{name}_{label}.png" for label in record["labels"]]
+        webpage.add_header(name)
+        webpage.add_images(ims, record["labels"], ims, width=width)
+    webpage.save()
+
+
+def merge_shard_results(web_dir, title, num_shards, width=256):
+    """Build a single HTML from the results of sharded test processes.
+
+    Parameters:
+        web_dir (str)    -- the website directory shared by all the shards
+        title (str)      -- the webpage name
+        num_shards (int) -- the number of shards; shard k saved its records to <web_dir>/shard_k_of_<num_shards>.json
+        width (int)      -- the images will be resized to width x width
+
+    The result is the same as with a single process.
+    """
+    web_dir = Path(web_dir)
+    records = []
+    for k in range(num_shards):
+        shard_file = web_dir / f"shard_{k}_of_{num_shards}.json"
+        with open(shard_file) as f:
+            records += json.load(f)
+        shard_file.unlink()
+    save_webpage(web_dir, title, records, width=width)
+    print(f"merged the results of {num_shards} shards ({len(records)} images) into {web_dir / 'index.html'}")
 
 
 class Visualizer:
@@ -166,3 +227,46 @@ class Visualizer:
         if local_rank == 0:
             with open(self.log_name, "a") as log_file:
                 log_file.write(f"{message}\n")  # save the message
+
+    def log_message(self, message):
+        """print a message on console; also save it to the disk
+
+        Parameters:
+            message (str) -- e.g. a decision of the loader tuning of --auto_workers
+        """
+        print(message)
+        if int(os.environ.get("LOCAL_RANK", 0)) == 0:
+            with open(self.log_name, "a") as log_file:
+                log_file.write(f"{message}\n")
+
+    def print_current_profile(self, epoch, iters, stats):
+        """print the rolling statistics of the phases of the training iterations; also save them to the disk
+
+        Parameters:
+            epoch (int) -- current epoch
+            iters (int) -- current training iteration during this epoch (reset to 0 at the end of every epoch)
+            stats (OrderedDict) -- the p50 / p95 / max time (ms) of every phase, from PhaseProfiler.summary (see util/profiler.py)
+        """
+        local_rank = int(os.environ.get("LOCAL_RANK", 0))
+        message = f"[Rank {local_rank}] (epoch: {epoch}, iters: {iters}) phases in ms (p50/p95/max)"
+        for name, s in stats.items():
+            message += f", {name}: {s['p50']:.1f}/{s['p95']:.1f}/{s['max']:.1f}"
+        message += "\n"
+        print(message)
+
+        if local_rank == 0:
+            with open(self.log_name, "a") as log_file:
+                log_file.write(f"{message}\n")
+
+    def plot_current_profile(self, total_iters, stats):
+        """Log the rolling statistics of the phases of the training iterations to wandb
+
+        Parameters:
+            total_iters (int)    -- current training iteration
+            stats (OrderedDict)  -- the p50 / p95 / max time (ms) of every phase, from PhaseProfiler.summary
+        """
+        if dist.is_initialized() and dist.get_rank() != 0:
+            return
+
+        if self.use_wandb:
+            self.wandb_run.log({f"profile/{name}_{k}_ms": v for name, s in stats.items() for k, v in s.items()}, step=total_iters)